@@ -0,0 +1,69 @@
+"""
+Throughput benchmark of the asynchronous analyzers against a local stub of the chat completions endpoint.
+
+A synthetic repo is traversed, then summarized and commented with the sequential analyze_repo and sectioned_comment,
+and with analyze_and_comment_async at several in-flight limits. Every run has to write the same .analyze.md and
+.comments.json files; the wall time and requests per second of each run are reported.
+
+    python -m benchmarks.bench_async_analyzers [--files 10] [--latency 0.05]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.stub_llm_server import StubLLMServer
+from benchmarks.stub_workspace import read_outputs, stub_environment
+from benchmarks.synthetic import synthetic_python_source
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=10, help="Number of python files of the synthetic repo")
+    parser.add_argument("--latency", type=float, default=0.05, help="Latency of the stub endpoint, in seconds")
+    parser.add_argument("--in-flight", type=int, nargs="+", default=[4, 16, 64], help="In-flight limits to run")
+    args = parser.parse_args()
+
+    # the copies of a section take the remark of the one requested first, which depends on the order of the files
+    with tempfile.TemporaryDirectory() as tmp_dir, StubLLMServer(args.latency) as server, stub_environment(
+            tmp_dir, server.base_url, section_dedup=False):
+        repo_path = os.path.join(tmp_dir, "repos", "bench_repo")
+        from llm_project_helper import RepoTraverser
+        from llm_project_helper.logs import define_log_level
+        define_log_level(print_level="WARNING", logfile_level="WARNING")
+
+        os.makedirs(repo_path)
+        for i in range(args.files):
+            with open(os.path.join(repo_path, f"module_{i}.py"), 'w') as f:
+                f.write(synthetic_python_source(classes=1, methods_per_class=6, functions=2))
+        traverser = RepoTraverser(repo_path)
+        analyze_folder = traverser.traverse_repo()
+
+        server.requests = 0
+        start = time.perf_counter()
+        traverser.analyze_repo(analyze_folder, True)
+        traverser.sectioned_comment(analyze_folder, True)
+        sequential = time.perf_counter() - start
+        expected = read_outputs(analyze_folder)
+        requests = server.requests
+        print(f"{requests} requests, stub latency {args.latency * 1000:.0f} ms")
+        print(f"    sequential          {sequential:7.2f} s  {requests / sequential:7.1f} requests/s")
+
+        mismatches = 0
+        for max_in_flight in args.in_flight:
+            server.requests = 0
+            start = time.perf_counter()
+            asyncio.run(traverser.analyze_and_comment_async(analyze_folder, True, True, max_in_flight=max_in_flight))
+            elapsed = time.perf_counter() - start
+            same = read_outputs(analyze_folder) == expected and server.requests == requests
+            mismatches += not same
+            print(f"    async, in flight {max_in_flight:<3}{elapsed:7.2f} s  {server.requests / elapsed:7.1f} requests/s"
+                  f"  speedup {sequential / elapsed:5.1f}x{'' if same else '  OUTPUTS DIFFER'}")
+    if mismatches:
+        sys.exit(f"{mismatches} async run(s) wrote different outputs")
+
+
+if __name__ == '__main__':
+    main()
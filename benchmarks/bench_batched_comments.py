@@ -0,0 +1,87 @@
+"""
+Requests and prompt tokens of sectioned_comment with one request per section versus batched requests, against a local
+stub of the chat completions endpoint that answers the batched prompts with a JSON object keyed by line_no.
+
+The files of the synthetic repo have many small methods, the case where the summary resent in every prompt costs the
+most: the one-line summaries of the stub are replaced with summaries of --summary-chars characters. Every run has to
+write a remark for every section; the last run leaves a section out of every batched reply, to exercise the retries.
+
+    python -m benchmarks.bench_batched_comments [--files 5] [--budgets 1000 4000]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+from benchmarks.stub_llm_server import StubLLMServer
+from benchmarks.stub_workspace import stub_environment
+from benchmarks.synthetic import synthetic_python_source
+
+
+def read_comments(workspace):
+    comments = {}
+    for root, _, files in os.walk(workspace):
+        for file in files:
+            if file.endswith('.comments.json'):
+                with open(os.path.join(root, file), 'r', encoding='utf-8') as f:
+                    comments[file] = json.load(f)["comments"]
+    return comments
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=5, help="Number of python files of the synthetic repo")
+    parser.add_argument("--budgets", type=int, nargs="+", default=[1000, 4000], help="comment_batch_tokens to run")
+    parser.add_argument("--summary-chars", type=int, default=3000, help="Length of the summary of every file")
+    parser.add_argument("--drop-every", type=int, default=3,
+                        help="In the last run, leave every k-th section out of the batched replies")
+    args = parser.parse_args()
+
+    # the copies of a section take the remark of the one requested first, which depends on the order of the files
+    with tempfile.TemporaryDirectory() as tmp_dir, StubLLMServer(0.0) as server, stub_environment(
+            tmp_dir, server.base_url, section_dedup=False):
+        repo_path = os.path.join(tmp_dir, "repos", "bench_repo")
+        from llm_project_helper import RepoTraverser
+        from llm_project_helper.logs import define_log_level
+        define_log_level(print_level="WARNING", logfile_level="WARNING")
+
+        os.makedirs(repo_path)
+        for i in range(args.files):
+            with open(os.path.join(repo_path, f"module_{i}.py"), 'w') as f:
+                f.write(synthetic_python_source(classes=2, methods_per_class=20, functions=10))
+        traverser = RepoTraverser(repo_path)
+        analyze_folder = traverser.traverse_repo()
+        traverser.analyze_repo(analyze_folder, True)
+        for root, _, files in os.walk(analyze_folder):
+            for file in files:
+                if file.endswith('.analyze.md'):
+                    with open(os.path.join(root, file), 'w', encoding='utf-8') as f:
+                        summary = "这个文件定义了若干数据处理类和辅助函数。" * args.summary_chars
+                        f.write("## 综述\n" + summary[:args.summary_chars])
+
+        runs = [(0, 0)] + [(budget, 0) for budget in args.budgets] + [(args.budgets[-1], args.drop_every)]
+        baseline = None
+        failures = []
+        for budget, drop_every in runs:
+            server.requests = 0
+            server.prompt_tokens = 0
+            server.drop_every = drop_every
+            traverser.sectioned_comment(analyze_folder, True, comment_batch_tokens=budget)
+            comments = read_comments(analyze_folder)
+            if baseline is None:
+                baseline = (server.requests, server.prompt_tokens)
+            name = f"batch {budget} tokens" if budget else "one request per section"
+            if drop_every:
+                name += f", drop 1/{drop_every}"
+            print(f"    {name:<32} {server.requests:5} requests  {server.prompt_tokens:8} prompt tokens"
+                  f"  ({baseline[0] / server.requests:4.1f}x fewer requests,"
+                  f" {baseline[1] / server.prompt_tokens:4.1f}x fewer tokens)")
+            if any(not comment["remark"] for file_comments in comments.values() for comment in file_comments):
+                failures.append(f"{name}: sections without remark")
+    if failures:
+        sys.exit("\n".join(failures))
+
+
+if __name__ == '__main__':
+    main()
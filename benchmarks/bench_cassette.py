@@ -0,0 +1,111 @@
+"""
+Record and replay of the LLM exchanges of main.py: a run against the local stub of the chat completions endpoint
+records its cassette, then the stub is stopped and the run is replayed from the cassette, with the original latencies
+and with zero latency, each from an empty workspace. The replays have to write the same outputs as the recorded run,
+without a single network request, and the replay with the original latencies has to take about as long as the
+recording. The streamed predict_sse of ZhipuAIAPI and AsyncZhipuAIAPI is recorded and replayed too.
+
+    python -m benchmarks.bench_cassette [--files 6] [--latency 0.05] [--max-in-flight 4]
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.stub_llm_server import StubLLMServer
+from benchmarks.stub_workspace import read_outputs, stub_env, stub_environment
+from benchmarks.synthetic import synthetic_python_source
+
+MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+
+
+def check_predict_sse(tmp_dir, server):
+    from llm_project_helper.logs import define_log_level
+    from llm_project_helper.provider import AsyncZhipuAIAPI, ZhipuAIAPI
+    from llm_project_helper.provider.cassette import RECORD, REPLAY, use_cassette
+    define_log_level(print_level="WARNING", logfile_level="WARNING")
+
+    async def async_stream(prompt):
+        async with AsyncZhipuAIAPI() as api:
+            return [partial async for partial in api.predict_sse(prompt)]
+
+    def streams():
+        return list(ZhipuAIAPI().predict_sse("sync stream " * 20)), asyncio.run(async_stream("async stream " * 20))
+
+    path = os.path.join(tmp_dir, "sse.cassette.jsonl")
+    use_cassette(path, RECORD)
+    recorded = streams()
+    requests = server.requests
+    use_cassette(path, REPLAY, "zero")
+    replayed = streams()
+    use_cassette(path, REPLAY)
+    failures = []
+    if replayed != recorded or streams() != recorded:
+        failures.append("predict_sse: the replayed streams differ from the recorded ones")
+    if server.requests != requests:
+        failures.append("predict_sse: the replays sent requests")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=6, help="Number of python files of the synthetic repo")
+    parser.add_argument("--latency", type=float, default=0.05, help="Mean latency of the stub endpoint, in seconds")
+    parser.add_argument("--max-in-flight", type=int, default=4, help="--max-in-flight of main.py")
+    args = parser.parse_args()
+
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        repo_path = os.path.join(tmp_dir, "repos", "bench_repo")
+        os.makedirs(repo_path)
+        for i in range(args.files):
+            with open(os.path.join(repo_path, f"module_{i}.py"), 'w') as f:
+                f.write(synthetic_python_source(classes=2, methods_per_class=6, functions=4).replace(
+                    "Synthetic", f"Module{i}Synthetic"))
+        cassette = os.path.join(tmp_dir, "bench.cassette.jsonl")
+        workspace = os.path.join(tmp_dir, "root", "workspaces", "bench_repo")
+        command = [sys.executable, MAIN, "--repo-path", repo_path, "--max-in-flight", str(args.max_in_flight)]
+
+        def run(base_url, *options):
+            if os.path.isdir(workspace):
+                shutil.rmtree(workspace)
+            # the copies of a section take the remark of the one requested first, which depends on the order the
+            # concurrent files get their answers in: the replay would request other copies
+            env = dict(os.environ, **stub_env(tmp_dir, base_url, section_dedup=False), PYTHONPATH=os.path.dirname(MAIN))
+            start = time.time()
+            returncode = subprocess.run(command + list(options), env=env, cwd=tmp_dir, stdout=subprocess.DEVNULL,
+                                        stderr=subprocess.DEVNULL).returncode
+            elapsed = time.time() - start
+            if returncode != 0:
+                failures.append(f"main.py {' '.join(options)} failed with exit code {returncode}")
+            return elapsed, read_outputs(workspace)
+
+        with StubLLMServer(args.latency, latency_distribution="lognormal", tokens_per_second=400) as server:
+            record_time, expected = run(server.base_url, "--record-cassette", cassette)
+            requests = server.requests
+            base_url = server.base_url
+            # the providers read the environment when llm_project_helper is imported, and the cassette when they are
+            # created
+            with stub_environment(tmp_dir, server.base_url):
+                failures += check_predict_sse(tmp_dir, server)
+        # the stub is gone: the replays cannot reach any endpoint
+        with open(cassette, 'r', encoding='utf-8') as f:
+            exchanges = sum(1 for _ in f)
+        print(f"{args.files} files, max in flight {args.max_in_flight}, {requests} requests, cassette of {exchanges}"
+              f" exchanges, {os.path.getsize(cassette) / 1024:.0f} KiB")
+        print(f"    recorded run             {record_time:7.2f} s")
+        for latency in ("original", "zero"):
+            elapsed, outputs = run(base_url, "--replay-cassette", cassette, "--replay-latency", latency)
+            print(f"    replay, {latency:<8} latency {elapsed:7.2f} s")
+            if outputs != expected:
+                failures.append(f"the replay with {latency} latency wrote different outputs")
+    if failures:
+        sys.exit("\n".join(failures))
+
+
+if __name__ == '__main__':
+    main()
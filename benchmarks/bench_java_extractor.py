@@ -0,0 +1,51 @@
+"""
+Throughput benchmark of the scoped java extractor.
+
+Parses a multi-thousand-line synthetic java file (with inner and anonymous classes) and the given files, and reports
+lines, classes and methods extracted per second and the size of the structure json.
+
+    python -m benchmarks.bench_java_extractor [File.java ...]
+"""
+import argparse
+import json
+import os
+import time
+
+from llm_project_helper.const import Language
+from llm_project_helper.logs import define_log_level
+from llm_project_helper.treesitter import Treesitter
+from benchmarks.synthetic import synthetic_java_source
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("files", nargs="*", help="Additional java files to time")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timed parses per file")
+    args = parser.parse_args()
+    define_log_level(print_level="WARNING", logfile_level="WARNING")
+
+    cases = [("synthetic", synthetic_java_source(classes=25, methods_per_class=60, inner_classes=3))]
+    for file_path in args.files:
+        with open(file_path, 'r') as f:
+            cases.append((os.path.basename(file_path), f.read()))
+
+    treesitter_parser = Treesitter.create_treesitter(Language.JAVA)
+    for name, code in cases:
+        file_bytes = code.encode()
+        result = treesitter_parser.parse(file_bytes)
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            result = treesitter_parser.parse(file_bytes)
+        elapsed = (time.perf_counter() - start) / args.repeat
+
+        lines = code.count("\n") + 1
+        classes = len(result.classes) + len(result.interfaces)
+        methods = sum(len(c.methods) + len(c.constructors) for c in result.classes.values()) \
+            + sum(len(i.methods) for i in result.interfaces.values())
+        json_bytes = len(json.dumps(result.model_dump(), indent=4, default=str))
+        print(f"{name:<24} {lines:>6} lines  {elapsed * 1000:8.1f} ms  {lines / elapsed:>9.0f} lines/s  "
+              f"{classes:>4} types  {methods / elapsed:>8.0f} methods/s  json: {json_bytes} bytes")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Requests lost when main.py is killed halfway through the comments and started again with the same arguments, with the
+job state store of the workspace, against a local stub of the chat completions endpoint with the response cache off.
+
+A clean run gives the requests and outputs of a whole run. The next run is killed (SIGKILL) once it sent half of them,
+and started again: it has to resume, i.e. send only the requests the killed run did not get an answer for, and write
+the same .analyze.md and .comments.json files as the clean run. Both runs use --force-re-analyze and
+--force-re-comment, which the resumed run must not restart from scratch.
+
+    python -m benchmarks.bench_job_resume [--files 6] [--latency 0.01] [--max-in-flight 1] [--pipeline]
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.stub_llm_server import StubLLMServer
+from benchmarks.stub_workspace import read_outputs, stub_env
+from benchmarks.synthetic import synthetic_python_source
+
+MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=6, help="Number of python files of the synthetic repo")
+    parser.add_argument("--latency", type=float, default=0.01, help="Latency of the stub endpoint, in seconds")
+    parser.add_argument("--max-in-flight", type=int, default=1, help="--max-in-flight of main.py")
+    parser.add_argument("--pipeline", action="store_true", help="Run main.py with --pipeline")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir, StubLLMServer(args.latency) as server:
+        repo_path = os.path.join(tmp_dir, "repos", "bench_repo")
+        # the copies of a section take the remark of the one requested first, which depends on the order the concurrent
+        # files get their answers in
+        env = dict(os.environ, **stub_env(tmp_dir, server.base_url, section_dedup=False),
+                   PYTHONPATH=os.path.dirname(MAIN))
+        os.makedirs(repo_path)
+        for i in range(args.files):
+            with open(os.path.join(repo_path, f"module_{i}.py"), 'w') as f:
+                f.write(synthetic_python_source(classes=2, methods_per_class=6, functions=4).replace(
+                    "Synthetic", f"Module{i}Synthetic"))
+        command = [sys.executable, MAIN, "--repo-path", repo_path, "--force-re-analyze", "--force-re-comment",
+                   "--max-in-flight", str(args.max_in_flight)] + (["--pipeline"] if args.pipeline else [])
+        workspace = os.path.join(tmp_dir, "root", "workspaces", "bench_repo")
+
+        def run(kill_after=None):
+            server.requests = 0
+            process = subprocess.Popen(command, env=env, cwd=tmp_dir, stdout=subprocess.DEVNULL,
+                                       stderr=subprocess.DEVNULL)
+            while process.poll() is None:
+                if kill_after is not None and server.requests >= kill_after:
+                    process.kill()
+                    process.wait()
+                    return server.requests, None
+                time.sleep(0.002)
+            return server.requests, process.returncode
+
+        clean_requests, returncode = run()
+        if returncode != 0 or not os.path.isdir(workspace):
+            sys.exit(f"main.py failed with exit code {returncode}")
+        expected = read_outputs(workspace)
+        shutil.rmtree(workspace)
+
+        killed_requests, _ = run(kill_after=clean_requests // 2)
+        resumed_requests, returncode = run()
+        failures = []
+        if returncode != 0:
+            failures.append(f"the resumed run failed with exit code {returncode}")
+        if read_outputs(workspace) != expected:
+            failures.append("the resumed run wrote different outputs")
+        lost = killed_requests + resumed_requests - clean_requests
+        print(f"{args.files} files, max in flight {args.max_in_flight}{', pipeline' if args.pipeline else ''}")
+        print(f"    clean run            {clean_requests:5} requests")
+        print(f"    killed run           {killed_requests:5} requests")
+        print(f"    resumed run          {resumed_requests:5} requests  ({lost} requests lost to the kill)")
+        if lost > max(args.max_in_flight, 1) * 2:
+            failures.append(f"the resumed run sent {lost} requests more than needed")
+    if failures:
+        sys.exit("\n".join(failures))
+
+
+if __name__ == '__main__':
+    main()
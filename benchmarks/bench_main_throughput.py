@@ -0,0 +1,102 @@
+"""
+End to end throughput of main.py, in files per minute and requests per second, against the local stub of the chat
+completions endpoint in several scenarios: a clean endpoint, a lognormal latency with a limited generation speed, 429s,
+dropped requests and truncated completions.
+
+main.py has no retry of its own: a run that fails on a 429 or a dropped request is started again with the same
+arguments, and resumes from the job state of the workspace. The restarts and the time they take are part of the figures.
+Every scenario starts from an empty workspace, and has to end with an .analyze.md and a .comments.json for every file.
+
+    python -m benchmarks.bench_main_throughput [--files 8] [--latency 0.05] [--max-in-flight 4] [--pipeline]
+                                               [--scenarios clean lognormal 429 timeout truncated]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.stub_llm_server import StubLLMServer
+from benchmarks.stub_workspace import stub_env
+from benchmarks.synthetic import synthetic_python_source
+
+MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+
+SCENARIOS = {
+    "clean": {},
+    "lognormal": {"latency_distribution": "lognormal", "latency_sigma": 0.8, "tokens_per_second": 200},
+    "429": {"rate_limit_rate": 0.02},
+    "timeout": {"timeout_rate": 0.01, "timeout_seconds": 0.5},
+    "truncated": {"truncate_rate": 0.2},
+}
+
+
+def module_source(i):
+    # the methods of the synthetic classes are the same in every class and module: prefix them so that the section
+    # dedup does not answer most of them
+    source = synthetic_python_source(classes=2, methods_per_class=6, functions=4)
+    return (source.replace("Synthetic", f"Module{i}Synthetic").replace("method_", f"module{i}_method_")
+            .replace("function_", f"module{i}_function_"))
+
+
+def missing_outputs(workspace, files):
+    missing = []
+    for i in range(files):
+        for suffix in (".analyze.md", ".comments.json"):
+            if not os.path.exists(os.path.join(workspace, f"module_{i}.py{suffix}")):
+                missing.append(f"module_{i}.py{suffix}")
+    return missing
+
+
+def run_scenario(args, name, options):
+    with tempfile.TemporaryDirectory() as tmp_dir, StubLLMServer(args.latency, **options) as server:
+        repo_path = os.path.join(tmp_dir, "repos", "bench_repo")
+        env = dict(os.environ, **stub_env(tmp_dir, server.base_url), PYTHONPATH=os.path.dirname(MAIN))
+        os.makedirs(repo_path)
+        for i in range(args.files):
+            with open(os.path.join(repo_path, f"module_{i}.py"), 'w') as f:
+                f.write(module_source(i))
+        command = [sys.executable, MAIN, "--repo-path", repo_path, "--max-in-flight", str(args.max_in_flight)]
+        if args.pipeline:
+            command.append("--pipeline")
+
+        runs = 0
+        returncode = None
+        start = time.time()
+        while returncode != 0 and runs <= args.max_restarts:
+            runs += 1
+            returncode = subprocess.run(command, env=env, cwd=tmp_dir, stdout=subprocess.DEVNULL,
+                                        stderr=subprocess.DEVNULL).returncode
+        elapsed = time.time() - start
+        stats = server.stats()
+        print(f"    {name:<10} {elapsed:7.2f} s  {args.files / elapsed * 60:7.1f} files/min"
+              f"  {stats['requests'] / elapsed:6.1f} requests/s  {runs:3} run(s)  {stats['requests']:5} answered"
+              f"  {stats['rate_limited']:3} 429  {stats['timeouts']:3} dropped  {stats['truncated']:3} truncated")
+        if returncode != 0:
+            return [f"{name}: main.py still failing after {runs} runs, exit code {returncode}"]
+        missing = missing_outputs(os.path.join(tmp_dir, "root", "workspaces", "bench_repo"), args.files)
+        return [f"{name}: no {file}" for file in missing]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=8, help="Number of python files of the synthetic repo")
+    parser.add_argument("--latency", type=float, default=0.05, help="Mean latency of the stub endpoint, in seconds")
+    parser.add_argument("--max-in-flight", type=int, default=4, help="--max-in-flight of main.py")
+    parser.add_argument("--pipeline", action="store_true", help="Run main.py with --pipeline")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--max-restarts", type=int, default=50, help="Restarts of a failing main.py before giving up")
+    args = parser.parse_args()
+
+    print(f"{args.files} files, stub latency {args.latency * 1000:.0f} ms, max in flight {args.max_in_flight}"
+          f"{', pipeline' if args.pipeline else ''}")
+    failures = []
+    for name in args.scenarios:
+        failures += run_scenario(args, name, SCENARIOS[name])
+    if failures:
+        sys.exit("\n".join(failures))
+
+
+if __name__ == '__main__':
+    main()
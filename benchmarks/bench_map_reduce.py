@@ -0,0 +1,130 @@
+"""
+Largest and total input tokens of the requests summarizing and commenting an oversized file, a module with classes of
+hundreds of methods, with and without a max_prompt_tokens ceiling, against a local stub of the chat completions
+endpoint whose answers are lengthened so that the remarks of a class add up to far more than the ceiling.
+
+Without a ceiling, the whole structure json goes into the summary prompt and every method remark into the class
+prompt. With one, the structure is summarized in parts and the method remarks in chunks, reduced level after level:
+no request may exceed the ceiling. FileSummaryAnalyzer and CodeSectionAnalyzer request the parts one by one, the async
+analyzers concurrently; both must write the same summary and comments.
+
+    python -m benchmarks.bench_map_reduce [--classes 2] [--methods 200] [--max-prompt-tokens 6000]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.stub_llm_server import StubLLMServer
+from benchmarks.stub_workspace import stub_environment
+from benchmarks.synthetic import synthetic_python_source
+
+
+class PromptMeter:
+    """
+    A provider that records the estimated tokens of the largest prompt sent through it
+    """
+
+    def __init__(self, api):
+        from llm_project_helper.provider.rate_limiter import estimate_tokens
+        self.api = api
+        self.estimate_tokens = estimate_tokens
+        self.largest = 0
+
+    def measure(self, message):
+        self.largest = max(self.largest, self.estimate_tokens(message))
+
+    def predict(self, message, *args, **kwargs):
+        self.measure(message)
+        return self.api.predict(message, *args, **kwargs)
+
+    def predict_stream(self, message, *args, **kwargs):
+        self.measure(message)
+        return self.api.predict_stream(message, *args, **kwargs)
+
+
+def summarize_and_comment(api, json_file, code_file, max_prompt_tokens):
+    from llm_project_helper.analyzer.code_section_analyzer import CodeSectionAnalyzer
+    from llm_project_helper.analyzer.file_summary_analyzer import FileSummaryAnalyzer
+    summary_analyzer = FileSummaryAnalyzer(api, "json", max_prompt_tokens)
+    summary = summary_analyzer.analyze_file_summary(json_file)
+    comments = CodeSectionAnalyzer(api, 0, None, None, max_prompt_tokens).analyze_code_section(
+        json_file, None, code_file, summary=summary)
+    return summary, summary_analyzer.complete, comments
+
+
+async def summarize_and_comment_async(max_in_flight, json_file, code_file, max_prompt_tokens):
+    from llm_project_helper.analyzer.code_section_analyzer import AsyncCodeSectionAnalyzer
+    from llm_project_helper.analyzer.file_summary_analyzer import AsyncFileSummaryAnalyzer
+    from llm_project_helper.provider import AsyncZhipuAIAPI
+    async with AsyncZhipuAIAPI(max_in_flight) as async_api:
+        api = PromptMeter(async_api)
+        summary_analyzer = AsyncFileSummaryAnalyzer(api, "json", max_prompt_tokens)
+        summary = await summary_analyzer.analyze_file_summary(json_file)
+        comments = await AsyncCodeSectionAnalyzer(api, 0, None, None, max_prompt_tokens).analyze_code_section(
+            json_file, None, code_file, summary=summary)
+    return api.largest, (summary, summary_analyzer.complete, comments)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--classes", type=int, default=2, help="Classes of the oversized module")
+    parser.add_argument("--methods", type=int, default=200, help="Methods per class")
+    parser.add_argument("--functions", type=int, default=60, help="Functions of the oversized module")
+    parser.add_argument("--max-prompt-tokens", type=int, default=6000, help="The ceiling of the input tokens")
+    parser.add_argument("--latency", type=float, default=0.02, help="Latency of the stub endpoint, in seconds")
+    parser.add_argument("--answer-lines", type=int, default=6, help="Lines of every answer of the stub")
+    parser.add_argument("--max-in-flight", type=int, default=8, help="Requests in flight of the async analyzers")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir, StubLLMServer(
+            args.latency, answer_lines=args.answer_lines) as server, stub_environment(tmp_dir, server.base_url):
+        repo_path = os.path.join(tmp_dir, "repos", "bench_repo")
+        from llm_project_helper import RepoTraverser
+        from llm_project_helper.logs import define_log_level
+        from llm_project_helper.provider import ZhipuAIAPI
+        define_log_level(print_level="WARNING", logfile_level="WARNING")
+
+        os.makedirs(repo_path)
+        code_file = os.path.join(repo_path, "oversized.py")
+        with open(code_file, 'w') as f:
+            f.write(synthetic_python_source(args.classes, args.methods, args.functions))
+        json_file = os.path.join(RepoTraverser(repo_path).traverse_repo(), "oversized.py.json")
+        with open(code_file, 'r') as f:
+            lines = sum(1 for _ in f)
+
+        print(f"a module of {lines} lines: {args.classes} classes of {args.methods} methods and {args.functions}"
+              f" functions, stub latency {args.latency * 1000:.0f} ms, {args.answer_lines} lines per answer")
+        failures = []
+        outputs = {}
+        for name, max_prompt_tokens in (("no ceiling", 0), ("sync", args.max_prompt_tokens),
+                                        ("async", args.max_prompt_tokens)):
+            server.reset()
+            start = time.perf_counter()
+            if name == "async":
+                largest, outputs[name] = asyncio.run(summarize_and_comment_async(
+                    args.max_in_flight, json_file, code_file, max_prompt_tokens))
+            else:
+                api = PromptMeter(ZhipuAIAPI())
+                outputs[name] = summarize_and_comment(api, json_file, code_file, max_prompt_tokens)
+                largest = api.largest
+            elapsed = time.perf_counter() - start
+            stats = server.stats()
+            label = f"{name}, {max_prompt_tokens} tokens" if max_prompt_tokens else name
+            print(f"    {label:<20} {elapsed:6.2f} s  {stats['requests']:4} requests  largest prompt {largest:7}"
+                  f" tokens  {stats['prompt_tokens']:8} prompt tokens in all")
+            summary, complete, comments = outputs[name]
+            if not complete or not summary.strip() or any(comment["remark"] is None for comment in comments):
+                failures.append(f"{name}: incomplete summary or comments")
+            if max_prompt_tokens and largest > max_prompt_tokens:
+                failures.append(f"{name}: a prompt of {largest} tokens, over the ceiling of {max_prompt_tokens}")
+        if outputs["sync"] != outputs["async"]:
+            failures.append("the async analyzers wrote a different summary or comments")
+    if failures:
+        sys.exit("\n".join(failures))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmark of the per-process pool of warm Treesitter instances.
+
+Reports the startup cost of warming up the pool (loading the grammars and building one Treesitter per language), then
+the steady state per file cost of analyze_code_from_file on small, mixed python and java files: with a new Treesitter
+created for every file (as before) and with the pooled one.
+
+    python -m benchmarks.bench_parser_pool [--files 400]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from llm_project_helper import utils
+from llm_project_helper.const import Language
+from llm_project_helper.logs import define_log_level
+from llm_project_helper.parser.treesitter_parser import analyze_code_from_file
+from llm_project_helper.treesitter import Treesitter
+from llm_project_helper.treesitter.treesitter_registry import TreesitterRegistry
+from benchmarks.synthetic import synthetic_python_source, synthetic_java_source
+
+
+def per_file_time(file_paths, fresh_parser):
+    start = time.perf_counter()
+    for file_path in file_paths:
+        treesitter_parser = None
+        if fresh_parser:
+            programming_language = utils.get_programming_language(utils.get_file_extension(file_path))
+            treesitter_parser = Treesitter.create_treesitter(programming_language)
+        analyze_code_from_file(file_path, treesitter_parser)
+    return (time.perf_counter() - start) / len(file_paths)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=400, help="Number of small files, half python, half java")
+    args = parser.parse_args()
+    define_log_level(print_level="WARNING", logfile_level="WARNING")
+
+    start = time.perf_counter()
+    TreesitterRegistry.warm_up()
+    print(f"startup: warm up of {len(TreesitterRegistry._pool)} languages {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_paths = []
+        for i in range(args.files):
+            if i % 2 == 0:
+                file_path, code = f"module_{i}.py", synthetic_python_source(classes=1, methods_per_class=2, functions=2)
+            else:
+                file_path, code = f"Module{i}.java", synthetic_java_source(classes=1, methods_per_class=2,
+                                                                           inner_classes=0)
+            file_path = os.path.join(tmp_dir, file_path)
+            with open(file_path, 'w') as f:
+                f.write(code)
+            file_paths.append(file_path)
+
+        # one round of each first, so both are measured with warm file system caches and compiled queries
+        per_file_time(file_paths, fresh_parser=True)
+        per_file_time(file_paths, fresh_parser=False)
+        fresh = per_file_time(file_paths, fresh_parser=True)
+        pooled = per_file_time(file_paths, fresh_parser=False)
+
+    setup_repeat = 1000
+    start = time.perf_counter()
+    for _ in range(setup_repeat):
+        Treesitter.create_treesitter(Language.PYTHON)
+    create_cost = (time.perf_counter() - start) / setup_repeat
+    start = time.perf_counter()
+    for _ in range(setup_repeat):
+        Treesitter.get_treesitter(Language.PYTHON)
+    get_cost = (time.perf_counter() - start) / setup_repeat
+
+    print(f"steady state, {args.files} small files: new Treesitter per file {fresh * 1000:.3f} ms/file, "
+          f"pooled {pooled * 1000:.3f} ms/file ({(fresh - pooled) / fresh:.0%} less)")
+    print(f"parser setup alone: create_treesitter {create_cost * 1e6:.1f} us, get_treesitter {get_cost * 1e6:.2f} us")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Wall time and time to the first commented file of the three passes (traverse_repo, then analyze_and_comment_async)
+versus pipeline_async, against a local stub of the chat completions endpoint, each run starting from an empty
+workspace.
+
+The synthetic repo mixes a few large files, whose parsing takes a while, with many small ones. Both runs have to write
+the same structure json, .analyze.md and .comments.json files.
+
+    python -m benchmarks.bench_pipeline [--files 20] [--large-files 4] [--latency 0.05] [--in-flight 8] [--jobs 1]
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.stub_llm_server import StubLLMServer
+from benchmarks.stub_workspace import read_outputs, stub_environment
+from benchmarks.synthetic import synthetic_python_source
+
+
+def first_comments(workspace, start):
+    mtimes = [os.path.getmtime(os.path.join(root, file)) for root, _, files in os.walk(workspace) for file in files
+              if file.endswith('.comments.json')]
+    return min(mtimes) - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=20, help="Number of small python files of the synthetic repo")
+    parser.add_argument("--large-files", type=int, default=4, help="Number of large python files of the synthetic repo")
+    parser.add_argument("--latency", type=float, default=0.05, help="Latency of the stub endpoint, in seconds")
+    parser.add_argument("--in-flight", type=int, default=8, help="Maximum number of LLM requests in flight")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of processes parsing the repo")
+    args = parser.parse_args()
+
+    # the copies of a section take the remark of the one requested first, which depends on the order of the files
+    with tempfile.TemporaryDirectory() as tmp_dir, StubLLMServer(args.latency) as server, stub_environment(
+            tmp_dir, server.base_url, section_dedup=False):
+        repo_path = os.path.join(tmp_dir, "repos", "bench_repo")
+        from llm_project_helper import RepoTraverser
+        from llm_project_helper.logs import define_log_level
+        define_log_level(print_level="WARNING", logfile_level="WARNING")
+
+        os.makedirs(repo_path)
+        for i in range(args.large_files):
+            with open(os.path.join(repo_path, f"large_{i}.py"), 'w') as f:
+                f.write(synthetic_python_source(classes=10, methods_per_class=20, functions=100))
+        for i in range(args.files):
+            with open(os.path.join(repo_path, f"module_{i}.py"), 'w') as f:
+                f.write(synthetic_python_source(classes=1, methods_per_class=4, functions=2))
+        traverser = RepoTraverser(repo_path)
+        workspace = traverser.get_cur_ws_dir()
+
+        async def three_passes():
+            analyze_folder = traverser.traverse_repo(args.jobs)
+            await traverser.analyze_and_comment_async(analyze_folder, True, True, max_in_flight=args.in_flight)
+
+        async def pipeline():
+            await traverser.pipeline_async(True, True, jobs=args.jobs, max_in_flight=args.in_flight)
+
+        print(f"{args.large_files} large and {args.files} small files, stub latency {args.latency * 1000:.0f} ms,"
+              f" {args.in_flight} requests in flight, {args.jobs} parsing job(s)")
+        expected = None
+        failures = []
+        for name, run in (("three passes", three_passes), ("pipeline", pipeline)):
+            shutil.rmtree(workspace)
+            os.makedirs(workspace)
+            server.requests = 0
+            start = time.time()
+            asyncio.run(run())
+            elapsed = time.time() - start
+            outputs = read_outputs(workspace, ('.json', '.analyze.md'))
+            if expected is None:
+                expected = outputs
+            elif outputs != expected:
+                failures.append(f"{name}: different outputs")
+            print(f"    {name:<14} {elapsed:7.2f} s  first commented file after"
+                  f" {first_comments(workspace, start):6.2f} s  {server.requests} requests")
+    if failures:
+        sys.exit("\n".join(failures))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""
+Benchmark of the single pass cursor engine of TreesitterPython against the query engine: the parse time of both
+engines on 10k-line synthetic files and on the given files. tests/test_python_cursor_engine.py checks that they write
+the same structure json.
+
+    python -m benchmarks.bench_python_cursor_engine [file.py ...]
+"""
+import argparse
+import os
+import time
+
+from llm_project_helper.logs import define_log_level
+from llm_project_helper.treesitter import TreesitterPython
+from benchmarks.synthetic import synthetic_python_source
+
+
+def time_parse(treesitter_parser, file_bytes, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        treesitter_parser.parse(file_bytes)
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("files", nargs="*", help="Additional python files to time")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timed parses per file")
+    args = parser.parse_args()
+    define_log_level(print_level="WARNING", logfile_level="WARNING")
+
+    cases = [
+        ("synthetic 10k lines, classes", synthetic_python_source(classes=45, methods_per_class=22, functions=10)),
+        ("synthetic 10k lines, functions", synthetic_python_source(classes=2, methods_per_class=10, functions=1200)),
+    ]
+    for file_path in args.files:
+        with open(file_path, 'r') as f:
+            cases.append((os.path.basename(file_path), f.read()))
+
+    query_engine = TreesitterPython(engine="query")
+    cursor_engine = TreesitterPython(engine="cursor")
+    for name, code in cases:
+        file_bytes = code.encode()
+        query_time = time_parse(query_engine, file_bytes, args.repeat)
+        cursor_time = time_parse(cursor_engine, file_bytes, args.repeat)
+        print(f"{name:<32} {code.count(chr(10)) + 1:>6} lines  query: {query_time * 1000:8.1f} ms  "
+              f"cursor: {cursor_time * 1000:8.1f} ms  speedup: {query_time / cursor_time:5.1f}x")
+
+
+if __name__ == '__main__':
+    main()
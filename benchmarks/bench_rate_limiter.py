@@ -0,0 +1,78 @@
+"""
+Benchmark of the shared RPM / TPM rate limiter: several worker processes send requests as fast as they can to a local
+stub of the chat completions endpoint, through ZhipuAIAPI, with the same LLM_PROJECT_HELPER_RPM and
+LLM_PROJECT_HELPER_TPM. The aggregate rates seen by the stub, over the steady part of the run, have to stay at or just
+under the configured quotas, however many processes share them.
+
+    python -m benchmarks.bench_rate_limiter [--processes 4] [--rpm 600] [--tpm 0] [--duration 10]
+"""
+import argparse
+import multiprocessing
+import sys
+import tempfile
+import time
+
+from benchmarks.stub_llm_server import StubLLMServer
+from benchmarks.stub_workspace import stub_environment
+
+
+def worker(deadline, prompt):
+    from llm_project_helper.logs import define_log_level
+    from llm_project_helper.provider import ZhipuAIAPI
+    define_log_level(print_level="WARNING", logfile_level="WARNING")
+    api = ZhipuAIAPI()
+    while time.time() < deadline:
+        api.predict(prompt)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--processes", type=int, default=4, help="Number of worker processes")
+    parser.add_argument("--rpm", type=int, default=600, help="Requests per minute quota")
+    parser.add_argument("--tpm", type=int, default=0, help="Tokens per minute quota")
+    parser.add_argument("--duration", type=float, default=10, help="Duration of the run, in seconds")
+    parser.add_argument("--latency", type=float, default=0.01, help="Latency of the stub endpoint, in seconds")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir, StubLLMServer(args.latency) as server, stub_environment(
+            tmp_dir, server.base_url, rpm=args.rpm, tpm=args.tpm):
+
+        arrivals = []
+        completion = server.completion
+
+        def timed_completion(body):
+            response = completion(body)
+            arrivals.append((time.time(), response["usage"]["total_tokens"]))
+            return response
+
+        server.completion = timed_completion
+        start = time.time()
+        deadline = start + args.duration
+        context = multiprocessing.get_context("spawn")
+        workers = [context.Process(target=worker, args=(deadline, f"rate limiter benchmark {i} " * 40))
+                   for i in range(args.processes)]
+        for process in workers:
+            process.start()
+        for process in workers:
+            process.join()
+
+    # skip the start of the workers and the first second of requests: the buckets start full, i.e. with one burst
+    steady_start = min(at for at, _ in arrivals) + 1
+    steady = [(at, tokens) for at, tokens in arrivals if steady_start <= at < deadline]
+    minutes = (deadline - steady_start) / 60
+    achieved_rpm = len(steady) / minutes
+    achieved_tpm = sum(tokens for _, tokens in steady) / minutes
+    print(f"{args.processes} processes, {len(arrivals)} requests in {args.duration:.0f} s")
+    failed = False
+    if args.rpm:
+        print(f"    requests per minute {achieved_rpm:9.0f} / {args.rpm} ({achieved_rpm / args.rpm:6.1%})")
+        failed |= achieved_rpm > args.rpm
+    if args.tpm:
+        print(f"    tokens per minute   {achieved_tpm:9.0f} / {args.tpm} ({achieved_tpm / args.tpm:6.1%})")
+        failed |= achieved_tpm > args.tpm * 1.05
+    if failed:
+        sys.exit("the quotas were exceeded")
+
+
+if __name__ == '__main__':
+    main()
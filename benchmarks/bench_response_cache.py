@@ -0,0 +1,91 @@
+"""
+Benchmark of the LLM response cache against a local stub of the chat completions endpoint.
+
+A synthetic repo is summarized and commented twice with --force-re-analyze / --force-re-comment semantics, first with
+an empty cache, then with the cache of the first run: the second run has to send no request at all and write the
+same outputs. Then the same with analyze_and_comment_async, with predict_sse, and the eviction of the least recently
+used responses is checked with a small cache.
+
+    python -m benchmarks.bench_response_cache [--files 10] [--latency 0.05]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.stub_llm_server import StubLLMServer
+from benchmarks.stub_workspace import read_outputs, stub_environment
+from benchmarks.synthetic import synthetic_python_source
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=10, help="Number of python files of the synthetic repo")
+    parser.add_argument("--latency", type=float, default=0.05, help="Latency of the stub endpoint, in seconds")
+    args = parser.parse_args()
+
+    # the copies of a section take the remark of the one requested first, which depends on the order of the files
+    with tempfile.TemporaryDirectory() as tmp_dir, StubLLMServer(args.latency) as server, stub_environment(
+            tmp_dir, server.base_url, llm_cache=True, section_dedup=False):
+        repo_path = os.path.join(tmp_dir, "repos", "bench_repo")
+        from llm_project_helper import RepoTraverser
+        from llm_project_helper.logs import define_log_level
+        from llm_project_helper.provider import ZhipuAIAPI
+        from llm_project_helper.provider.response_cache import ResponseCache, shared_response_cache
+        define_log_level(print_level="WARNING", logfile_level="WARNING")
+
+        os.makedirs(repo_path)
+        for i in range(args.files):
+            with open(os.path.join(repo_path, f"module_{i}.py"), 'w') as f:
+                f.write(synthetic_python_source(classes=1, methods_per_class=6, functions=2))
+        traverser = RepoTraverser(repo_path)
+        analyze_folder = traverser.traverse_repo()
+        cache = shared_response_cache()
+
+        def sequential():
+            traverser.analyze_repo(analyze_folder, True)
+            traverser.sectioned_comment(analyze_folder, True)
+
+        def concurrent():
+            asyncio.run(traverser.analyze_and_comment_async(analyze_folder, True, True, max_in_flight=8))
+
+        failures = []
+        expected = None
+        for name, run in (("sequential", sequential), ("async", concurrent)):
+            for label in ("cold", "warm"):
+                if label == "cold":
+                    cache.connection.execute("DELETE FROM responses")
+                server.requests = 0
+                start = time.perf_counter()
+                run()
+                elapsed = time.perf_counter() - start
+                outputs = read_outputs(analyze_folder)
+                expected = expected or outputs
+                print(f"    {name:<10} {label}  {elapsed:7.2f} s  {server.requests:5} requests")
+                if label == "warm" and server.requests:
+                    failures.append(f"the warm {name} run sent {server.requests} requests")
+                if outputs != expected:
+                    failures.append(f"the {label} {name} run wrote different outputs")
+
+        api = ZhipuAIAPI()
+        server.requests = 0
+        streamed = [list(api.predict_sse("response cache benchmark")) for _ in range(2)]
+        if server.requests != 1 or streamed[0][-1] != streamed[1][-1]:
+            failures.append(f"predict_sse sent {server.requests} requests for 2 identical prompts")
+
+        small_cache = ResponseCache(os.path.join(tmp_dir, "small", "responses.db"), max_bytes=10_000)
+        for i in range(100):
+            small_cache.put(f"key {i}", "x" * 1000)
+            small_cache.get("key 0")  # the most recently used, never evicted
+        stats = small_cache.stats()
+        if stats["bytes"] > 10_000 or small_cache.get("key 0") is None or small_cache.get("key 1") is not None:
+            failures.append(f"unexpected eviction: {stats}")
+        print(f"    cache stats {cache.stats()}")
+    if failures:
+        sys.exit("\n".join(failures))
+
+
+if __name__ == '__main__':
+    main()
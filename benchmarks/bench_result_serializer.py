@@ -0,0 +1,79 @@
+"""
+Benchmark of building and serializing the treesitter result records.
+
+For large synthetic files, reports the number of result nodes built per second by the extractors, then serialized per
+second by json.dumps(result.model_dump(), indent=4, default=str) (the former way of writing the structure json),
+by dumps_result with indent=4, and by the compact dumps_result. The indented outputs have to be byte-identical.
+
+    python -m benchmarks.bench_result_serializer
+"""
+import argparse
+import json
+import sys
+import time
+
+from llm_project_helper.logs import define_log_level
+from llm_project_helper.treesitter import TreesitterPython, TreesitterJava, dumps_result
+from llm_project_helper.treesitter.treesitter import TreesitterRecord
+from benchmarks.synthetic import synthetic_python_source, synthetic_java_source
+
+
+def count_nodes(value):
+    if isinstance(value, TreesitterRecord):
+        return 1 + sum(count_nodes(getattr(value, name)) for name in value._dump_fields)
+    if isinstance(value, list):
+        return sum(count_nodes(item) for item in value)
+    if isinstance(value, dict):
+        return sum(count_nodes(item) for item in value.values())
+    return 0
+
+
+def best_time(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5, help="Number of timed runs, the best one is reported")
+    args = parser.parse_args()
+    define_log_level(print_level="WARNING", logfile_level="WARNING")
+
+    cases = [
+        ("python, query engine", TreesitterPython(engine="query"),
+         synthetic_python_source(classes=45, methods_per_class=22, functions=10)),
+        ("python, cursor engine", TreesitterPython(engine="cursor"),
+         synthetic_python_source(classes=45, methods_per_class=22, functions=10)),
+        ("java", TreesitterJava(), synthetic_java_source(classes=30, methods_per_class=30, inner_classes=2)),
+    ]
+    mismatches = 0
+    for name, treesitter_parser, code in cases:
+        file_bytes = code.encode()
+        result = treesitter_parser.parse(file_bytes)
+        nodes = count_nodes(result)
+        if dumps_result(result, indent=4) != json.dumps(result.model_dump(), indent=4, default=str):
+            mismatches += 1
+            print(f"MISMATCH {name}")
+            continue
+
+        timings = [
+            ("build", best_time(lambda: treesitter_parser.parse(file_bytes), args.repeat)),
+            ("model_dump+json.dumps(indent=4)",
+             best_time(lambda: json.dumps(result.model_dump(), indent=4, default=str), args.repeat)),
+            ("dumps_result(indent=4)", best_time(lambda: dumps_result(result, indent=4), args.repeat)),
+            ("dumps_result (compact)", best_time(lambda: dumps_result(result), args.repeat)),
+        ]
+        print(f"{name}: {nodes} nodes")
+        for label, elapsed in timings:
+            print(f"    {label:<34} {elapsed * 1000:8.1f} ms  {nodes / elapsed:12,.0f} nodes/s")
+    if mismatches:
+        sys.exit(f"{mismatches} case(s) where dumps_result differs from json.dumps")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""
+Requests of sectioned_comment and analyze_and_comment_async with and without the repo-wide section dedup, against a
+local stub of the chat completions endpoint, on a synthetic repo where some modules are vendored: copied as is, and
+copied with reformatting (trailing whitespace, comment lines and shifted line numbers) that the fingerprints ignore.
+
+Every run has to write a remark for every section, at the line_no of the section in its own file; with the dedup, all
+the copies of a section have to share one remark. The last run deletes the comments of the copies and comments them
+again, which has to send no request: their remarks come from the comments of the originals.
+
+    python -m benchmarks.bench_section_dedup [--modules 6] [--vendored 3]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+from benchmarks.stub_llm_server import StubLLMServer
+from benchmarks.stub_workspace import stub_environment
+from benchmarks.synthetic import synthetic_python_source
+
+
+def module_source(i):
+    # the methods of the synthetic classes are the same in every class and module: prefix them to make them unique
+    source = synthetic_python_source(classes=1, methods_per_class=15, functions=10)
+    return (source.replace("Synthetic", f"Module{i}Synthetic").replace("method_", f"module{i}_method_")
+            .replace("function_", f"module{i}_function_"))
+
+
+def reformat(source):
+    lines = ["# vendored copy, reformatted", ""]
+    for line in source.splitlines():
+        lines.append(line + "  ")
+        if line.strip().startswith("def "):
+            lines.append(line[:len(line) - len(line.lstrip())] + "    # reviewed")
+    return "\n".join(lines)
+
+
+def read_comments(workspace):
+    comments = {}
+    for root, _, files in os.walk(workspace):
+        for file in files:
+            if file.endswith('.comments.json'):
+                with open(os.path.join(root, file), 'r', encoding='utf-8') as f:
+                    comments[os.path.relpath(os.path.join(root, file), workspace)] = json.load(f)["comments"]
+    return comments
+
+
+def check(name, comments, expected_lines, dedup):
+    failures = []
+    remarks = {}
+    for file, file_comments in comments.items():
+        if sorted(comment["line_no"] for comment in file_comments) != expected_lines[file]:
+            failures.append(f"{name}: wrong line_no in {file}")
+        for comment in file_comments:
+            if not comment["remark"]:
+                failures.append(f"{name}: section without remark at {file}:{comment['line_no']}")
+            remarks.setdefault(comment["fingerprint"], set()).add(comment["remark"])
+    if dedup and any(len(fingerprint_remarks) > 1 for fingerprint_remarks in remarks.values()):
+        failures.append(f"{name}: copies of a section with different remarks")
+    sections = sum(len(file_comments) for file_comments in comments.values())
+    return failures, sections, len(remarks)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modules", type=int, default=6, help="Number of unique python modules of the synthetic repo")
+    parser.add_argument("--vendored", type=int, default=3, help="Number of modules copied as is and reformatted")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir, StubLLMServer(0.0) as server, stub_environment(
+            tmp_dir, server.base_url):
+        repo_path = os.path.join(tmp_dir, "repos", "bench_repo")
+        from llm_project_helper import RepoTraverser
+        from llm_project_helper.logs import define_log_level
+        define_log_level(print_level="WARNING", logfile_level="WARNING")
+
+        for folder in ("src", "vendor", "third_party"):
+            os.makedirs(os.path.join(repo_path, folder))
+        for i in range(args.modules):
+            source = module_source(i)
+            with open(os.path.join(repo_path, "src", f"module_{i}.py"), 'w') as f:
+                f.write(source)
+            if i < args.vendored:
+                with open(os.path.join(repo_path, "vendor", f"module_{i}.py"), 'w') as f:
+                    f.write(source)
+                with open(os.path.join(repo_path, "third_party", f"module_{i}.py"), 'w') as f:
+                    f.write(reformat(source))
+        traverser = RepoTraverser(repo_path)
+        analyze_folder = traverser.traverse_repo()
+        traverser.analyze_repo(analyze_folder, True)
+
+        runs = (
+            ("sequential, no dedup", False, 1),
+            ("sequential, dedup", True, 1),
+            ("async x4, no dedup", False, 4),
+            ("async x4, dedup", True, 4),
+        )
+        failures = []
+        expected_lines = None
+        baseline = None
+        for name, dedup, max_in_flight in runs:
+            server.requests = 0
+            if max_in_flight > 1:
+                asyncio.run(traverser.analyze_and_comment_async(
+                    analyze_folder, False, True, max_in_flight=max_in_flight, section_dedup=dedup))
+            else:
+                traverser.sectioned_comment(analyze_folder, True, section_dedup=dedup)
+            comments = read_comments(analyze_folder)
+            if expected_lines is None:
+                expected_lines = {file: sorted(comment["line_no"] for comment in file_comments)
+                                  for file, file_comments in comments.items()}
+            run_failures, sections, unique = check(name, comments, expected_lines, dedup)
+            failures += run_failures
+            if baseline is None:
+                baseline = server.requests
+            print(f"    {name:<22} {server.requests:5} requests for {sections} sections, {unique} unique"
+                  f"  ({baseline / server.requests:4.1f}x fewer requests, dedup ratio {1 - unique / sections:.1%})")
+
+        # the copies commented again, e.g. after their comments were lost: the comments of the originals seed the index
+        for folder in ("vendor", "third_party"):
+            for root, _, files in os.walk(os.path.join(analyze_folder, folder)):
+                for file in files:
+                    if file.endswith('.comments.json'):
+                        os.remove(os.path.join(root, file))
+        server.requests = 0
+        traverser.sectioned_comment(analyze_folder, False, section_dedup=True)
+        run_failures, _, _ = check("copies again", read_comments(analyze_folder), expected_lines, True)
+        failures += run_failures
+        print(f"    {'copies again, dedup':<22} {server.requests:5} requests")
+        if server.requests:
+            failures.append("copies again: the copies of commented sections were requested")
+    if failures:
+        sys.exit("\n".join(failures))
+
+
+if __name__ == '__main__':
+    main()
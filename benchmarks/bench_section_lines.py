@@ -0,0 +1,107 @@
+"""
+Cost of reading the sections of a file for CodeSectionAnalyzer: rescanning the file from its first line for every
+section, as read_specific_lines used to, versus reading it once into a SourceLines line-offset index.
+
+The synthetic file has about 5000 lines and 300 methods (plus its classes and functions). Both readers have to return
+the same lines for every section, and for a few edge cases: CRLF and CR newlines, form feeds, no trailing newline and
+ranges past the end of the file.
+
+    python -m benchmarks.bench_section_lines [--rounds 5]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from llm_project_helper.logs import define_log_level
+from llm_project_helper.parser.treesitter_parser import analyze_code_from_file
+from llm_project_helper.utils import SourceLines
+from benchmarks.synthetic import synthetic_python_source
+
+
+def rescan_lines(filename, start_line, end_line):
+    # the former CodeSectionAnalyzer.read_specific_lines
+    lines = []
+    with open(filename, 'r') as file:
+        for i, line in enumerate(file):
+            if i > end_line - 1:
+                break
+            if i >= start_line - 1:
+                lines.append(line.rstrip())
+    return lines
+
+
+def indexed_lines(filename, ranges):
+    source_lines = SourceLines.from_file(filename)
+    return [source_lines.lines(start_line, end_line) for start_line, end_line in ranges]
+
+
+def section_ranges(result):
+    ranges = [(node.line_number, node.end_line_number) for node in result.functions.values()]
+    for class_node in result.classes.values():
+        ranges.append((class_node.line_number, class_node.end_line_number))
+        ranges += [(node.line_number, node.end_line_number) for node in class_node.methods.values()]
+    return ranges
+
+
+def best_of(rounds, function):
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def check_edge_cases(tmp_dir):
+    failures = []
+    texts = {
+        "lf": "a\n  b  \n\nc\n",
+        "crlf": "a\r\n  b  \r\n\r\nc",
+        "cr": "a\r  b\rc\r",
+        "form feed": "a\x0cb\n\x0c\nc\n",
+        "empty": "",
+    }
+    for name, text in texts.items():
+        filename = os.path.join(tmp_dir, f"edge_{name.replace(' ', '_')}.py")
+        with open(filename, 'w', newline='') as f:
+            f.write(text)
+        ranges = [(start, end) for start in range(1, 7) for end in range(start, 8)]
+        if [rescan_lines(filename, start, end) for start, end in ranges] != indexed_lines(filename, ranges):
+            failures.append(f"different lines for the {name} file")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=5, help="Timed rounds of each reader, the best one is kept")
+    args = parser.parse_args()
+    define_log_level(print_level="WARNING", logfile_level="WARNING")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, "large_module.py")
+        with open(filename, 'w') as f:
+            f.write(synthetic_python_source(classes=15, methods_per_class=20, functions=200))
+        with open(filename, 'r') as f:
+            line_count = sum(1 for _ in f)
+        result = analyze_code_from_file(filename)
+        ranges = section_ranges(result)
+        methods = sum(len(class_node.methods) for class_node in result.classes.values())
+
+        rescan_time, rescanned = best_of(args.rounds, lambda: [rescan_lines(filename, start, end)
+                                                               for start, end in ranges])
+        indexed_time, indexed = best_of(args.rounds, lambda: indexed_lines(filename, ranges))
+        failures = check_edge_cases(tmp_dir)
+        if rescanned != indexed:
+            failures.append("different lines for the synthetic file")
+
+    print(f"{line_count} lines, {methods} methods, {len(ranges)} sections")
+    print(f"    rescan per section   {rescan_time * 1000:8.2f} ms")
+    print(f"    SourceLines index    {indexed_time * 1000:8.2f} ms  ({rescan_time / indexed_time:.0f}x faster)")
+    if failures:
+        sys.exit("\n".join(failures))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+Per-request cost of a new ZhipuAIAPI per analyzer, as analyze_repo and sectioned_comment used to build, versus the
+process-wide shared_zhipuai_api() and its keep-alive connection pool, against a local stub of the chat completions
+endpoint with the response cache off.
+
+The wall time per request includes the construction of the provider; the latency percentiles are the ones recorded by
+the providers (request_latencies), where the new connection of every request shows up. The stub is plain HTTP on the
+loopback, so the savings on a real endpoint, with a TLS handshake over the network, are larger.
+
+    python -m benchmarks.bench_shared_provider [--requests 300] [--latency 0.01]
+"""
+import argparse
+import tempfile
+import time
+
+from benchmarks.stub_llm_server import StubLLMServer
+from benchmarks.stub_workspace import stub_environment
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=300, help="Number of requests of each run")
+    parser.add_argument("--latency", type=float, default=0.01, help="Latency of the stub endpoint, in seconds")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir, StubLLMServer(args.latency) as server, stub_environment(
+            tmp_dir, server.base_url):
+        from llm_project_helper.logs import define_log_level
+        from llm_project_helper.provider import ZhipuAIAPI, shared_zhipuai_api
+        from llm_project_helper.provider.request_stats import request_latencies
+        define_log_level(print_level="WARNING", logfile_level="WARNING")
+
+        runs = (
+            ("new provider per request", ZhipuAIAPI),
+            ("shared provider", shared_zhipuai_api),
+        )
+        print(f"{args.requests} requests, stub latency {args.latency * 1000:.0f} ms")
+        for name, provider in runs:
+            request_latencies.reset()
+            start = time.perf_counter()
+            for i in range(args.requests):
+                provider().predict(f"shared provider benchmark {i}")
+            elapsed = time.perf_counter() - start
+            stats = request_latencies.stats()
+            print(f"    {name:<25} {elapsed / args.requests * 1000:6.2f} ms/request"
+                  f"  latency p50 {stats['p50'] * 1000:6.2f} ms  p99 {stats['p99'] * 1000:6.2f} ms"
+                  f"  max {stats['max'] * 1000:6.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Memory benchmark of the offset based source spans of the treesitter result nodes.
+
+The result nodes only keep byte offsets into the SourceBuffer of the file, the source code of a class or a method is
+decoded when it is asked for. For a file made of one large class, this script reports with tracemalloc the peak and
+retained memory of analyze_code_from_file, then the same after materializing the source code of every class and
+method, which is what the nodes used to hold eagerly: the class source repeats the source of all its methods.
+
+    python -m benchmarks.bench_source_spans [--lines 2000]
+"""
+import argparse
+import gc
+import os
+import tempfile
+import tracemalloc
+
+from llm_project_helper.logs import define_log_level
+from llm_project_helper.parser.treesitter_parser import analyze_code_from_file
+from benchmarks.synthetic import synthetic_python_source, synthetic_java_source
+
+
+def span_nodes(result):
+    nodes = []
+    for class_node in (result.classes or {}).values():
+        nodes.append(class_node)
+        nodes.extend((class_node.constructors or {}).values())
+        nodes.extend((class_node.methods or {}).values())
+    for interface_node in (result.interfaces or {}).values():
+        nodes.append(interface_node)
+        nodes.extend((interface_node.methods or {}).values())
+    nodes.extend((result.functions or {}).values())
+    return nodes
+
+
+def measure(file_path, materialize):
+    """
+    :return: (peak, retained) bytes allocated while analyzing file_path
+    """
+    gc.collect()
+    tracemalloc.start()
+    result = analyze_code_from_file(file_path)
+    sources = [node.source_code for node in span_nodes(result)] if materialize else None
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result, sources
+    return peak, retained
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", type=int, default=2000, help="Approximate number of lines of the class")
+    args = parser.parse_args()
+    define_log_level(print_level="WARNING", logfile_level="WARNING")
+
+    cases = []
+    for scale in (1, 2, 4):
+        lines = args.lines * scale
+        # a synthetic python method takes 10 lines, a java one 9
+        cases.append((f"python class, {lines} lines", '.py',
+                      synthetic_python_source(classes=1, methods_per_class=lines // 10, functions=0)))
+        cases.append((f"java class, {lines} lines", '.java',
+                      synthetic_java_source(classes=1, methods_per_class=lines // 9, inner_classes=0)))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, suffix, code in cases:
+            file_path = os.path.join(tmp_dir, 'Synthetic' + suffix)
+            with open(file_path, 'w') as f:
+                f.write(code)
+            size = len(code.encode())
+            # a first run, so the one-off setup (grammar loading, query compilation) is not measured
+            analyze_code_from_file(file_path)
+            lazy_peak, lazy_retained = measure(file_path, materialize=False)
+            eager_peak, eager_retained = measure(file_path, materialize=True)
+            print(f"{name:<28} source: {size / 1024:7.1f} KiB  "
+                  f"lazy peak/retained: {lazy_peak / 1024:8.1f} / {lazy_retained / 1024:8.1f} KiB  "
+                  f"eager peak/retained: {eager_peak / 1024:8.1f} / {eager_retained / 1024:8.1f} KiB  "
+                  f"eager source text: {(eager_retained - lazy_retained) / size:4.1f}x the file")
+
+
+if __name__ == '__main__':
+    main()
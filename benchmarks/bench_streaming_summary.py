@@ -0,0 +1,137 @@
+"""
+Time to the first byte of a summary, time per file and completion tokens of FileSummaryAnalyzer, streaming and cut at
+the EOS token, versus the former blocking analyzer (predict_with_history, waiting for the whole reply, chopping its
+last line when the EOS token is missing), against a local stub of the chat completions endpoint that generates
+tokens_per_second and keeps going after the EOS token, as a model that does not stop at it would.
+
+The streamed summaries have to be the blocking ones up to the EOS token. With --truncate-rate, the stub truncates a
+share of the completions: the streamed summaries are continued, and must never contain the EOS token.
+
+    python -m benchmarks.bench_streaming_summary [--files 10] [--tokens-per-second 300] [--truncate-rate 0.3]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.stub_llm_server import StubLLMServer
+from benchmarks.stub_workspace import stub_environment
+from benchmarks.synthetic import synthetic_python_source
+
+EOS_TOKEN = "[|$|EOS|$|]"
+CONTINUE_PHRASE = "继续。总结时务必输出结尾符[|$|EOS|$|]"
+
+
+class TimedOutput:
+    """
+    A summary output that records when its first byte was written
+    """
+
+    def __init__(self, start):
+        self.start = start
+        self.first_byte = None
+        self.text = ""
+
+    def write(self, text):
+        if self.first_byte is None:
+            self.first_byte = time.perf_counter() - self.start
+        self.text += text
+
+    def flush(self):
+        pass
+
+
+def blocking_summary(analyzer, structure_json):
+    # the former FileSummaryAnalyzer.analyze_structure
+    from llm_project_helper.analyzer.file_summary_analyzer import MAX_REQ
+    json_code = analyzer.structure_for_prompt(structure_json)
+    eos_flag = False
+    count = 0
+    result = ""
+    history = []
+    while eos_flag is False and count < MAX_REQ:
+        prompt = analyzer.base_prompt + json_code if count == 0 else CONTINUE_PHRASE
+        chat_result = analyzer.api.predict_with_history(prompt, history=history).content
+        eos_flag = EOS_TOKEN in chat_result
+        if eos_flag:
+            chat_result = chat_result.replace(EOS_TOKEN, "")
+        else:
+            chat_result = chat_result.rsplit('\n', 1)[0] + '\n'
+        result += chat_result
+        count += 1
+        history.append({"role": "assistant", "content": chat_result})
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=10, help="Number of python files to summarize")
+    parser.add_argument("--latency", type=float, default=0.05, help="Time to the first token of the stub, in seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=300, help="Generation speed of the stub")
+    parser.add_argument("--answer-lines", type=int, default=30, help="Lines of a summary before the EOS token")
+    parser.add_argument("--after-eos-lines", type=int, default=30, help="Lines generated after the EOS token")
+    parser.add_argument("--truncate-rate", type=float, default=0.0, help="Share of the completions truncated")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir, StubLLMServer(
+            args.latency, tokens_per_second=args.tokens_per_second, answer_lines=args.answer_lines,
+            after_eos_lines=args.after_eos_lines, truncate_rate=args.truncate_rate) as server, stub_environment(
+            tmp_dir, server.base_url):
+        repo_path = os.path.join(tmp_dir, "repos", "bench_repo")
+        from llm_project_helper import RepoTraverser
+        from llm_project_helper.analyzer.file_summary_analyzer import FileSummaryAnalyzer
+        from llm_project_helper.logs import define_log_level
+        define_log_level(print_level="WARNING", logfile_level="WARNING")
+
+        os.makedirs(repo_path)
+        for i in range(args.files):
+            with open(os.path.join(repo_path, f"module_{i}.py"), 'w') as f:
+                f.write(synthetic_python_source(classes=1, methods_per_class=4, functions=2).replace(
+                    "Synthetic", f"Module{i}Synthetic"))
+        analyze_folder = RepoTraverser(repo_path).traverse_repo()
+        structures = []
+        for root, _, files in os.walk(analyze_folder):
+            for file in sorted(files):
+                if file.endswith('.json') and not file.startswith('.'):
+                    with open(os.path.join(root, file), 'r') as f:
+                        structures.append(f.read())
+
+        print(f"{len(structures)} files, stub first token after {args.latency * 1000:.0f} ms,"
+              f" {args.tokens_per_second:.0f} tokens/s, {args.answer_lines} lines before and {args.after_eos_lines}"
+              f" after the EOS token, {args.truncate_rate:.0%} truncated")
+        failures = []
+        blocking = []
+        for name in ("blocking", "streaming"):
+            server.reset()
+            first_bytes = []
+            totals = []
+            for i, structure in enumerate(structures):
+                analyzer = FileSummaryAnalyzer(detail="json")
+                start = time.perf_counter()
+                if name == "blocking":
+                    summary = blocking_summary(analyzer, structure)
+                    # written to the .analyze.md once complete
+                    first_bytes.append(time.perf_counter() - start)
+                    blocking.append(summary)
+                else:
+                    output = TimedOutput(start)
+                    summary = analyzer.analyze_structure(structure, output)
+                    first_bytes.append(output.first_byte)
+                    if output.text != summary or EOS_TOKEN in summary:
+                        failures.append(f"file {i}: the streamed output differs from the summary")
+                    if not args.truncate_rate and not blocking[i].startswith(summary):
+                        failures.append(f"file {i}: the streamed summary is not the blocking one up to the EOS token")
+                totals.append(time.perf_counter() - start)
+            stats = server.stats()
+            tokens = stats["streamed_tokens"] if name == "streaming" else stats["completion_tokens"]
+            print(f"    {name:<10} first byte {statistics.fmean(first_bytes) * 1000:7.1f} ms"
+                  f"  per file {statistics.fmean(totals) * 1000:7.1f} ms  {stats['requests']:3} requests"
+                  f"  {tokens:6} completion tokens")
+    if failures:
+        sys.exit("\n".join(failures))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Input tokens of the first summary prompt of FileSummaryAnalyzer per file, with the structure json as traverse_repo
+writes it (indent 4), the compact structure json, and the skeleton of each detail level.
+
+The sample corpus defaults to the python files of llm_project_helper, a few large modules of the standard library and
+a synthetic java file; pass files or directories to use others. The tokens are estimated with the heuristic of the
+rate limiter (estimate_tokens), which is close enough to compare the encodings with each other.
+
+    python -m benchmarks.bench_structure_prompts [path ...]
+"""
+import argparse
+import argparse as stdlib_argparse
+import asyncio
+import dataclasses
+import inspect
+import json
+import os
+import tempfile
+
+from llm_project_helper.const import STRUCTURE_ANALYZE_PROMPT, STRUCTURE_ANALYZE_PROMPT_SKELETON
+from llm_project_helper.logs import define_log_level
+from llm_project_helper.parser.treesitter_parser import analyze_code_from_file
+from llm_project_helper.provider.rate_limiter import estimate_tokens
+from llm_project_helper.repo_traverser import is_source_file
+from llm_project_helper.treesitter import dumps_result, render_skeleton, SKELETON_DETAILS
+from benchmarks.synthetic import synthetic_java_source
+
+ENCODINGS = ("json", "compact") + SKELETON_DETAILS
+
+
+def default_corpus(tmp_dir):
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(inspect.getfile(analyze_code_from_file))))
+    files = [os.path.join(root, file) for root, _, names in os.walk(package_dir) for file in sorted(names)
+             if file.endswith('.py')]
+    files += [inspect.getfile(module) for module in (stdlib_argparse, dataclasses, inspect, json.encoder)]
+    files.append(inspect.getfile(asyncio.base_events))
+    java_file = os.path.join(tmp_dir, "Synth.java")
+    with open(java_file, 'w') as f:
+        f.write(synthetic_java_source(classes=3, methods_per_class=10))
+    files.append(java_file)
+    return files
+
+
+def expand(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += [os.path.join(root, file) for root, _, names in os.walk(path) for file in sorted(names)
+                      if is_source_file(os.path.join(root, file))]
+        else:
+            files.append(path)
+    return files
+
+
+def prompt_tokens(result, relative_path):
+    return {
+        "json": estimate_tokens(STRUCTURE_ANALYZE_PROMPT + dumps_result(result, indent=4, relative_path=relative_path)),
+        "compact": estimate_tokens(STRUCTURE_ANALYZE_PROMPT + dumps_result(result, relative_path=relative_path)),
+        **{detail: estimate_tokens(STRUCTURE_ANALYZE_PROMPT_SKELETON + render_skeleton(result, detail))
+           for detail in SKELETON_DETAILS},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("paths", nargs="*", help="Source files or directories, by default a sample corpus")
+    args = parser.parse_args()
+    define_log_level(print_level="WARNING", logfile_level="WARNING")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        files = expand(args.paths) if args.paths else default_corpus(tmp_dir)
+        totals = dict.fromkeys(ENCODINGS, 0)
+        print(f"{'file':<40}" + "".join(f"{encoding:>10}" for encoding in ENCODINGS) + "   saved (standard)")
+        for file in files:
+            result = analyze_code_from_file(file)
+            if result is None:
+                continue
+            tokens = prompt_tokens(result, os.path.basename(file))
+            for encoding in ENCODINGS:
+                totals[encoding] += tokens[encoding]
+            print(f"{os.path.basename(file)[-40:]:<40}" + "".join(f"{tokens[encoding]:>10}" for encoding in ENCODINGS)
+                  + f"   {tokens['json'] - tokens['standard']:>7} ({1 - tokens['standard'] / tokens['json']:.0%})")
+
+    print(f"{'total':<40}" + "".join(f"{totals[encoding]:>10}" for encoding in ENCODINGS))
+    for encoding in ENCODINGS[1:]:
+        print(f"    {encoding:<10} {totals[encoding] / totals['json']:6.1%} of the json prompt tokens, "
+              f"{totals['json'] - totals[encoding]} tokens saved")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""
+Prompt and completion tokens per completed summary of large files, when the stub of the chat completions endpoint
+truncates a share of the completions, with the continuation protocol of FileSummaryAnalyzer versus the former one.
+
+The former continuation sent the whole conversation again: the first prompt with the whole structure json, every reply
+so far, and "继续". Its input grows with every continuation. The current one is a single new request with the anchor
+of the summary so far, its last heading and lines, and the part of the structure it does not name yet, as compact json.
+The stub answers with a line per name of the structure in the prompt, so that a continuation covers what is left.
+
+The continued summaries must not repeat a line, nor hold the EOS token. The merge of a continuation that repeats the
+end of the summary is checked on a scripted reply too.
+
+    python -m benchmarks.bench_summary_continuation [--files 10] [--classes 8] [--methods 15] [--truncate-rate 0.5]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+from benchmarks.stub_llm_server import StubLLMServer, estimate_tokens
+from benchmarks.stub_workspace import stub_environment
+from benchmarks.synthetic import synthetic_python_source
+
+EOS_TOKEN = "[|$|EOS|$|]"
+CONTINUE_PHRASE = "继续。总结时务必输出结尾符[|$|EOS|$|]"
+
+
+def history_summary(analyzer, structure_json):
+    # the former FileSummaryAnalyzer.analyze_structure: every continuation resends the conversation so far
+    from llm_project_helper.analyzer.file_summary_analyzer import MAX_REQ
+    json_code = analyzer.structure_for_prompt(structure_json)
+    summary = ""
+    complete = False
+    history = []
+    while complete is False and len(history) < MAX_REQ:
+        prompt = analyzer.base_prompt + json_code if not history else CONTINUE_PHRASE
+        reply = ""
+        finish_reason = None
+        for content, finish_reason in analyzer.api.predict_stream(prompt, history=history, stop=EOS_TOKEN):
+            reply += content
+        complete = finish_reason == "stop"
+        summary += reply[:-len(EOS_TOKEN)] if reply.endswith(EOS_TOKEN) else reply
+        history.append((prompt, reply))
+    return summary, complete
+
+
+class ScriptedAPI:
+    """
+    The predict_stream of a provider that answers with the given (reply, finish_reason), in order
+    """
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.prompts = []
+
+    def predict_stream(self, message, history=[], stop=None):
+        self.prompts.append(message)
+        reply, finish_reason = self.replies.pop(0)
+        for line in reply.splitlines(keepends=True):
+            yield line, None
+        yield "", finish_reason
+
+
+def check_merge():
+    from llm_project_helper.analyzer.file_summary_analyzer import FileSummaryAnalyzer
+    structure = {
+        "relative_path": "bench.py",
+        "imports": [{"import_identifier": "import os", "line_number": 1, "from_module": None}],
+        "classes": {"Bench": {"name": "Bench", "line_number": 3, "end_line_number": 20, "constructors": {},
+                              "methods": {name: {"name": name, "line_number": 4, "end_line_number": 5}
+                                          for name in ("covered_method", "covered", "cut_method", "left_method")}}},
+        "functions": {"left_function": {"name": "left_function", "line_number": 22, "end_line_number": 30}},
+        "interfaces": {},
+    }
+    first = "## 综述\n概述\n\n### 类Bench：\n- `covered_method`: 一\n- `cut_method`: 被截"
+    second = ("### 类Bench：\n- `covered_method`: 一\n- `cut_method`: 二\n- `left_method`: 三\n"
+              "- `left_function`: 四\n## 总结\n结束" + EOS_TOKEN)
+    api = ScriptedAPI([(first, "length"), (second, "stop")])
+    analyzer = FileSummaryAnalyzer(api, detail="json")
+    summary = analyzer.analyze_structure(json.dumps(structure))
+    failures = []
+    expected = ("## 综述\n概述\n\n### 类Bench：\n- `covered_method`: 一\n- `cut_method`: 二\n- `left_method`: 三\n"
+                "- `left_function`: 四\n## 总结\n结束")
+    if summary != expected or not analyzer.complete:
+        failures.append(f"merge: the continued summary is {summary!r}")
+    uncovered = api.prompts[1][api.prompts[1].index("## 还没有写到的结构如下："):]
+    # covered is a part of covered_method, named in the summary, but is not named itself
+    if "covered_method" in uncovered or "left_method" not in uncovered or '"covered"' not in uncovered:
+        failures.append("merge: the continuation prompt does not have only the uncovered structure")
+    return failures
+
+
+def repeated_lines(summary):
+    lines = [line.strip() for line in summary.splitlines() if line.strip()]
+    return len(lines) - len(set(lines))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=10, help="Number of large python files to summarize")
+    parser.add_argument("--classes", type=int, default=8, help="Classes per file")
+    parser.add_argument("--methods", type=int, default=15, help="Methods per class")
+    parser.add_argument("--functions", type=int, default=20, help="Functions per file")
+    parser.add_argument("--truncate-rate", type=float, default=0.5, help="Share of the completions truncated")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir, StubLLMServer(
+            0.001, truncate_rate=args.truncate_rate, answer_names=True, answer_lines=5) as server, stub_environment(
+            tmp_dir, server.base_url):
+        repo_path = os.path.join(tmp_dir, "repos", "bench_repo")
+        from llm_project_helper import RepoTraverser
+        from llm_project_helper.analyzer.file_summary_analyzer import FileSummaryAnalyzer
+        from llm_project_helper.logs import define_log_level
+        define_log_level(print_level="WARNING", logfile_level="WARNING")
+
+        os.makedirs(repo_path)
+        for i in range(args.files):
+            with open(os.path.join(repo_path, f"module_{i}.py"), 'w') as f:
+                f.write(synthetic_python_source(args.classes, args.methods, args.functions).replace(
+                    "Synthetic", f"Module{i}Synthetic").replace("method_", f"module{i}_method_").replace(
+                    "function_", f"module{i}_function_"))
+        analyze_folder = RepoTraverser(repo_path).traverse_repo()
+        structures = []
+        for root, _, files in os.walk(analyze_folder):
+            for file in sorted(files):
+                if file.endswith('.json') and not file.startswith('.'):
+                    with open(os.path.join(root, file), 'r') as f:
+                        structures.append(f.read())
+
+        print(f"{len(structures)} files of {args.classes} classes of {args.methods} methods and {args.functions}"
+              f" functions, {args.truncate_rate:.0%} of the completions truncated")
+        failures = check_merge()
+        for name in ("history", "anchor"):
+            server.reset()
+            completed = 0
+            first_prompt_tokens = 0
+            for i, structure in enumerate(structures):
+                analyzer = FileSummaryAnalyzer(detail="json")
+                first_prompt = analyzer.base_prompt + analyzer.structure_for_prompt(structure)
+                first_prompt_tokens += estimate_tokens(json.dumps([{"role": "user", "content": first_prompt}],
+                                                                  ensure_ascii=False))
+                if name == "history":
+                    summary, complete = history_summary(analyzer, structure)
+                else:
+                    summary, complete = analyzer.analyze_structure(structure), analyzer.complete
+                    if EOS_TOKEN in summary or repeated_lines(summary):
+                        failures.append(f"file {i}: {repeated_lines(summary)} repeated lines in the summary")
+                completed += complete
+            stats = server.stats()
+            per_summary = max(completed, 1)
+            continuations = stats['requests'] - len(structures)
+            continuation_tokens = (stats['prompt_tokens'] - first_prompt_tokens) / max(continuations, 1)
+            print(f"    {name:<8} {stats['requests']:3} requests  {stats['truncated']:3} truncated"
+                  f"  {completed:3} completed  per completed summary: {stats['prompt_tokens'] / per_summary:8.0f}"
+                  f" prompt tokens  {stats['streamed_tokens'] / per_summary:6.0f} completion tokens"
+                  f"  per continuation: {continuation_tokens:7.0f} prompt tokens")
+    if failures:
+        sys.exit("\n".join(failures))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Micro-benchmark of the compiled query cache of the Treesitter extractors.
+
+Parses a large synthetic python file and a large synthetic java file, once with the per-process query cache and once
+compiling every query on each use (the behaviour before the cache), and reports the per-file parse cost.
+
+    python -m benchmarks.bench_treesitter_query_cache
+"""
+import argparse
+import time
+
+from llm_project_helper.const import Language
+from llm_project_helper.logs import define_log_level
+from llm_project_helper.treesitter import Treesitter
+from llm_project_helper.treesitter import treesitter as treesitter_module
+from benchmarks.synthetic import synthetic_python_source, synthetic_java_source
+
+
+def _uncached_query(self, query_str):
+    return self.language.query(query_str)
+
+
+def time_parse(language, file_bytes, repeat):
+    treesitter_parser = Treesitter.create_treesitter(language)
+    treesitter_parser.parse(file_bytes)  # warm up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        treesitter_parser.parse(file_bytes)
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timed parses per case")
+    args = parser.parse_args()
+    define_log_level(print_level="WARNING", logfile_level="WARNING")
+
+    cases = [
+        (Language.PYTHON, synthetic_python_source(classes=40, methods_per_class=25, functions=200).encode()),
+        (Language.JAVA, synthetic_java_source(classes=20, methods_per_class=40).encode()),
+    ]
+    cached_query = Treesitter._query
+    for language, file_bytes in cases:
+        lines = file_bytes.count(b"\n") + 1
+        Treesitter._query = _uncached_query
+        before = time_parse(language, file_bytes, args.repeat)
+        Treesitter._query = cached_query
+        treesitter_module._compiled_queries.clear()
+        after = time_parse(language, file_bytes, args.repeat)
+        print(f"{language.value:<7} {lines:>6} lines  uncached: {before * 1000:8.1f} ms/file  "
+              f"cached: {after * 1000:8.1f} ms/file  speedup: {before / after:5.1f}x")
+
+
+if __name__ == '__main__':
+    main()
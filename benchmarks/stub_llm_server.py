@@ -0,0 +1,376 @@
+"""
+A local stub of the chat completions endpoint of ZhipuAI, for the benchmarks and the tests that go through the LLM
+providers without spending tokens: point ZHIPUAI_BASE_URL at its base_url. It does not import llm_project_helper, so
+that it can be started before the environment the package reads at import time is set.
+
+Every request is answered with a deterministic completion, derived from the hash of the last message, that ends with
+the EOS token of FileSummaryAnalyzer so that a summary takes a single request. Streamed requests get the same
+completion as server-sent events. A batched comment request, whose sections are marked with "### line_no: N", is
+answered with a JSON object of one remark per section; with drop_every=k, every k-th section of the batch is left out
+of the reply. The other answers can be lengthened with answer_lines lines before the EOS token, and after_eos_lines
+lines after it, as a model that does not stop at the token would. With answer_names, they start with a line for every
+name of the structure json in the last message, as a summary that covers the classes, methods and functions would.
+
+The server can also behave like a loaded remote API, all of it deterministic for a given seed:
+
+- latency: the time to the first token, fixed or drawn from a uniform, exponential or lognormal distribution of the
+  given mean;
+- tokens_per_second: the completion is generated at this rate, streamed chunk by chunk;
+- rate_limit_rate / timeout_rate: the share of the requests answered with a 429, or held for timeout_seconds then
+  dropped without a response. A fault is drawn per request and attempt, so that the same request sent again may pass;
+- truncate_rate: the share of the generated completions cut in half, without the EOS token, with the finish_reason
+  "length";
+- responses: canned completions, (regex, content) pairs; the content of the first regex found in the last message is
+  the answer, as is, and is never truncated.
+
+Run it on its own with
+
+    python -m benchmarks.stub_llm_server [--port 8000] [--latency 0.5] [--rate-limit-rate 0.05] ...
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+EOS_TOKEN = "[|$|EOS|$|]"
+BATCH_SECTION = re.compile(r"^### line_no: (\d+)\n(.*?)(?=^### line_no: |\Z)", re.MULTILINE | re.DOTALL)
+STREAM_PIECE = re.compile(r"\S*\s*")
+STRUCTURE_NAME = re.compile(r'"name":\s*"([^"]+)"')
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "exponential", "lognormal")
+
+RATE_LIMITED = "rate_limited"
+TIMEOUT = "timeout"
+# the body of the 429 of the ZhipuAI API
+RATE_LIMIT_ERROR = {"error": {"code": "1302", "message": "您当前使用该API的并发数过高，请降低并发，或联系客服增加限额。"}}
+
+
+def estimate_tokens(text):
+    return len(text) // 3 + 1
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    # the streams stopped early close their connections, and the clients open new ones, many at once
+    request_queue_size = 128
+
+    def handle_error(self, request, client_address):
+        # the clients killed by the benchmarks reset their connections
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+
+class StubLLMServer:
+    """
+    The stub server, run in a background thread: as a context manager, or with start() and close().
+
+    The counters: requests answered, prompt and completion tokens, requests rate limited, timed out, truncated and
+    streamed, and the completion tokens sent in streams before their clients closed them, can be reset between the
+    runs of a benchmark.
+    """
+
+    def __init__(self, latency=0.05, drop_every=0, latency_distribution="fixed", latency_sigma=0.5,
+                 tokens_per_second=0, rate_limit_rate=0.0, timeout_rate=0.0, timeout_seconds=1.0, truncate_rate=0.0,
+                 responses=None, seed=0, host="127.0.0.1", port=0, answer_lines=0, after_eos_lines=0,
+                 answer_names=False):
+        if latency_distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution {latency_distribution}, one of {LATENCY_DISTRIBUTIONS}")
+        self.latency = latency
+        self.drop_every = drop_every
+        self.answer_lines = answer_lines
+        self.after_eos_lines = after_eos_lines
+        self.answer_names = answer_names
+        self.latency_distribution = latency_distribution
+        self.latency_sigma = latency_sigma
+        self.tokens_per_second = tokens_per_second
+        self.rate_limit_rate = rate_limit_rate
+        self.timeout_rate = timeout_rate
+        self.timeout_seconds = timeout_seconds
+        self.truncate_rate = truncate_rate
+        self.responses = [(re.compile(pattern), content) for pattern, content in (responses or [])]
+        self.seed = seed
+        self._lock = threading.Lock()
+        self._attempts = {}
+        self.reset()
+        self.httpd = _HTTPServer((host, port), self._handler_class())
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/api/paas/v4"
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.prompt_tokens = 0
+            self.completion_tokens = 0
+            self.rate_limited = 0
+            self.timeouts = 0
+            self.truncated = 0
+            self.streamed = 0
+            self.streamed_tokens = 0
+            self._attempts = {}
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "rate_limited": self.rate_limited,
+                "timeouts": self.timeouts,
+                "truncated": self.truncated,
+                "streamed": self.streamed,
+                "streamed_tokens": self.streamed_tokens,
+            }
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _random(self, *key):
+        # a generator of its own for every draw, so that the answers do not depend on the order of the requests
+        return random.Random(":".join(str(part) for part in (self.seed,) + key))
+
+    def draw_latency(self, digest, attempt):
+        """
+        Time to the first token of a request, in seconds
+        """
+        if self.latency <= 0 or self.latency_distribution == "fixed":
+            return max(self.latency, 0)
+        rng = self._random(digest, attempt, "latency")
+        if self.latency_distribution == "uniform":
+            return rng.uniform(0, 2 * self.latency)
+        if self.latency_distribution == "exponential":
+            return rng.expovariate(1 / self.latency)
+        # the mean of lognormvariate(mu, sigma) is exp(mu + sigma ** 2 / 2)
+        return rng.lognormvariate(math.log(self.latency) - self.latency_sigma ** 2 / 2, self.latency_sigma)
+
+    def plan(self, body):
+        """
+        The latency of a request and its fault: RATE_LIMITED, TIMEOUT or None, drawn for the attempt of this request
+        """
+        digest = _messages_digest(body["messages"])
+        with self._lock:
+            attempt = self._attempts.get(digest, 0)
+            self._attempts[digest] = attempt + 1
+        draw = self._random(digest, attempt, "fault").random()
+        fault = None
+        if draw < self.rate_limit_rate:
+            fault = RATE_LIMITED
+        elif draw < self.rate_limit_rate + self.timeout_rate:
+            fault = TIMEOUT
+        return self.draw_latency(digest, attempt), fault
+
+    def canned(self, prompt):
+        for pattern, content in self.responses:
+            if pattern.search(prompt):
+                return content
+        return None
+
+    def answer(self, prompt):
+        sections = BATCH_SECTION.findall(prompt)
+        if sections:
+            return json.dumps({line_no: f"stub answer {hashlib.sha256(code.encode()).hexdigest()[:12]}"
+                               for i, (line_no, code) in enumerate(sections, 1)
+                               if not self.drop_every or i % self.drop_every}, ensure_ascii=False)
+        digest = hashlib.sha256(prompt.encode()).hexdigest()[:12]
+        lines = [f"stub answer {digest}"]
+        if self.answer_names:
+            lines += [f"- `{name}`: stub answer {digest}" for name in dict.fromkeys(STRUCTURE_NAME.findall(prompt))]
+        lines += [f"- line {i} of the stub answer {digest}" for i in range(self.answer_lines)]
+        tail = "".join(f"\n- line {i} after the end of the stub answer" for i in range(self.after_eos_lines))
+        return "\n".join(lines) + f"\n{EOS_TOKEN}" + tail
+
+    def completion(self, body):
+        """
+        The chat completion of a request, as the JSON object of the API
+        """
+        prompt = body["messages"][-1]["content"]
+        digest = _messages_digest(body["messages"])
+        canned = self.canned(prompt)
+        content = canned if canned is not None else self.answer(prompt)
+        finish_reason = "stop"
+        truncated = (canned is None and self.truncate_rate > 0
+                     and self._random(digest, "truncate").random() < self.truncate_rate)
+        if truncated:
+            content = content.replace(EOS_TOKEN, "")
+            content = content[:len(content) // 2]
+            finish_reason = "length"
+        prompt_tokens = estimate_tokens(json.dumps(body["messages"], ensure_ascii=False))
+        completion_tokens = estimate_tokens(content)
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.truncated += bool(truncated)
+        return {
+            "id": digest[:12],
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{"index": 0, "finish_reason": finish_reason,
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    def stream_events(self, response):
+        """
+        The server-sent events of a completion, with the content each of them carries
+        """
+        choice = response["choices"][0]
+        pieces = [piece for piece in STREAM_PIECE.findall(choice["message"]["content"]) if piece] or [""]
+        for i, piece in enumerate(pieces):
+            last = i == len(pieces) - 1
+            chunk = {
+                "id": response["id"],
+                "created": response["created"],
+                "model": response["model"],
+                "choices": [{"index": 0, "finish_reason": choice["finish_reason"] if last else None,
+                             "delta": {"content": piece}}],
+            }
+            if last:
+                chunk["usage"] = response["usage"]
+            yield piece, f"data: {json.dumps(chunk)}\n\n".encode()
+        yield "", b"data: [DONE]\n\n"
+
+    def _generation_time(self, text):
+        if self.tokens_per_second <= 0:
+            return 0
+        return estimate_tokens(text) / self.tokens_per_second
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # the headers and the body are sent separately: without TCP_NODELAY, the delayed ACKs of the client
+            # add ~40 ms to every request on a kept-alive connection
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                length = int(self.headers["Content-Length"])
+                data = self.rfile.read(length)
+                if len(data) < length:
+                    # the client went away while sending the request, e.g. a process killed by a failure
+                    self.close_connection = True
+                    return
+                body = json.loads(data)
+                latency, fault = server.plan(body)
+                time.sleep(latency)
+                if fault == RATE_LIMITED:
+                    with server._lock:
+                        server.rate_limited += 1
+                    self.send_json(429, RATE_LIMIT_ERROR, {"Retry-After": "1"})
+                    return
+                if fault == TIMEOUT:
+                    with server._lock:
+                        server.timeouts += 1
+                    time.sleep(server.timeout_seconds)
+                    # dropped without a response, as by a proxy giving up on the upstream
+                    self.close_connection = True
+                    return
+                response = server.completion(body)
+                if body.get("stream"):
+                    with server._lock:
+                        server.streamed += 1
+                    self.send_stream(server.stream_events(response))
+                    return
+                time.sleep(server._generation_time(response["choices"][0]["message"]["content"]))
+                self.send_json(200, response)
+
+            def send_json(self, status, payload, headers=None):
+                payload = json.dumps(payload, ensure_ascii=False).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def send_stream(self, events):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                if server.tokens_per_second <= 0:
+                    events = list(events)
+                    with server._lock:
+                        server.streamed_tokens += sum(estimate_tokens(piece) for piece, _ in events if piece)
+                    payload = b"".join(event for _, event in events)
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                    return
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for piece, event in events:
+                    time.sleep(server._generation_time(piece))
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(event), event))
+                    self.wfile.flush()
+                    with server._lock:
+                        server.streamed_tokens += estimate_tokens(piece) if piece else 0
+                self.wfile.write(b"0\r\n\r\n")
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def _messages_digest(messages):
+    return hashlib.sha256(json.dumps(messages, ensure_ascii=False, sort_keys=True).encode()).hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stub of the ZhipuAI chat completions endpoint")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.05, help="Mean time to the first token, in seconds")
+    parser.add_argument("--latency-distribution", choices=LATENCY_DISTRIBUTIONS, default="fixed")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Sigma of the lognormal distribution")
+    parser.add_argument("--tokens-per-second", type=float, default=0, help="Generation speed, 0 is instantaneous")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of the requests answered with 429")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="Share of the requests dropped")
+    parser.add_argument("--timeout-seconds", type=float, default=1.0, help="Time a dropped request is held")
+    parser.add_argument("--truncate-rate", type=float, default=0.0, help="Share of the completions truncated")
+    parser.add_argument("--responses", help="JSON file of canned responses: an object of regex to content")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    responses = None
+    if args.responses:
+        with open(args.responses, 'r', encoding='utf-8') as f:
+            responses = list(json.load(f).items())
+    server = StubLLMServer(args.latency, latency_distribution=args.latency_distribution,
+                           latency_sigma=args.latency_sigma, tokens_per_second=args.tokens_per_second,
+                           rate_limit_rate=args.rate_limit_rate, timeout_rate=args.timeout_rate,
+                           timeout_seconds=args.timeout_seconds, truncate_rate=args.truncate_rate,
+                           responses=responses, seed=args.seed, host=args.host, port=args.port)
+    print(f"ZHIPUAI_BASE_URL={server.base_url}", flush=True)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(json.dumps(server.stats()))
+
+
+if __name__ == '__main__':
+    main()
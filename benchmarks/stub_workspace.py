@@ -0,0 +1,64 @@
+"""
+The workspace and provider settings of the benchmarks run against StubLLMServer, and the outputs they compare.
+
+llm_project_helper reads its settings when it is imported, and the providers when they are created: a benchmark
+imports and runs them inside stub_environment, which puts the settings in os.environ and restores it on exit. The ones
+that run main.py pass stub_env to the subprocess instead.
+"""
+import contextlib
+import os
+
+STUB_API_KEY = "bench.secret"
+# the files of a workspace written by the summaries and the comments
+OUTPUT_SUFFIXES = ('.analyze.md', '.comments.json')
+
+
+def stub_env(tmp_dir, base_url, llm_cache=False, **settings):
+    """
+    The environment variables of a run with its workspace under tmp_dir/root, its repos under tmp_dir/repos, and the
+    stub endpoint at base_url, without the response cache unless llm_cache.
+
+    :param settings: other LLM_PROJECT_HELPER_ settings, by their lower case name, e.g. section_dedup=False
+    """
+    env = {
+        "LLM_PROJECT_HELPER_PROJECT_ROOT": os.path.join(tmp_dir, "root"),
+        "LOCAL_REPO_FOLDER": os.path.join(tmp_dir, "repos"),
+        "ZHIPUAI_BASE_URL": base_url,
+        "ZHIPUAI_API_KEY": STUB_API_KEY,
+        "LLM_PROJECT_HELPER_LLM_CACHE": str(llm_cache),
+    }
+    env.update({f"LLM_PROJECT_HELPER_{name.upper()}": str(value) for name, value in settings.items()})
+    return env
+
+
+@contextlib.contextmanager
+def stub_environment(tmp_dir, base_url, llm_cache=False, **settings):
+    """
+    os.environ with the variables of stub_env for the duration of the block, as it was before after it
+    """
+    env = stub_env(tmp_dir, base_url, llm_cache, **settings)
+    saved = {name: os.environ.get(name) for name in env}
+    os.environ.update(env)
+    try:
+        yield env
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def read_outputs(workspace, suffixes=OUTPUT_SUFFIXES):
+    """
+    The content of the files of a workspace ending with one of the suffixes, by their path relative to it, the
+    hidden ones (the manifest, the job state) left out
+    """
+    outputs = {}
+    for root, _, files in os.walk(workspace):
+        for file in files:
+            if file.endswith(suffixes) and not file.startswith('.'):
+                path = os.path.join(root, file)
+                with open(path, 'r', encoding='utf-8') as f:
+                    outputs[os.path.relpath(path, workspace)] = f.read()
+    return outputs
@@ -0,0 +1,149 @@
+"""
+Generators of large synthetic source files for the benchmarks.
+"""
+
+
+def synthetic_python_source(classes=20, methods_per_class=20, functions=100):
+    """
+    Returns a python module with imports, global variables, classes with decorated and nested methods, functions and a
+    main block.
+    """
+    lines = [
+        "import os",
+        "import json",
+        "from typing import Optional",
+        "from collections import OrderedDict, defaultdict",
+        "",
+        "GLOBAL_LIMIT = 100",
+        "GLOBAL_NAME = 'synthetic'",
+        "",
+    ]
+    for c in range(classes):
+        lines += [
+            "",
+            f"class Synthetic{c}:",
+            f'    """Docstring of Synthetic{c}."""',
+            "    counter = 0",
+            f"    label = 'class {c}'",
+            "",
+        ]
+        for m in range(methods_per_class):
+            if m % 5 == 0:
+                lines.append("    @staticmethod")
+                lines.append(f"    def method_{m}(a, b, c=None):")
+            elif m % 7 == 0:
+                lines.append(f"    async def method_{m}(self, a, b):")
+            else:
+                lines.append(f"    def method_{m}(self, a, b):")
+            lines += [
+                f'        """Compute value {m}."""',
+                "        total = a + b",
+                "        scaled = total * 2",
+                "        def helper(x):",
+                "            inner = x + 1",
+                "            return inner",
+                "        for i in range(10):",
+                "            total += helper(i)",
+                "        return total + scaled",
+                "",
+            ]
+    for f in range(functions):
+        if f % 4 == 0:
+            lines.append("@decorator")
+        lines += [
+            f"def function_{f}(x, y, z):",
+            f'    """Function {f}."""',
+            "    result = x * y",
+            "    other = result - z",
+            "    if other > GLOBAL_LIMIT:",
+            "        return other",
+            "    return result",
+            "",
+        ]
+    lines += [
+        "",
+        "if __name__ == '__main__':",
+        "    print(function_0(1, 2, 3))",
+        "",
+    ]
+    return "\n".join(lines)
+
+
+def synthetic_java_source(classes=10, methods_per_class=30, inner_classes=2):
+    """
+    Returns a java compilation unit with imports, an interface, and classes with fields, constructors, overloaded and
+    annotated methods, inner classes and anonymous classes.
+    """
+    lines = [
+        "package com.example.synthetic;",
+        "",
+        "import java.util.List;",
+        "import java.util.ArrayList;",
+        "import java.util.function.Function;",
+        "",
+        "interface SyntheticService {",
+        "    int LIMIT = 10;",
+        "    void serve(String request);",
+        "    int count(List<String> items, int offset);",
+        "}",
+        "",
+    ]
+    for c in range(classes):
+        lines += [
+            f"public class Synthetic{c} implements SyntheticService {{",
+            "    private int counter = 0;",
+            "    private static final String NAME = \"synthetic\";",
+            "",
+            f"    public Synthetic{c}() {{",
+            "        this.counter = 1;",
+            "    }",
+            "",
+            f"    public Synthetic{c}(int counter) {{",
+            "        this.counter = counter;",
+            "    }",
+            "",
+        ]
+        for m in range(methods_per_class):
+            annotation = ["    @Override"] if m % 6 == 0 else []
+            lines += annotation + [
+                f"    public int method{m % (methods_per_class // 2 or 1)}(int a, String b) {{",
+                "        int total = a + b.length();",
+                "        List<String> items = new ArrayList<>();",
+                "        for (int i = 0; i < total; i++) {",
+                "            items.add(b + i);",
+                "        }",
+                "        return total + items.size();",
+                "    }",
+                "",
+            ]
+        lines += [
+            "    public void serve(String request) {",
+            "        Runnable task = new Runnable() {",
+            "            @Override",
+            "            public void run() {",
+            "                int local = request.length();",
+            "                System.out.println(local);",
+            "            }",
+            "        };",
+            "        task.run();",
+            "    }",
+            "",
+            "    public int count(List<String> items, int offset) {",
+            "        return items.size() + offset;",
+            "    }",
+            "",
+        ]
+        for i in range(inner_classes):
+            lines += [
+                f"    static class Inner{i} {{",
+                "        private int value;",
+                "",
+                "        public int compute(int x) {",
+                "            int doubled = x * 2;",
+                "            return doubled + value;",
+                "        }",
+                "    }",
+                "",
+            ]
+        lines += ["}", ""]
+    return "\n".join(lines)
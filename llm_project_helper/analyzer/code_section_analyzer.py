@@ -1,91 +1,381 @@
+import asyncio
 import json
+import re
+from collections import Counter
 from loguru import logger
-from llm_project_helper.provider import ZhipuAIAPI
+from llm_project_helper import utils
+from llm_project_helper.provider import shared_zhipuai_api
+from llm_project_helper.provider.rate_limiter import estimate_tokens
+from llm_project_helper.analyzer.map_reduce import async_reduce_hierarchically, reduce_hierarchically
 from llm_project_helper.const import CODE_SECTION_PROMPT_JSON as PROMPT, CODE_CLASS_PROMPT_JSON
+from llm_project_helper.const import CODE_SECTION_BATCH_PROMPT_JSON, COMMENT_BATCH_TOKENS, COMMENT_REMARK_TOKENS
+from llm_project_helper.const import CODE_CLASS_REMARKS_PROMPT, MAX_PROMPT_TOKENS
+
+
+_BATCH_REMARK = re.compile(r'"(\d+)"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+def parse_batch_remarks(reply):
+    """
+    The remarks of a batched reply, by line_no. A reply that is not valid JSON, e.g. truncated, still gives its
+    complete entries.
+    """
+    start, end = reply.find('{'), reply.rfind('}')
+    if start != -1 and end > start:
+        try:
+            remarks = json.loads(reply[start:end + 1])
+        except json.JSONDecodeError:
+            remarks = None
+        if isinstance(remarks, dict):
+            return {int(line_no): remark for line_no, remark in remarks.items()
+                    if line_no.strip().isdigit() and isinstance(remark, str) and remark.strip()}
+    remarks = {}
+    for line_no, remark in _BATCH_REMARK.findall(reply):
+        try:
+            remarks[int(line_no)] = json.loads(f'"{remark}"')
+        except json.JSONDecodeError:
+            continue
+    return remarks
 
 
 class CodeSectionAnalyzer:
-    def __init__(self):
-        self.api = ZhipuAIAPI()
+    """
+    :param batch_tokens: if not 0, the functions and methods of a file are commented in batches of about this many
+                         tokens, one request per batch answering a JSON object keyed by line_no, instead of one request
+                         per section. The sections missing from a reply are requested alone.
+    :param section_index: the SectionIndex shared by the files of a repo, to request the sections identical to one
+                          of another file (or of the same file) only once
+    :param checkpoint: called with every comment whose remark was requested, as soon as the remark arrives, e.g. to
+                       commit it to the JobStateStore
+    :param max_prompt_tokens: if not 0, the ceiling of the estimated input tokens of a class request: the remarks of
+                              the methods of a class too large for it are summarized chunk by chunk, level after level,
+                              until they fit (see map_reduce.reduce_hierarchically)
+    """
+
+    def __init__(self, api=None, batch_tokens=COMMENT_BATCH_TOKENS, section_index=None, checkpoint=None,
+                 max_prompt_tokens=MAX_PROMPT_TOKENS):
+        self.api = api if api is not None else shared_zhipuai_api()
+        self.batch_tokens = batch_tokens
+        self.section_index = section_index
+        self.checkpoint = checkpoint
+        self.max_prompt_tokens = max_prompt_tokens
+        # the sections of the file taking the remark of an identical section
+        self.duplicates = []
         self.prompt = PROMPT
+        self.class_prompt = CODE_CLASS_PROMPT_JSON
+        self.batch_prompt_template = CODE_SECTION_BATCH_PROMPT_JSON
+        # remarks of the previous run, keyed by the fingerprint of their section
+        self.previous_remarks = {}
+        self.llm_calls = 0
+        self.reused_remarks = 0
+        self.batched_sections = 0
+        self.retried_sections = 0
+        self.deduplicated_sections = 0
+        # the file whose sections are read, and its SourceLines
+        self.source_file = None
+        self.source_lines = None
 
-    def analyze_code_section(self, json_file_path, summary_file_path, code_file_path):
-        comments = []
+    def prepare(self, summary_file_path, previous_comments=None, summary=None):
+        """
+        Reset the state of the analyzer for a new file: index the previous comments, and put the summary of the file
+        in the prompts.
+
+        :param summary: the summary of the file if it is at hand, instead of reading summary_file_path
+        """
+        self.previous_remarks = self.index_previous_comments(previous_comments)
+        self.llm_calls = 0
+        self.reused_remarks = 0
+        self.batched_sections = 0
+        self.retried_sections = 0
+        self.deduplicated_sections = 0
+        self.duplicates = []
+        # the file may have changed since the previous one read by this analyzer
+        self.source_file = None
+        self.source_lines = None
         # 1. replace the markdown part in the prompt with the summary
-        with open(summary_file_path, 'r') as file:
-            summary = file.read()
-            logger.debug(f"Summary is: \n{summary}")
-            self.prompt = self.prompt.replace("```markdown```", "```markdown\n" + summary + "\n```")
-            class_prompt = CODE_CLASS_PROMPT_JSON.replace("```markdown```", "```markdown\n" + summary + "\n```")
+        if summary is None:
+            with open(summary_file_path, 'r') as file:
+                summary = file.read()
+        else:
+            # the newlines of the summary as read back from the .analyze.md
+            summary = summary.replace("\r\n", "\n").replace("\r", "\n")
+        logger.debug(f"Summary is: \n{summary}")
+        self.prompt = PROMPT.replace("```markdown```", "```markdown\n" + summary + "\n```")
+        self.class_prompt = CODE_CLASS_PROMPT_JSON.replace("```markdown```", "```markdown\n" + summary + "\n```")
+        self.batch_prompt_template = CODE_SECTION_BATCH_PROMPT_JSON.replace(
+            "```markdown```", "```markdown\n" + summary + "\n```")
+
+    def read_section(self, code_file_path, start_line, end_line, programming_language):
+        """
+        Returns the code of a section and its fingerprint.
+        """
+        lines = self.read_specific_lines(code_file_path, start_line, end_line)
+        code = "\n".join(lines)
+        logger.debug(f"Code is: \n{code}")
+        return code, utils.section_fingerprint(code, programming_language)
+
+    def section_prompt(self, code, class_pesudo_code=""):
+        # 4. Add prompt to get the result
+        prompt = self.prompt + "\n" + "```\n" + class_pesudo_code + code + "\n```"
+        logger.debug(f"Prompt is: \n{prompt}")
+        return prompt
+
+    def class_section_prompt(self, class_descendant_remarks):
+        cur_class_prompt = self.class_prompt.replace("[|$|class_descendant_remarks|$|]", class_descendant_remarks)
+        logger.debug(f"Class Prompt is: \n{cur_class_prompt}")
+        return cur_class_prompt
+
+    def analyze_code_section(self, json_file_path, summary_file_path, code_file_path, previous_comments=None,
+                             structure=None, summary=None):
+        """
+        Comment every function, method and class of a file, section by section.
+
+        Every comment carries the fingerprint of the normalized source of its section. When the comments of a previous
+        run are given, the remark of a section whose fingerprint did not change is carried over to its new line_no
+        instead of requesting the LLM again.
+
+        :param previous_comments: the "comments" of an existing .comments.json of the file, or None
+        :param structure: the structure json of the file if it is at hand, instead of reading json_file_path
+        :param summary: the summary of the file if it is at hand, instead of reading summary_file_path
+        :return: a list of {"line_no", "remark", "fingerprint"}
+        """
+        self.prepare(summary_file_path, previous_comments, summary)
+        comments, sections, classes = self.collect_sections(json_file_path, code_file_path, structure)
+
+        # 5. request LLM to get the remarks of the functions and methods
+        for batch in self.batch_sections(sections):
+            self.comment_batch(batch)
+        self.resolve_duplicates()
+
+        # 8. Get class summary info, from the remarks of its methods
+        for class_comment, method_comments, requested in classes:
+            if requested:
+                try:
+                    class_comment["remark"] = self.request_remark(self.class_remarks_prompt(method_comments))
+                finally:
+                    self.record(class_comment)
+        self.resolve_duplicates()
+
+        self.log_calls(code_file_path)
+        # 7. Return the comments
+        return comments
+
+    def collect_sections(self, json_file_path, code_file_path, structure=None):
+        """
+        Read the sections of a file, and carry over the remarks of the previous run, in the order of the comments.
+
+        :return: the comments of the file, whose remark is None until it is requested; the functions and methods to
+                 request, as (comment, code, class_pesudo_code); and the classes, as (class_comment, method_comments,
+                 whether the class has to be requested)
+        """
+        comments = []
+        sections = []
+        classes = []
+        programming_language = utils.get_programming_language(utils.get_file_extension(code_file_path))
 
         # 2. Get every section(methods, functions) of the code through the json_file_path
-        with open(json_file_path, 'r') as file:
-            data = json.load(file)
+        if structure is None:
+            with open(json_file_path, 'r') as file:
+                data = json.load(file)
+        else:
+            data = json.loads(structure)
 
         if 'functions' in data:
-            function_pairs = self.process_functions(data['functions'])
             # 3. open code_file_path and only read relevant lines
-            for start_line, end_line in function_pairs:
-                lines = self.read_specific_lines(code_file_path, start_line, end_line)
-                code = "\n".join(lines)
-                logger.debug(f"Code is: \n{code}")
-
-                # 4. Add prompt to get the result
-                prompt = self.prompt + "\n" + "```\n" + code + "\n```"
-                logger.debug(f"Prompt is: \n{prompt}")
-
-                # 5. request LLM to get remarks
-                chat_result = self.api.predict(prompt)
-                remark = chat_result.content
-                logger.info(f"Remark returned from LLM is: \n{remark}")
-                # 6. add remarks and line numbers to the comments
-                comments.append({"line_no": start_line, "remark": remark})
+            for start_line, end_line in self.process_functions(data['functions']):
+                code, fingerprint = self.read_section(code_file_path, start_line, end_line, programming_language)
+                comment = {"line_no": start_line, "remark": self.reuse_remark(fingerprint), "fingerprint": fingerprint}
+                comments.append(comment)
+                if self.needs_request(comment):
+                    sections.append((comment, code, ""))
 
         if 'classes' in data:
             for class_name, class_details in data['classes'].items():
                 logger.info(f"Class: {class_name}")
                 class_pesudo_code = f"Class {class_name}:\n"
-                class_descendant_remarks = ""
-                # 3. open code_file_path and only read relevant lines
+                # the class source contains its methods, so an unchanged class has unchanged methods as well
+                _, class_fingerprint = self.read_section(
+                    code_file_path, class_details["line_number"], class_details["end_line_number"],
+                    programming_language)
+                method_comments = []
                 if 'methods' in class_details:
-                    method_pairs = self.process_functions(class_details['methods'])
-                    for start_line, end_line in method_pairs:
-                        lines = self.read_specific_lines(code_file_path, start_line, end_line)
-                        code = "\n".join(lines)
-                        logger.debug(f"Code is: \n{code}")
-
-                        # 4. Add prompt to get the result
-                        prompt = self.prompt + "\n" + "```\n" + class_pesudo_code + code + "\n```"
-                        logger.debug(f"Prompt is: \n{prompt}")
-
-                        # 5. request LLM to get remarks
-                        chat_result = self.api.predict(prompt)
-                        remark = chat_result.content
-                        logger.info(f"Remark returned from LLM is: \n{remark}")
-                        # 6. add remarks and line numbers to the comments
-                        comments.append({"line_no": start_line, "remark": remark})
-                        
-                        # 7. affliate info in class_descendant_remarks
-                        class_descendant_remarks += f"从 {start_line} 开始的方法:\n{remark}\n"
-
-                # 8. Get class summary info
-                cur_class_prompt = class_prompt.replace(
-                    "[|$|class_descendant_remarks|$|]", class_descendant_remarks)
-                logger.debug(f"Class Prompt is: \n{cur_class_prompt}")
-                class_chat_result = self.api.predict(cur_class_prompt)
-                class_remark = class_chat_result.content
-                logger.info(f"Class Remark returned from LLM is: \n{class_remark}")
-                # 9. add class remarks and line numbers to the comments
-                comments.append({"line_no": class_details["line_number"], "remark": class_remark})
+                    for start_line, end_line in self.process_functions(class_details['methods']):
+                        code, fingerprint = self.read_section(code_file_path, start_line, end_line,
+                                                              programming_language)
+                        comment = {"line_no": start_line, "remark": self.reuse_remark(fingerprint),
+                                   "fingerprint": fingerprint}
+                        comments.append(comment)
+                        method_comments.append(comment)
+                        if self.needs_request(comment):
+                            sections.append((comment, code, class_pesudo_code))
+                class_comment = {"line_no": class_details["line_number"],
+                                 "remark": self.reuse_remark(class_fingerprint), "fingerprint": class_fingerprint}
+                comments.append(class_comment)
+                classes.append((class_comment, method_comments, self.needs_request(class_comment)))
 
+        return comments, sections, classes
 
-        # 7. Return the comments
-        return comments
+    def needs_request(self, comment):
+        """
+        Whether the remark of a section has to be requested: not if it was carried over from the previous run, or if an
+        identical section of the repo has a remark or is being requested
+        """
+        if comment["remark"] is not None:
+            if self.section_index is not None:
+                # the copies of the section take the carried over remark as well
+                self.section_index.seed([comment])
+            return False
+        if self.section_index is None or self.section_index.claim(comment):
+            return True
+        self.deduplicated_sections += 1
+        self.duplicates.append(comment)
+        return False
+
+    def record(self, comment):
+        if self.section_index is not None:
+            self.section_index.record(comment)
+        if self.checkpoint is not None and comment["remark"] is not None:
+            self.checkpoint(comment)
+
+    def resolve_duplicates(self):
+        if self.section_index is not None:
+            self.section_index.resolve(self.duplicates)
+
+    def batch_sections(self, sections):
+        """
+        Split the sections to request into batches, each requested at once. Without a batch_tokens budget, every
+        section is requested alone, with section_prompt.
+
+        Otherwise consecutive sections are packed while their code, plus COMMENT_REMARK_TOKENS for the remark of each,
+        fits in batch_tokens. A section larger than the budget is requested alone, and so are the sections starting on
+        the same line as another one, e.g. the methods of a one-line java class, as the reply is keyed by line_no.
+        """
+        if not self.batch_tokens:
+            return [[section] for section in sections]
+        line_counts = Counter(comment["line_no"] for comment, _, _ in sections)
+        batches = []
+        batch = []
+        batch_tokens = 0
+        for section in sections:
+            comment, code, class_pesudo_code = section
+            if line_counts[comment["line_no"]] > 1:
+                batches.append([section])
+                continue
+            tokens = estimate_tokens(class_pesudo_code + code) + COMMENT_REMARK_TOKENS
+            if batch and batch_tokens + tokens > self.batch_tokens:
+                batches.append(batch)
+                batch = []
+                batch_tokens = 0
+            batch.append(section)
+            batch_tokens += tokens
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def batch_prompt(self, batch):
+        parts = [f"### line_no: {comment['line_no']}\n```\n{class_pesudo_code}{code}\n```\n"
+                 for comment, code, class_pesudo_code in batch]
+        prompt = self.batch_prompt_template + "\n" + "\n".join(parts)
+        logger.debug(f"Batch prompt is: \n{prompt}")
+        return prompt
+
+    def apply_batch_reply(self, batch, reply):
+        """
+        Set the remarks of the batch found in the reply of the LLM, and returns the sections it missed
+        """
+        remarks = parse_batch_remarks(reply)
+        missing = []
+        for section in batch:
+            comment = section[0]
+            remark = remarks.get(comment["line_no"])
+            if remark is None:
+                missing.append(section)
+            else:
+                comment["remark"] = remark
+        self.batched_sections += len(batch) - len(missing)
+        self.retried_sections += len(missing)
+        if missing:
+            logger.warning(f"{len(missing)} of {len(batch)} sections missing from the batched reply, "
+                           f"requested one by one")
+        return missing
+
+    def comment_batch(self, batch):
+        try:
+            remaining = batch
+            if len(batch) > 1:
+                remaining = self.apply_batch_reply(batch, self.request_remark(self.batch_prompt(batch)))
+            for comment, code, class_pesudo_code in remaining:
+                comment["remark"] = self.request_remark(self.section_prompt(code, class_pesudo_code))
+        finally:
+            for comment, _, _ in batch:
+                self.record(comment)
+
+    def class_descendant_remarks(self, method_comments):
+        # 7. affliate info in class_descendant_remarks
+        return "".join(f"从 {comment['line_no']} 开始的方法:\n{comment['remark']}\n"
+                       for comment in method_comments)
+
+    def class_remarks_prompt(self, method_comments):
+        """
+        The prompt of a class, with the remarks of its methods, reduced under the max_prompt_tokens ceiling if any
+        """
+        remarks = reduce_hierarchically([self.class_descendant_remarks([comment]) for comment in method_comments],
+                                        self.class_remarks_fit, self.remarks_budget(), self._reduce_remarks)
+        return self.class_section_prompt("".join(remarks))
+
+    def class_remarks_fit(self, remarks):
+        return (not self.max_prompt_tokens
+                or estimate_tokens(self.class_prompt) + estimate_tokens("".join(remarks)) <= self.max_prompt_tokens)
+
+    def remarks_budget(self):
+        return self.max_prompt_tokens - estimate_tokens(CODE_CLASS_REMARKS_PROMPT)
+
+    def remarks_prompt(self, remarks):
+        return CODE_CLASS_REMARKS_PROMPT + "".join(remarks)
+
+    def _reduce_remarks(self, remarks):
+        # the summary of a chunk of remarks, in place of them
+        return f"若干方法的概括:\n{self.request_remark(self.remarks_prompt(remarks))}\n"
+
+    def log_calls(self, code_file_path):
+        logger.info(f"Comments of {code_file_path}: {self.llm_calls} requested from LLM, {self.reused_remarks} reused, "
+                    f"{self.batched_sections} from batched requests, {self.retried_sections} retried alone, "
+                    f"{self.deduplicated_sections} from identical sections")
+
+    def index_previous_comments(self, previous_comments):
+        """
+        Index the comments of a previous run by fingerprint. Comments written before fingerprints existed are ignored.
+        """
+        previous_remarks = {}
+        for comment in previous_comments or []:
+            fingerprint = comment.get("fingerprint")
+            if fingerprint:
+                previous_remarks.setdefault(fingerprint, []).append(comment["remark"])
+        return previous_remarks
+
+    def reuse_remark(self, fingerprint):
+        """
+        Take the remark of a previous run for a section with the same fingerprint, or None if there is none.
+        """
+        remarks = self.previous_remarks.get(fingerprint)
+        if not remarks:
+            return None
+        self.reused_remarks += 1
+        return remarks.pop(0)
+
+    def request_remark(self, prompt):
+        chat_result = self.api.predict(prompt)
+        self.llm_calls += 1
+        remark = chat_result.content
+        logger.info(f"Remark returned from LLM is: \n{remark}")
+        return remark
 
     def read_specific_lines(self, filename, start_line, end_line):
         """
         Reads specific lines from a file, given the start and end line numbers.
 
+        The file is read once and its lines indexed, the sections of the same file being sliced from the index.
+
         Parameters:
         - filename: The path to the file.
         - start_line: The starting line number (inclusive).
@@ -94,23 +384,10 @@ class CodeSectionAnalyzer:
         Returns:
         - A list of strings, where each string is a line from the specified range.
         """
-        # Ensure start and end lines are positive and start_line is less than end_line
-        if start_line < 1 or end_line < start_line:
-            raise ValueError("Start line must be >= 1 and end line must be >= start line.")
-
-        # Adjusting line numbers to zero-based indexing
-        start_line -= 1
-        end_line -= 1
-
-        lines = []  # List to store the lines
-        with open(filename, 'r') as file:
-            for i, line in enumerate(file):
-                if i > end_line:  # Stop reading if past the end line
-                    break
-                if i >= start_line:
-                    lines.append(line.rstrip())  # Add line to list, stripping newline characters
-
-        return lines
+        if filename != self.source_file:
+            self.source_lines = utils.SourceLines.from_file(filename)
+            self.source_file = filename
+        return self.source_lines.lines(start_line, end_line)
 
     def process_functions(self, functions):
         res = []
@@ -121,3 +398,85 @@ class CodeSectionAnalyzer:
                 # contstruct a line_no, end_line_no pair
                 res.append((line_number, end_line_number))
         return res
+
+
+class AsyncCodeSectionAnalyzer(CodeSectionAnalyzer):
+    """
+    asyncio version of CodeSectionAnalyzer, on an AsyncZhipuAIAPI.
+
+    The sections (or batches of sections) of a file are requested concurrently, except that a class is requested once
+    all its methods have their remark, as they are part of its prompt. The comments, in the same order, and the
+    remarks carried over from a previous run are the same as the ones of CodeSectionAnalyzer.
+    """
+
+    def __init__(self, api, batch_tokens=COMMENT_BATCH_TOKENS, section_index=None, checkpoint=None,
+                 max_prompt_tokens=MAX_PROMPT_TOKENS):
+        super().__init__(api, batch_tokens, section_index, checkpoint, max_prompt_tokens)
+
+    async def analyze_code_section(self, json_file_path, summary_file_path, code_file_path, previous_comments=None,
+                                   structure=None, summary=None):
+        # the remarks are carried over in the same order as CodeSectionAnalyzer, before any request is sent
+        self.prepare(summary_file_path, previous_comments, summary)
+        comments, sections, classes = self.collect_sections(json_file_path, code_file_path, structure)
+
+        # the request of the batch of every section, or the wait for the remark of an identical section
+        batch_requests = {}
+        for batch in self.batch_sections(sections):
+            request = asyncio.ensure_future(self.comment_batch(batch))
+            for comment, _, _ in batch:
+                batch_requests[id(comment)] = request
+        for comment in self.duplicates:
+            batch_requests[id(comment)] = asyncio.ensure_future(self.section_index.wait_remark(comment))
+        class_requests = [
+            self._comment_class(class_comment, method_comments,
+                                {batch_requests[id(comment)] for comment in method_comments
+                                 if id(comment) in batch_requests}, requested)
+            for class_comment, method_comments, requested in classes]
+
+        await asyncio.gather(*set(batch_requests.values()), *class_requests)
+        self.log_calls(code_file_path)
+        return comments
+
+    async def comment_batch(self, batch):
+        # the copies of the sections, in this file or another, are woken up even if a request fails
+        try:
+            remaining = batch
+            if len(batch) > 1:
+                remaining = self.apply_batch_reply(batch, await self.request_remark(self.batch_prompt(batch)))
+            await asyncio.gather(*[self._comment(comment, self.section_prompt(code, class_pesudo_code))
+                                   for comment, code, class_pesudo_code in remaining])
+        finally:
+            for comment, _, _ in batch:
+                self.record(comment)
+
+    async def _comment(self, comment, prompt):
+        comment["remark"] = await self.request_remark(prompt)
+
+    async def _comment_class(self, class_comment, method_comments, method_requests, requested):
+        await asyncio.gather(*method_requests)
+        if class_comment["remark"] is not None:
+            return
+        if not requested:
+            await self.section_index.wait_remark(class_comment)
+            return
+        try:
+            class_comment["remark"] = await self.request_remark(await self.class_remarks_prompt(method_comments))
+        finally:
+            self.record(class_comment)
+
+    async def class_remarks_prompt(self, method_comments):
+        # the chunks of every level of the reduce are requested concurrently
+        remarks = await async_reduce_hierarchically(
+            [self.class_descendant_remarks([comment]) for comment in method_comments], self.class_remarks_fit,
+            self.remarks_budget(), self._reduce_remarks)
+        return self.class_section_prompt("".join(remarks))
+
+    async def _reduce_remarks(self, remarks):
+        return f"若干方法的概括:\n{await self.request_remark(self.remarks_prompt(remarks))}\n"
+
+    async def request_remark(self, prompt):
+        chat_result = await self.api.predict(prompt)
+        self.llm_calls += 1
+        remark = chat_result.content
+        logger.info(f"Remark returned from LLM is: \n{remark}")
+        return remark
@@ -1,42 +1,374 @@
+import asyncio
+import contextlib
+import json
+import re
+
 from loguru import logger
-from llm_project_helper.provider import ZhipuAIAPI
+from llm_project_helper.provider import shared_zhipuai_api
+from llm_project_helper.provider.rate_limiter import estimate_tokens
+from llm_project_helper.analyzer.map_reduce import async_reduce_hierarchically, reduce_hierarchically, token_chunks
+from llm_project_helper.treesitter.treesitter_skeleton import render_skeleton
 from llm_project_helper.const import STRUCTURE_ANALYZE_PROMPT as PROMPT
+from llm_project_helper.const import STRUCTURE_ANALYZE_PROMPT_SKELETON, STRUCTURE_PROMPT_DETAIL, MAX_PROMPT_TOKENS
+from llm_project_helper.const import STRUCTURE_CONTINUE_PROMPT, STRUCTURE_PART_PROMPT, STRUCTURE_MERGE_PROMPT
+from llm_project_helper.const import STRUCTURE_REDUCE_PROMPT
 
 EOS_token = "[|$|EOS|$|]"
-CONTINUE_PHRASE = "继续。总结时务必输出结尾符[|$|EOS|$|]"
 MAX_REQ = 3
+# the lines of the summary so far put in a continuation prompt, under its last heading
+ANCHOR_LINES = 3
+# the lines at the start of a continuation that are checked against the end of the summary so far
+OVERLAP_LINES = 8
+# the keys of a structure json split between its parts, the others being in every part
+_PART_KEYS = ("imports", "global_variables", "main_block", "classes", "interfaces", "functions")
 
 
 class FileSummaryAnalyzer:
-    def __init__(self):
-        self.api = ZhipuAIAPI()
-        self.prompt = PROMPT
+    """
+    The summary of a file is streamed: every request is cut as soon as the EOS token is generated, and is continued,
+    up to MAX_REQ requests, only if the provider reports it truncated by its finish_reason, or if the EOS token ends a
+    heading rather than the conclusion.
+
+    A continuation is a single new request, not the conversation so far: its prompt has the last heading and lines of
+    the summary as an anchor, and only the classes, methods and functions the summary does not name yet. The
+    incomplete last line of a truncated reply is dropped, and the lines a continuation repeats from the end of the
+    summary are skipped.
+
+    With a max_prompt_tokens ceiling, the structure of a file whose prompt would exceed it is summarized map-reduce:
+    it is split into parts that fit, a class too large for a part being split between several by its methods; every
+    part is analyzed alone (map), then the analyses are merged level after level until they fit in the prompt of the
+    summary (reduce), which is streamed as above.
+
+    :param detail: "json" to put the structure json file in the prompt as is, or the detail of the skeleton to put
+                   instead: "minimal", "standard" or "full"
+    :param max_prompt_tokens: the ceiling of the estimated input tokens of a request, 0 for none
+    """
 
-    def analyze_file_summary(self, file_path):
+    def __init__(self, api=None, detail=STRUCTURE_PROMPT_DETAIL, max_prompt_tokens=MAX_PROMPT_TOKENS):
+        self.api = api if api is not None else shared_zhipuai_api()
+        self.detail = detail
+        self.max_prompt_tokens = max_prompt_tokens
+        self.base_prompt = PROMPT if detail == "json" else STRUCTURE_ANALYZE_PROMPT_SKELETON
+        # the description of the structure the base prompt starts with, for the prompts of its parts
+        self.part_prompt_template = (self.base_prompt[:self.base_prompt.index("你需要根据这个结构")]
+                                     + STRUCTURE_PART_PROMPT)
+        self.prompt = self.base_prompt
+        # whether the last summary ended with the EOS token, within MAX_REQ requests
+        self.complete = False
+
+    def analyze_file_summary(self, file_path, output=None):
         with open(file_path, 'r') as file:
-            json_code = file.read()
-        EOS_flag = False
+            return self.analyze_structure(file.read(), output)
+
+    def analyze_structure(self, structure_json, output=None):
+        """
+        Summarize a file from its structure json, as read from the workspace or just built by the parser
+
+        :param output: a text file the summary is written to as it streams in, e.g. the one of utils.atomic_stream
+        """
+        parts = self.summarize_parts(structure_json)
+        summary = SummaryStream(output)
+        self.complete = False
         count = 0
-        result = ""
-        history = []
-
-        while (EOS_flag is False and count < MAX_REQ):
-            if (count == 0):
-                self.prompt += json_code
-            elif (count >= 1):
-                self.prompt = CONTINUE_PHRASE
-
-            chat_result_completion_message = self.api.predict_with_history(self.prompt, history=history)
-            chat_result = chat_result_completion_message.content
-            logger.debug(f"chat_result: {chat_result}")
-
-            if EOS_token in chat_result:
-                EOS_flag = True
-                chat_result = chat_result.replace(EOS_token, "")
-            if EOS_flag is False:
-                # remove chat_result's last sentence. Solving the problem of incomplete sentence
-                chat_result = chat_result.rsplit('\n', 1)[0] + '\n'
-            result += chat_result
+
+        while (self.complete is False and count < MAX_REQ):
+            self.next_prompt(count, structure_json, summary.text, parts)
+
+            finish_reason = None
+            for content, finish_reason in self.api.predict_stream(self.prompt, stop=EOS_token):
+                summary.add(content)
+            self.complete = self.handle_finish(summary, finish_reason)
             count += 1
-            history.append({"role": "assistant", "content": chat_result})
-        return result
+        return summary.text
+
+    def structure_for_prompt(self, json_code):
+        """
+        The structure of the file as put in the prompt: the structure json as is, or its skeleton
+        """
+        if self.detail == "json":
+            return json_code
+        return render_skeleton(json.loads(json_code), self.detail)
+
+    def render_structure(self, structure):
+        """
+        A loaded structure, or a part of one, as put in a prompt: as compact json, or as its skeleton
+        """
+        if self.detail == "json":
+            return json.dumps(structure, ensure_ascii=False, separators=(",", ":"))
+        return render_skeleton(structure, self.detail)
+
+    def next_prompt(self, count, structure_json, summary_text, parts=None):
+        """
+        :param parts: the analyses of the parts of the structure, to summarize instead of the structure
+        """
+        if (count == 0):
+            if parts is None:
+                self.prompt = self.base_prompt + self.structure_for_prompt(structure_json)
+            else:
+                self.prompt = self.reduce_prompt(parts)
+        elif (count >= 1):
+            self.prompt = self.continuation_prompt(structure_json, summary_text)
+
+    def continuation_prompt(self, structure_json, summary_text):
+        """
+        The prompt to continue a truncated summary: the anchor of the summary so far, and the structure it does not
+        cover yet, as compact json or as a skeleton. Under a ceiling, only the first part of the uncovered structure
+        that fits is put, the next continuation taking the rest.
+        """
+        prompt = STRUCTURE_CONTINUE_PROMPT.replace("[|$|anchor|$|]", summary_anchor(summary_text))
+        uncovered = uncovered_structure(json.loads(structure_json), summary_text)
+        if self.max_prompt_tokens:
+            uncovered = self.split_structure(uncovered, self.max_prompt_tokens - estimate_tokens(prompt))[0]
+        return prompt + self.render_structure(uncovered)
+
+    def structure_parts(self, structure_json):
+        """
+        The parts of a structure to summarize map-reduce, or None if there is no ceiling or its prompt fits in it
+        """
+        if not self.max_prompt_tokens:
+            return None
+        if estimate_tokens(self.base_prompt + self.structure_for_prompt(structure_json)) <= self.max_prompt_tokens:
+            return None
+        budget = self.max_prompt_tokens - estimate_tokens(self.part_prompt_template)
+        parts = self.split_structure(json.loads(structure_json), budget)
+        logger.info(f"Summarizing a structure too large for {self.max_prompt_tokens} tokens in {len(parts)} parts")
+        return parts
+
+    def split_structure(self, structure, budget):
+        """
+        Split a loaded structure into parts of about budget tokens as rendered, in the order of the file: the imports,
+        the variables and the main block, then the classes and interfaces, member by member, then the functions. A
+        class split between parts is in each of them, with some of its constructors and methods.
+        """
+        units = [("head",)]
+        for kind in ("classes", "interfaces"):
+            for key, node in (structure.get(kind) or {}).items():
+                units.append((kind, key))
+                for member_kind in ("constructors", "methods"):
+                    units.extend((kind, key, member_kind, member_key) for member_key in node.get(member_kind) or {})
+        units.extend(("functions", key) for key in structure.get("functions") or {})
+        chunks = token_chunks(units, budget, lambda unit: estimate_tokens(
+            self.render_structure(_structure_part(structure, [unit]))))
+        return [_structure_part(structure, chunk) for chunk in chunks]
+
+    def part_prompt(self, part):
+        return self.part_prompt_template + self.render_structure(part)
+
+    def merge_prompt(self, texts):
+        return STRUCTURE_MERGE_PROMPT + "\n\n".join(texts)
+
+    def reduce_prompt(self, texts):
+        return STRUCTURE_REDUCE_PROMPT + "\n\n".join(texts)
+
+    def reduce_fits(self, texts):
+        return estimate_tokens(self.reduce_prompt(texts)) <= self.max_prompt_tokens
+
+    def summarize_parts(self, structure_json):
+        """
+        The analyses of the parts of a structure too large for the ceiling, merged until they fit in the prompt of the
+        summary, or None if the structure is summarized at once
+        """
+        parts = self.structure_parts(structure_json)
+        if parts is None:
+            return None
+        texts = [self.request_text(self.part_prompt(part)) for part in parts]
+        return reduce_hierarchically(texts, self.reduce_fits, self.merge_budget(),
+                                     lambda chunk: self.request_text(self.merge_prompt(chunk)))
+
+    def merge_budget(self):
+        return self.max_prompt_tokens - estimate_tokens(STRUCTURE_MERGE_PROMPT)
+
+    def request_text(self, prompt):
+        # the analysis of a part is not the end of the summary
+        return self.api.predict(prompt).content.replace(EOS_token, "")
+
+    def handle_finish(self, summary, finish_reason):
+        """
+        End the reply of a request, and returns whether the summary is complete: the reply was not truncated
+        """
+        logger.debug(f"finish_reason: {finish_reason}")
+        # "length" when the completion hit the token limit, None when the stream was interrupted
+        complete = finish_reason == "stop"
+        if complete and summary.stopped_at_heading():
+            logger.info("The summary stopped at the EOS token of a heading, continuing it")
+            complete = False
+        summary.end_reply(complete)
+        return complete
+
+
+class SummaryStream:
+    """
+    The summary of a file as the replies stream in, without the EOS token. The text is written to output, if any, line
+    by line as it arrives: the current line is held until it is complete, as the line a reply is truncated in is
+    dropped. The start of a continuation is held until OVERLAP_LINES lines are in, to skip the ones it repeats.
+    """
+
+    def __init__(self, output=None):
+        self.output = output
+        self.text = ""
+        self.pending = ""
+        self.continuing = False
+
+    def add(self, content):
+        self.pending += content
+        if self.continuing:
+            if self.pending.count("\n") < OVERLAP_LINES:
+                return
+            self._skip_overlap()
+        end = self.pending.rfind("\n") + 1
+        self._write(self.pending[:end])
+        self.pending = self.pending[end:]
+
+    def stopped_at_heading(self):
+        """
+        Whether the reply stopped at an EOS token ending a markdown heading, as in "## 总结[|$|EOS|$|]": a model
+        following an example with it there stops before the conclusion, which is still to be written
+        """
+        if not self.pending.endswith(EOS_token):
+            return False
+        return self.pending[:-len(EOS_token)].rsplit("\n", 1)[-1].lstrip().startswith("#")
+
+    def end_reply(self, complete=True):
+        """
+        The reply is over: its end is written, but for the EOS token, or for the incomplete line it was truncated in
+        """
+        if self.continuing:
+            self._skip_overlap()
+        if complete:
+            if self.pending.endswith(EOS_token):
+                self.pending = self.pending[:-len(EOS_token)]
+            self._write(self.pending)
+        else:
+            self._write(self.pending[:self.pending.rfind("\n") + 1])
+        self.pending = ""
+        # the next reply, if any, continues this one
+        self.continuing = not complete
+
+    def _skip_overlap(self):
+        # the blank lines, and the lines of the end of the summary, a continuation starts with
+        tail = {line.strip() for line in self.text.splitlines()[-OVERLAP_LINES:] if line.strip()}
+        lines = self.pending.split("\n")
+        skipped = 0
+        while skipped < len(lines) - 1 and (not lines[skipped].strip() or lines[skipped].strip() in tail):
+            skipped += 1
+        if skipped:
+            logger.debug(f"Skipping the {skipped} lines the continuation repeats")
+        self.pending = "\n".join(lines[skipped:])
+        self.continuing = False
+
+    def _write(self, text):
+        if not text:
+            return
+        self.text += text
+        if self.output is not None:
+            self.output.write(text)
+            self.output.flush()
+
+
+def _structure_part(structure, units):
+    """
+    The part of a loaded structure with the given units of FileSummaryAnalyzer.split_structure
+    """
+    part = {key: value for key, value in structure.items() if key not in _PART_KEYS}
+    part.update(classes={}, interfaces={}, functions={})
+    for unit in units:
+        kind, key = unit[0], unit[-1]
+        if kind == "head":
+            part.update({head_key: structure[head_key] for head_key in ("imports", "global_variables", "main_block")
+                         if head_key in structure})
+        elif kind == "functions":
+            part["functions"][key] = structure["functions"][key]
+        else:
+            node = structure[kind][unit[1]]
+            # the class with none of its members, then the members of the part
+            type_part = part[kind].setdefault(unit[1], dict(node, constructors={}, methods={}))
+            if len(unit) == 4:
+                type_part[unit[2]][key] = node[unit[2]][key]
+    return part
+
+
+def summary_anchor(summary_text):
+    """
+    The end of a summary a continuation starts from: its last markdown heading, and its last ANCHOR_LINES lines
+    """
+    lines = [line for line in summary_text.splitlines() if line.strip()]
+    anchor = lines[-ANCHOR_LINES:]
+    headings = [line for line in lines[:-ANCHOR_LINES] if line.lstrip().startswith("#")]
+    if headings:
+        anchor.insert(0, headings[-1])
+    return "\n".join(anchor)
+
+
+def uncovered_structure(structure, summary_text):
+    """
+    The structure json of a file, loaded, with only the imports, classes, interfaces, methods and functions that the
+    summary does not name yet: a class or an interface is kept for the methods it still has to cover. The variables and
+    the main block are left out, the summary is past the overview they are there for.
+    """
+    uncovered = {key: value for key, value in structure.items()
+                 if key not in ("imports", "classes", "interfaces", "functions", "global_variables", "main_block")}
+    uncovered["imports"] = [node for node in structure.get("imports") or []
+                            if not _names(summary_text, node["import_identifier"].split()[-1])]
+    for kind in ("classes", "interfaces"):
+        uncovered[kind] = {}
+        for key, node in (structure.get(kind) or {}).items():
+            members = {member_kind: {member_key: member for member_key, member in (node.get(member_kind) or {}).items()
+                                     if not _names(summary_text, member["name"])}
+                       for member_kind in ("constructors", "methods")}
+            if not _names(summary_text, node["name"]) or any(members.values()):
+                uncovered[kind][key] = dict(node, **members)
+    uncovered["functions"] = {key: node for key, node in (structure.get("functions") or {}).items()
+                              if not _names(summary_text, node["name"])}
+    return uncovered
+
+
+def _names(text, name):
+    """
+    Whether the text has the name as a whole identifier, not as a part of a longer one: get does not name get_all. The
+    identifiers are ascii, with the $ of java, so that a name written right next to chinese text is found
+    """
+    return re.search(rf"(?<![\w$]){re.escape(name)}(?![\w$])", text, re.ASCII) is not None
+
+
+class AsyncFileSummaryAnalyzer(FileSummaryAnalyzer):
+    """
+    asyncio version of FileSummaryAnalyzer, on an AsyncZhipuAIAPI. The parts of a structure summarized map-reduce, and
+    the chunks of every level of their reduce, are requested concurrently; the requests of the summary itself are
+    still sequential, as each continuation needs the end of the previous answer.
+    """
+
+    def __init__(self, api, detail=STRUCTURE_PROMPT_DETAIL, max_prompt_tokens=MAX_PROMPT_TOKENS):
+        super().__init__(api, detail, max_prompt_tokens)
+
+    async def analyze_file_summary(self, file_path, output=None):
+        with open(file_path, 'r') as file:
+            return await self.analyze_structure(file.read(), output)
+
+    async def analyze_structure(self, structure_json, output=None):
+        parts = await self.summarize_parts(structure_json)
+        summary = SummaryStream(output)
+        self.complete = False
+        count = 0
+
+        while (self.complete is False and count < MAX_REQ):
+            self.next_prompt(count, structure_json, summary.text, parts)
+
+            finish_reason = None
+            stream = self.api.predict_stream(self.prompt, stop=EOS_token)
+            async with contextlib.aclosing(stream):
+                async for content, finish_reason in stream:
+                    summary.add(content)
+            self.complete = self.handle_finish(summary, finish_reason)
+            count += 1
+        return summary.text
+
+    async def summarize_parts(self, structure_json):
+        parts = self.structure_parts(structure_json)
+        if parts is None:
+            return None
+        texts = list(await asyncio.gather(*[self.request_text(self.part_prompt(part)) for part in parts]))
+        return await async_reduce_hierarchically(texts, self.reduce_fits, self.merge_budget(),
+                                                 lambda chunk: self.request_text(self.merge_prompt(chunk)))
+
+    async def request_text(self, prompt):
+        return (await self.api.predict(prompt)).content.replace(EOS_token, "")
@@ -0,0 +1,71 @@
+import asyncio
+
+from loguru import logger
+from llm_project_helper.provider.rate_limiter import estimate_tokens
+
+
+def token_chunks(items, budget, tokens=estimate_tokens):
+    """
+    Pack consecutive items into chunks of at most budget tokens. An item larger than the budget is a chunk alone.
+
+    :param tokens: the estimated tokens of an item
+    """
+    chunks = []
+    chunk = []
+    chunk_tokens = 0
+    for item in items:
+        item_tokens = tokens(item)
+        if chunk and chunk_tokens + item_tokens > budget:
+            chunks.append(chunk)
+            chunk = []
+            chunk_tokens = 0
+        chunk.append(item)
+        chunk_tokens += item_tokens
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def reduce_hierarchically(texts, fits, budget, reduce_chunk):
+    """
+    The reduce step of a map-reduce summary: the partial summaries are packed into chunks of budget tokens, and every
+    chunk is summarized into one text by reduce_chunk, level after level, until fits(texts) says they fit in the final
+    prompt. Every level has fewer texts than the previous one; once no chunk holds two texts, they are returned as
+    they are.
+
+    :param texts: the partial summaries, in order
+    :param fits: whether a list of texts fits in the final prompt
+    :param budget: the tokens of texts a reduce_chunk prompt can take
+    :param reduce_chunk: the summary of a list of texts
+    """
+    level = 0
+    while not fits(texts):
+        chunks = token_chunks(texts, budget)
+        if len(chunks) == len(texts):
+            _log_unreduced(texts)
+            break
+        level += 1
+        logger.info(f"Reducing {len(texts)} partial summaries into {len(chunks)}, level {level}")
+        texts = [reduce_chunk(chunk) for chunk in chunks]
+    return texts
+
+
+async def async_reduce_hierarchically(texts, fits, budget, reduce_chunk):
+    """
+    reduce_hierarchically with an asynchronous reduce_chunk, the chunks of a level being summarized concurrently
+    """
+    level = 0
+    while not fits(texts):
+        chunks = token_chunks(texts, budget)
+        if len(chunks) == len(texts):
+            _log_unreduced(texts)
+            break
+        level += 1
+        logger.info(f"Reducing {len(texts)} partial summaries into {len(chunks)}, level {level}")
+        texts = list(await asyncio.gather(*[reduce_chunk(chunk) for chunk in chunks]))
+    return texts
+
+
+def _log_unreduced(texts):
+    logger.warning(f"{len(texts)} partial summaries of {sum(estimate_tokens(text) for text in texts)} tokens cannot "
+                   f"be reduced under the token ceiling, kept as they are")
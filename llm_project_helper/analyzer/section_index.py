@@ -0,0 +1,84 @@
+import asyncio
+
+from loguru import logger
+
+
+class SectionIndex:
+    """
+    Repo-wide index of the remarks of the code sections by fingerprint, so that the identical functions, methods and
+    classes of a repo (vendored copies, generated stubs, copy-pasted helpers) are requested from the LLM only once.
+
+    The first section of a fingerprint that needs a remark is requested, and the others take its remark when it
+    arrives, each keeping its own line_no. The index can be seeded with the comments of the previous runs.
+    """
+
+    def __init__(self):
+        self.remarks = {}
+        # the fingerprints being requested, and the events the async analyzers wait on for their remark
+        self.requested = set()
+        self._events = {}
+        self.sections = 0
+        self.deduplicated = 0
+
+    def seed(self, comments):
+        """
+        Index the remarks of existing comments, e.g. of a .comments.json
+        """
+        for comment in comments or []:
+            if comment.get("fingerprint") and comment.get("remark"):
+                self.remarks.setdefault(comment["fingerprint"], comment["remark"])
+
+    def claim(self, comment):
+        """
+        Whether the remark of a section has to be requested from the LLM. If not, an identical section has a remark,
+        which is set on comment, or is being requested, and comment is then resolved with resolve or wait_remark.
+        """
+        fingerprint = comment["fingerprint"]
+        self.sections += 1
+        if fingerprint in self.remarks:
+            comment["remark"] = self.remarks[fingerprint]
+            self.deduplicated += 1
+            return False
+        if fingerprint in self.requested:
+            self.deduplicated += 1
+            return False
+        self.requested.add(fingerprint)
+        return True
+
+    def record(self, comment):
+        """
+        Index the remark of a requested section, and wake up the sections waiting for it. A section whose request
+        failed is recorded without remark: its waiters are left without remark, and the next copy is requested again.
+        """
+        fingerprint = comment["fingerprint"]
+        if comment["remark"] is not None:
+            self.remarks.setdefault(fingerprint, comment["remark"])
+        self.requested.discard(fingerprint)
+        event = self._events.pop(fingerprint, None)
+        if event is not None:
+            event.set()
+
+    def resolve(self, comments):
+        """
+        Set the remark of the comments whose identical section got one
+        """
+        for comment in comments:
+            if comment["remark"] is None and comment["fingerprint"] in self.remarks:
+                comment["remark"] = self.remarks[comment["fingerprint"]]
+
+    async def wait_remark(self, comment):
+        """
+        Wait for the remark of the identical section of comment, being requested by the async analyzers
+        """
+        fingerprint = comment["fingerprint"]
+        if fingerprint not in self.remarks:
+            await self._events.setdefault(fingerprint, asyncio.Event()).wait()
+        comment["remark"] = self.remarks.get(fingerprint)
+
+    def dedup_ratio(self):
+        return self.deduplicated / self.sections if self.sections else 0.0
+
+    def log_stats(self):
+        logger.info(f"Section dedup: {self.sections} sections to comment, {self.sections - self.deduplicated} unique "
+                    f"requested from LLM, {self.deduplicated} reused from identical sections "
+                    f"({self.dedup_ratio():.1%} dedup ratio)")
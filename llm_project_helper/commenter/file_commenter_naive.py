@@ -1,4 +1,4 @@
-from llm_project_helper.provider import ZhipuAIAPI
+from llm_project_helper.provider import shared_zhipuai_api
 
 PROMPT = """
 作为一个经验丰富的Python程序员，你需要对以下的代码用中文加上docstring的注释。
@@ -10,8 +10,8 @@ PROMPT = """
 
 
 class FileCommenterNaive:
-    def __init__(self):
-        self.api = ZhipuAIAPI()
+    def __init__(self, api=None):
+        self.api = api if api is not None else shared_zhipuai_api()
         self.prompt = PROMPT
 
     def comment(self, file_path):
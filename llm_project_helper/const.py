@@ -12,6 +12,68 @@ load_dotenv()
 TREE_JSON = True
 FORCE_RE_ANALYZE = False
 FORCE_RE_COMMENT = False
+# bump PARSER_VERSION whenever the structure json changes, so that the traverse manifest re-parses every file
+PARSER_VERSION = "2"
+# the manifest of parsed source files, stored in the workspace of each repo. Do not end it with .json, otherwise
+# analyze_repo and sectioned_comment would pick it up as a structure file
+TRAVERSE_MANIFEST_FILE = ".traverse_manifest"
+# the state of the runs of main.py (JobStateStore), stored in the workspace of each repo. Not ending with .json either
+JOB_STATE_FILE = ".job_state.db"
+# the extraction engine of TreesitterPython: "query" runs a tree-sitter query per entity kind, "cursor" walks the
+# syntax tree once. Both produce the same structure json
+TREESITTER_ENGINE = os.getenv("LLM_PROJECT_HELPER_TREESITTER_ENGINE", "query")
+# indentation of the structure json written by traverse_repo. FileSummaryAnalyzer puts the file as is in its prompt, so
+# 4 keeps the prompts the same as before; 0 writes compact json, cheaper to write and fewer prompt tokens
+STRUCTURE_JSON_INDENT = int(os.getenv("LLM_PROJECT_HELPER_STRUCTURE_JSON_INDENT", "4"))
+# the default maximum number of LLM requests in flight at the same time, when the analyzers run asynchronously
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_PROJECT_HELPER_MAX_IN_FLIGHT", "8"))
+# the retries of a request of the async provider answered with a 429 or a 5xx, or timed out: after the Retry-After of
+# the response, else after LLM_RETRY_BACKOFF seconds, doubled at every retry up to LLM_RETRY_MAX_DELAY
+LLM_MAX_RETRIES = int(os.getenv("LLM_PROJECT_HELPER_MAX_RETRIES", "3"))
+LLM_RETRY_BACKOFF = float(os.getenv("LLM_PROJECT_HELPER_RETRY_BACKOFF", "1"))
+LLM_RETRY_MAX_DELAY = 30
+# the requests-per-minute and tokens-per-minute quotas of the LLM provider, shared by all the processes of the host;
+# 0 means no limit. The traffic is kept at LLM_RATE_LIMIT_HEADROOM of the quotas, with bursts of at most
+# LLM_RATE_LIMIT_BURST_SECONDS worth of them
+LLM_RPM = int(os.getenv("LLM_PROJECT_HELPER_RPM", "0"))
+LLM_TPM = int(os.getenv("LLM_PROJECT_HELPER_TPM", "0"))
+LLM_RATE_LIMIT_HEADROOM = float(os.getenv("LLM_PROJECT_HELPER_RATE_LIMIT_HEADROOM", "0.95"))
+LLM_RATE_LIMIT_BURST_SECONDS = float(os.getenv("LLM_PROJECT_HELPER_RATE_LIMIT_BURST_SECONDS", "1"))
+# the completion tokens assumed for a request before its usage is known
+LLM_COMPLETION_TOKENS_ESTIMATE = 512
+# how FileSummaryAnalyzer puts the structure of a file in its prompt: "json" puts the structure json file as is;
+# "minimal", "standard" or "full" a skeleton of it (render_skeleton) with this detail, for far fewer tokens
+STRUCTURE_PROMPT_DETAIL = os.getenv("LLM_PROJECT_HELPER_STRUCTURE_PROMPT_DETAIL", "json")
+# the token budget of a batched request of sectioned_comment: if not 0, the functions and methods of a file are packed
+# into requests of about COMMENT_BATCH_TOKENS tokens of code, counting COMMENT_REMARK_TOKENS for the remark of each,
+# instead of one request per section with the whole summary of the file
+COMMENT_BATCH_TOKENS = int(os.getenv("LLM_PROJECT_HELPER_COMMENT_BATCH_TOKENS", "0"))
+COMMENT_REMARK_TOKENS = 200
+# the ceiling of the estimated input tokens of a summary or class request: if not 0, the structure of a file too large
+# for it is summarized in parts, and the method remarks of a class too large for it are summarized in chunks, the
+# partial summaries being merged hierarchically until they fit (see analyzer.map_reduce)
+MAX_PROMPT_TOKENS = int(os.getenv("LLM_PROJECT_HELPER_MAX_PROMPT_TOKENS", "0"))
+# request the functions, methods and classes identical (after normalization) to another one of the repo only once, the
+# copies taking its remark. Off by default: which copy is requested, and so the remark they share, depends on the order
+# the files are commented in
+SECTION_DEDUP = os.getenv("LLM_PROJECT_HELPER_SECTION_DEDUP", "False") == "True"
+# the number of files waiting between two stages of the pipeline (parse, summary, comments), beyond which the previous
+# stage waits for the next one
+PIPELINE_QUEUE_SIZE = int(os.getenv("LLM_PROJECT_HELPER_PIPELINE_QUEUE_SIZE", "16"))
+# the connection pool of the LLM providers: at most LLM_HTTP_MAX_CONNECTIONS connections, the idle ones being kept open
+# for LLM_HTTP_KEEPALIVE_EXPIRY seconds, so that successive requests reuse them without a new TLS handshake
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_PROJECT_HELPER_HTTP_MAX_CONNECTIONS", "16"))
+LLM_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("LLM_PROJECT_HELPER_HTTP_KEEPALIVE_EXPIRY", "60"))
+# the on-disk cache of the LLM responses under LLM_PROJECT_HELPER_ROOT: a request with the same model and messages as
+# a cached one is answered from the cache. The least recently used responses are evicted beyond LLM_CACHE_MAX_BYTES
+LLM_CACHE_ENABLED = os.getenv("LLM_PROJECT_HELPER_LLM_CACHE", "True") != "False"
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_PROJECT_HELPER_LLM_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+# the cassette of the LLM exchanges: with "record", every request and response of the providers is appended to the
+# LLM_CASSETTE file; with "replay", the recorded responses are served from it, after their original latency or with
+# "zero" latency, without any network request. The response cache is not used with a cassette
+LLM_CASSETTE = os.getenv("LLM_PROJECT_HELPER_CASSETTE")
+LLM_CASSETTE_MODE = os.getenv("LLM_PROJECT_HELPER_CASSETTE_MODE", "replay")
+LLM_CASSETTE_LATENCY = os.getenv("LLM_PROJECT_HELPER_CASSETTE_LATENCY", "original")
 
 from enum import Enum
 
@@ -109,13 +171,57 @@ STRUCTURE_ANALYZE_PROMPT = """
 - `enum.Enum:` 可能用于定义枚举类。
 - `openai:` 可能用于与OpenAI服务进行交互。
 
-## 总结[|$|EOS|$|]
+## 总结
 综上所述，该文件主要提供了一个与智谱AI服务交互的接口，通过定义的方法和类变量，用户可以方便地发送请求，获取聊天机器人的回复，并处理相关的事件和错误。[|$|EOS|$|]
 ```
 需要解析的JSON如下：
 
 """
 
+# STRUCTURE_ANALYZE_PROMPT for a skeleton of the file (render_skeleton) instead of its structure json
+STRUCTURE_ANALYZE_PROMPT_SKELETON = """
+给你一个python或java文件的代码骨架，每行是一个导入、类(class)、接口(interface)、方法或函数，缩进表示从属关系：类和接口下面缩进的是它们的方法，
+括号中是参数，以#开头的是原来的注释，vars表示类变量，globals表示全局变量，locals表示方法中的变量，@表示带有装饰器或注解，
+L后面的数字表示它们在文件中的行号(起始行-结束行)。
+""" + STRUCTURE_ANALYZE_PROMPT[STRUCTURE_ANALYZE_PROMPT.index("你需要根据这个结构"):].replace(
+    "根据提供的JSON结构", "根据提供的代码骨架").replace("需要解析的JSON如下：", "需要解析的代码骨架如下：")
+
+# the continuation of a truncated summary: the end of the summary so far, then the structure it does not cover yet
+STRUCTURE_CONTINUE_PROMPT = """
+你之前根据一个文件的结构，用markdown格式逐一写出了它的类、类的方法、函数等的具体功能，但输出被截断了。
+下面是已经输出的内容的结尾，以及这个文件中还没有写到的结构。
+请紧接着已经输出的内容往下写：不要重复已经输出的内容，不要重新写综述；写完还没有写到的部分后再写总结，总结时必须输出终止符[|$|EOS|$|]
+## 已经输出的内容的结尾：
+```markdown
+[|$|anchor|$|]
+```
+## 还没有写到的结构如下：
+
+"""
+
+# the map step of the summary of a structure too large for a prompt: the description of the structure of
+# STRUCTURE_ANALYZE_PROMPT or STRUCTURE_ANALYZE_PROMPT_SKELETON, then this
+STRUCTURE_PART_PROMPT = """
+这里只给出了文件结构的一部分。你需要根据这部分结构，用markdown格式逐一写出其中的类、类的方法、函数等的具体功能，每个一行，保持简单清晰；不需要写文件的综述和总结。
+需要解析的部分结构如下：
+
+"""
+
+# merge the analyses of several parts of a file into one, when they are too large for STRUCTURE_REDUCE_PROMPT
+STRUCTURE_MERGE_PROMPT = """
+下面是同一个文件中连续几个部分的结构分析，是用markdown格式写的类、类的方法、函数等的具体功能。
+你需要把它们合并成一份更精简的分析：保留每个类、方法和函数的名字，以及一句话的功能描述，同一个类的内容写在一起；不需要写文件的综述和总结。
+需要合并的分析如下：
+
+"""
+
+# the reduce step: the summary of a file from the analyses of its parts, in the format of STRUCTURE_ANALYZE_PROMPT
+STRUCTURE_REDUCE_PROMPT = """
+给你一个python或java文件按顺序分成的若干部分的结构分析，是用markdown格式写的类、类的方法、函数等的具体功能。
+""" + STRUCTURE_ANALYZE_PROMPT[STRUCTURE_ANALYZE_PROMPT.index("你需要根据这个结构"):].replace(
+    "你需要根据这个结构", "你需要根据这些分析").replace("根据提供的JSON结构", "根据提供的各部分的分析").replace(
+    "需要解析的JSON如下：", "各部分的分析如下：")
+
 # 把ast分析的JSON文件输出为JSON： Worked in GPT4; NOT WORKING PROPERLY IN GLM4
 STRUCTURE_ANALYZE_PROMPT_JSON = """
 给你一个用JSON表示的python文件的结构，这个输入的JSON文件中，imports表示导入的包，classes表示类，functions表示函数，methods表示类的方法，docstrings表示原来的注释。
@@ -182,6 +288,17 @@ CODE_SECTION_PROMPT_JSON = """
 
 """
 
+CODE_SECTION_BATCH_PROMPT_JSON = """
+## 代码结构分析
+给你一段用Markdown表示的对于某个代码文件的总结信息作为参考，来指导这个文件中若干段代码的注释。注意这个信息只作为参考，如果有问题或者错误，以源代码为准：
+```markdown```
+
+# 你的任务：
+下面有若干段源代码(类的方法，或者函数)，每段代码前用`### line_no: 行号`标出了它在文件中的起始行号。对每段代码分别用中文进行注释：只需要输出注释，不要输出代码！不需要做任何额外解释。注释保持简单清晰，不需要逐行分析，不需要过于详细。每段注释控制在400字以内。
+输出一个JSON对象，键为每段代码的起始行号（字符串），值为这段代码的注释，例如：{"12": "注释", "30": "注释"}。每段代码都必须有注释，不要输出JSON以外的任何内容。
+
+"""
+
 CODE_CLASS_PROMPT_JSON = """
 ## 代码结构分析
 给你一段用Markdown表示的对于某个代码文件的总结信息作为参考，来指导这个文件中某段代码的注释。注意这个信息只作为参考，如果有问题或者错误，以源代码和逐一方法注释为准：
@@ -194,4 +311,13 @@ CODE_CLASS_PROMPT_JSON = """
 # 你的任务
 对于当前类class进行总结：只需要输出类class的总结，不要输出代码！不需要做任何额外解释。注释保持简单清晰，不需要逐行分析，不需要过于详细。输出控制在400字以内。
 
-"""
\ No newline at end of file
+"""
+
+# the remarks of a part of the methods of a class whose remarks are too large for CODE_CLASS_PROMPT_JSON, summarized
+# to be put in it instead
+CODE_CLASS_REMARKS_PROMPT = """
+下面是一个类中若干方法的注释。
+# 你的任务
+把这些注释概括为一段说明，作为总结这个类时的参考：保留每个方法的名字或起始行号，以及它的主要功能。只需要输出概括，不需要做任何额外解释。输出控制在400字以内。
+
+"""
@@ -0,0 +1,107 @@
+import os
+import subprocess
+
+from llm_project_helper.logs import logger
+
+
+class GitChangeSet:
+    """
+    The files of a repo that changed since a git revision, relative to the repo path.
+
+    - added: new files, including untracked ones
+    - modified: files whose content (or type) changed
+    - renamed: (old_path, new_path, similarity) triples, similarity is the percentage reported by git
+    - deleted: files that no longer exist
+    - carried_over: the new paths of the renamed files whose summary and comments were moved along with them, as
+      recorded by RepoTraverser.apply_git_changes
+    """
+
+    def __init__(self):
+        self.added = []
+        self.modified = []
+        self.renamed = []
+        self.deleted = []
+        self.carried_over = set()
+
+    def files_to_process(self):
+        """
+        Returns the files whose summary and comments have to be built again. A rename with 100% similarity is not
+        included if its outputs were carried over to the new path; otherwise, e.g. a file renamed to a source file or
+        one that had no outputs yet, it is.
+        """
+        renamed_to_process = [new_path for old_path, new_path, similarity in self.renamed
+                              if similarity < 100 or new_path not in self.carried_over]
+        return self.added + self.modified + renamed_to_process
+
+    def files_to_traverse(self):
+        """
+        Returns the files whose structure json has to be built again: every renamed file is included, as the json
+        records its relative_path.
+        """
+        renamed_unchanged = [new_path for old_path, new_path, similarity in self.renamed
+                             if similarity >= 100 and new_path in self.carried_over]
+        return self.files_to_process() + renamed_unchanged
+
+    def __repr__(self):
+        return (f"GitChangeSet(added={len(self.added)}, modified={len(self.modified)}, "
+                f"renamed={len(self.renamed)}, deleted={len(self.deleted)})")
+
+
+def _run_git(repo_path, *args):
+    result = subprocess.run(
+        ["git", "-C", repo_path, *args],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        check=True,
+    )
+    return result.stdout.decode('utf-8', errors='surrogateescape')
+
+
+def _to_os_path(git_path):
+    return git_path.replace('/', os.sep)
+
+
+def get_changed_files(repo_path, since) -> GitChangeSet:
+    """
+    Find the files changed in the working tree of repo_path compared to the git revision since.
+
+    Only the part of the repository below repo_path is considered, and all paths are relative to it, the same as
+    the relative_path that traverse_repo records.
+
+    :param repo_path: the code repo path, may be a sub folder of the git repository
+    :param since: any git revision, e.g. a commit hash, a tag or HEAD~3
+    :raises subprocess.CalledProcessError: if repo_path is not a git repository or since is not a valid revision
+    """
+    changes = GitChangeSet()
+
+    # -z: NUL separated, so paths with spaces or non-ascii characters are not quoted
+    output = _run_git(repo_path, "diff", "--name-status", "-z", "-M", "--relative", since, "--")
+    fields = output.split('\0')
+    i = 0
+    while i < len(fields) - 1:
+        status = fields[i]
+        if status.startswith('R') or status.startswith('C'):
+            old_path, new_path = _to_os_path(fields[i + 1]), _to_os_path(fields[i + 2])
+            i += 3
+            if status.startswith('R'):
+                changes.renamed.append((old_path, new_path, int(status[1:] or 0)))
+            else:
+                # a copy leaves the source untouched
+                changes.added.append(new_path)
+            continue
+
+        path = _to_os_path(fields[i + 1])
+        i += 2
+        if status == 'A':
+            changes.added.append(path)
+        elif status == 'D':
+            changes.deleted.append(path)
+        else:
+            # M, T (type change) and U (unmerged) all need the file to be analyzed again
+            changes.modified.append(path)
+
+    untracked = _run_git(repo_path, "ls-files", "--others", "--exclude-standard", "-z")
+    changes.added.extend(_to_os_path(path) for path in untracked.split('\0') if path)
+
+    logger.info(f"Changes since {since}: {changes}")
+    return changes
@@ -0,0 +1,168 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from llm_project_helper.logs import logger
+from llm_project_helper.const import JOB_STATE_FILE
+
+PARSED = "parsed"
+SUMMARIZED = "summarized"
+COMMENTED = "commented"
+# the stages of a file, in the order a run goes through them
+STAGES = (PARSED, SUMMARIZED, COMMENTED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS job (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    options TEXT NOT NULL,
+    status TEXT NOT NULL,
+    started REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    json_file TEXT PRIMARY KEY,
+    stage TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sections (
+    json_file TEXT NOT NULL,
+    line_no INTEGER NOT NULL,
+    fingerprint TEXT NOT NULL,
+    remark TEXT NOT NULL,
+    PRIMARY KEY (json_file, line_no, fingerprint)
+);
+"""
+
+
+class JobStateStore:
+    """
+    Durable state of a run of main.py over the workspace of a repo, so that a run that crashed or was killed resumes
+    where it stopped instead of from scratch.
+
+    Every file records the stage it reached in the run: parsed, summarized or commented, and every remark is committed
+    as it arrives from the LLM, keyed by the fingerprint of its section, until the .comments.json of the file is
+    written. The state is a sqlite database in the workspace, in WAL mode, so that several processes can share it.
+
+    A run started with the same options as an unfinished one resumes it: the files it already summarized or commented
+    are skipped, even with the force options, and the remarks committed for a file are reused when it is commented
+    again. Any other run starts a new job and drops the state of the previous one.
+    """
+
+    def __init__(self, cur_ws_dir):
+        self.cur_ws_dir = cur_ws_dir
+        self.db_path = os.path.join(cur_ws_dir, JOB_STATE_FILE)
+        self.resumed = False
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(_SCHEMA)
+
+    def begin(self, options, resume=True):
+        """
+        Resume the unfinished job started with the same options, or start a new one.
+
+        :param options: the options of the run, e.g. the arguments of main.py; they have to be json serializable
+        :return: whether the job was resumed
+        """
+        options_json = json.dumps(options, sort_keys=True)
+        with self._transaction():
+            row = self.connection.execute("SELECT options, status FROM job WHERE id = 1").fetchone()
+            self.resumed = resume and row is not None and row == (options_json, "running")
+            if not self.resumed:
+                self.connection.execute("DELETE FROM files")
+                self.connection.execute("DELETE FROM sections")
+                self.connection.execute("INSERT OR REPLACE INTO job (id, options, status, started) VALUES (1, ?, ?, ?)",
+                                        (options_json, "running", time.time()))
+        if self.resumed:
+            stats = self.stats()
+            logger.info(f"Resuming the unfinished job: {stats[SUMMARIZED]} files summarized, {stats[COMMENTED]} "
+                        f"commented, {stats['sections']} remarks committed")
+        return self.resumed
+
+    def finish(self):
+        with self._lock:
+            self.connection.execute("UPDATE job SET status = 'done' WHERE id = 1")
+
+    def reached(self, json_file, stage):
+        """
+        Whether a structure json reached a stage, or a later one, in the current job
+        """
+        with self._lock:
+            row = self.connection.execute("SELECT stage FROM files WHERE json_file = ?",
+                                          (self._key(json_file),)).fetchone()
+        return row is not None and STAGES.index(row[0]) >= STAGES.index(stage)
+
+    def set_stage(self, json_file, stage):
+        """
+        Record the stage reached by a structure json. Once it is commented, the remarks committed for it are dropped, as
+        they are in its .comments.json.
+        """
+        key = self._key(json_file)
+        with self._transaction():
+            self.connection.execute("INSERT OR REPLACE INTO files (json_file, stage, updated) VALUES (?, ?, ?)",
+                                    (key, stage, time.time()))
+            if stage == COMMENTED:
+                self.connection.execute("DELETE FROM sections WHERE json_file = ?", (key,))
+
+    def checkpoint(self, json_file, comment):
+        """
+        Commit the remark of a section as soon as it arrives
+        """
+        if comment["remark"] is None:
+            return
+        with self._lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO sections (json_file, line_no, fingerprint, remark) VALUES (?, ?, ?, ?)",
+                (self._key(json_file), comment["line_no"], comment["fingerprint"], comment["remark"]))
+
+    def checkpoints(self, json_file):
+        """
+        The remarks committed for a structure json, as comments that CodeSectionAnalyzer can carry over
+        """
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT line_no, fingerprint, remark FROM sections WHERE json_file = ? ORDER BY line_no",
+                (self._key(json_file),)).fetchall()
+        return [{"line_no": line_no, "remark": remark, "fingerprint": fingerprint}
+                for line_no, fingerprint, remark in rows]
+
+    def stats(self):
+        with self._lock:
+            stages = dict(self.connection.execute("SELECT stage, COUNT(*) FROM files GROUP BY stage").fetchall())
+            sections = self.connection.execute("SELECT COUNT(*) FROM sections").fetchone()[0]
+        return {**{stage: stages.get(stage, 0) for stage in STAGES}, "sections": sections}
+
+    def log_stats(self):
+        stats = self.stats()
+        logger.info(f"Job state: {stats[PARSED]} files parsed, {stats[SUMMARIZED]} summarized, {stats[COMMENTED]} "
+                    f"commented, {stats['sections']} remarks committed for files not commented yet")
+
+    def _key(self, json_file):
+        # relative to the workspace, which LLM_PROJECT_HELPER_ROOT may move
+        return os.path.relpath(json_file, self.cur_ws_dir)
+
+    def _transaction(self):
+        return _Transaction(self.connection, self._lock)
+
+
+class _Transaction:
+    def __init__(self, connection, lock):
+        self.connection = connection
+        self.lock = lock
+
+    def __enter__(self):
+        self.lock.acquire()
+        try:
+            self.connection.execute("BEGIN IMMEDIATE")
+        except BaseException:
+            self.lock.release()
+            raise
+        return self.connection
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.connection.execute("ROLLBACK" if exc_type is not None else "COMMIT")
+        finally:
+            self.lock.release()
@@ -0,0 +1,98 @@
+import os
+import json
+import hashlib
+
+from llm_project_helper import utils
+from llm_project_helper.logs import logger
+from llm_project_helper.const import PARSER_VERSION, TRAVERSE_MANIFEST_FILE
+
+
+def file_sha256(file_path):
+    """
+    Returns the sha256 hex digest of the content of a file.
+    """
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class TraverseManifest:
+    """
+    Persistent record of the source files that traverse_repo already turned into structure json.
+
+    Every entry is keyed by the path relative to the repo, and keeps the size, mtime and content hash of the source
+    file at the time it was parsed. The whole manifest is tied to PARSER_VERSION: when the parser changes, the old
+    entries are dropped so that every file gets parsed again.
+    """
+
+    def __init__(self, cur_ws_dir):
+        self.manifest_path = os.path.join(cur_ws_dir, TRAVERSE_MANIFEST_FILE)
+        self.files = {}
+
+    def load(self):
+        if not os.path.exists(self.manifest_path):
+            return self
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable manifest {self.manifest_path}: {e}")
+            return self
+        self.files = data.get('files', {})
+        if data.get('parser_version') != PARSER_VERSION:
+            logger.info(f"Parser version changed from {data.get('parser_version')} to {PARSER_VERSION}, re-parsing all files")
+            # keep the paths, so the outputs of deleted files are still dropped, but invalidate every entry
+            self.files = dict.fromkeys(self.files)
+        return self
+
+    def save(self):
+        data = {
+            'parser_version': PARSER_VERSION,
+            'files': self.files,
+        }
+        # write to a temporary file first, so an interrupted run never leaves a truncated manifest behind
+        utils.atomic_write(self.manifest_path, json.dumps(data, ensure_ascii=False), encoding='utf-8')
+
+    def is_unchanged(self, relative_path, file_path, stat_result=None):
+        """
+        Check whether a source file is the same as when it was recorded.
+
+        The size and mtime are compared first; the content hash is only computed when they differ, e.g. after a
+        checkout that touched the file without changing it. In that case the entry is refreshed with the new mtime.
+
+        :return: a (unchanged, sha256) pair; sha256 is None when the hash did not need to be computed
+        """
+        if stat_result is None:
+            stat_result = os.stat(file_path)
+        entry = self.files.get(relative_path)
+        if entry is None:
+            return False, None
+        if entry['size'] == stat_result.st_size and entry['mtime_ns'] == stat_result.st_mtime_ns:
+            return True, None
+        sha256 = file_sha256(file_path)
+        if entry['size'] == stat_result.st_size and entry['sha256'] == sha256:
+            entry['mtime_ns'] = stat_result.st_mtime_ns
+            return True, sha256
+        return False, sha256
+
+    def record(self, relative_path, file_path, stat_result=None, sha256=None):
+        if stat_result is None:
+            stat_result = os.stat(file_path)
+        if sha256 is None:
+            sha256 = file_sha256(file_path)
+        self.files[relative_path] = {
+            'size': stat_result.st_size,
+            'mtime_ns': stat_result.st_mtime_ns,
+            'sha256': sha256,
+        }
+
+    def remove(self, relative_path):
+        self.files.pop(relative_path, None)
+
+    def relative_paths(self):
+        """
+        Returns the set of recorded source files, relative to the repo.
+        """
+        return set(self.files.keys())
@@ -8,15 +8,17 @@ from llm_project_helper.treesitter import Treesitter, TreesitterMethodNode, Tree
 from llm_project_helper.logs import logger
 
 
-def analyze_code_from_file(file_name):
-    with open(file_name, 'r') as file:
+def analyze_code_from_file(file_name, treesitter_parser: Treesitter | None = None):
+    with open(file_name, 'r', encoding='utf-8') as file:
         # code = file.read()
         file_bytes = file.read().encode()
 
         file_extension = utils.get_file_extension(file_name)
         programming_language = utils.get_programming_language(file_extension)
 
-        treesitter_parser = Treesitter.create_treesitter(programming_language)
+        # a specific parser can be handed in by the caller, otherwise the warm one of the process is used
+        if treesitter_parser is None:
+            treesitter_parser = Treesitter.get_treesitter(programming_language)
         
         treesitter_result_nodes: TreesitterResultNode = treesitter_parser.parse(file_bytes)
         # logger.debug(f'treesitter_result_nodes: {treesitter_result_nodes}')
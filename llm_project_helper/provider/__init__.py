@@ -1,5 +1,8 @@
-from llm_project_helper.provider.zhipuai_api import ZhipuAIAPI
+from llm_project_helper.provider.zhipuai_api import ZhipuAIAPI, shared_zhipuai_api
+from llm_project_helper.provider.zhipuai_async_api import AsyncZhipuAIAPI
 
 __all__ = [
-    "ZhipuAIAPI"
+    "ZhipuAIAPI",
+    "shared_zhipuai_api",
+    "AsyncZhipuAIAPI",
 ]
\ No newline at end of file
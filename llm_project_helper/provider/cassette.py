@@ -0,0 +1,171 @@
+import collections
+import json
+import os
+import threading
+
+from zhipuai.types.chat.chat_completion import Completion
+
+from llm_project_helper.const import LLM_CASSETTE, LLM_CASSETTE_MODE, LLM_CASSETTE_LATENCY
+from llm_project_helper.logs import logger
+
+RECORD = "record"
+REPLAY = "replay"
+CASSETTE_MODES = (RECORD, REPLAY)
+# the latencies of a replay: the recorded ones, or none at all
+CASSETTE_LATENCIES = ("original", "zero")
+
+
+class CassetteMiss(LookupError):
+    """
+    A request replayed from a cassette that has no recorded response for it
+    """
+
+
+class Cassette:
+    """
+    The LLM exchanges of a run, recorded to a file to be replayed offline, e.g. to compare the wall time and the outputs
+    of a pipeline before and after a change of the parser or of the scheduler, on the traffic of a real repo.
+
+    The cassette is a JSON lines file, one compact line per exchange: the cache key of the request, its messages, the
+    completion, the latency, and for a streamed request the time and the content of every chunk. A recording appends
+    every exchange as it completes, so that the exchanges of a killed run are kept.
+
+    A replay serves the recorded completion of every request, by its cache key, after the recorded latency (streamed
+    chunk by chunk), or at once with latency "zero". The responses recorded for the same request are served in their
+    order, the last one again once they are used up. A request that was not recorded raises CassetteMiss: the requests
+    of the replayed run have to be the same as the ones of the recorded run.
+    """
+
+    def __init__(self, path, mode, latency="original"):
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"Unknown cassette mode {mode}, one of {CASSETTE_MODES}")
+        if latency not in CASSETTE_LATENCIES:
+            raise ValueError(f"Unknown cassette latency {latency}, one of {CASSETTE_LATENCIES}")
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.recorded = 0
+        self.replayed = 0
+        self._lock = threading.Lock()
+        self._exchanges = {}
+        self._file = None
+        if mode == RECORD:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._file = open(path, 'a', encoding='utf-8')
+        else:
+            self._load()
+
+    @property
+    def recording(self):
+        return self.mode == RECORD
+
+    @property
+    def replaying(self):
+        return self.mode == REPLAY
+
+    def _load(self):
+        exchanges = collections.defaultdict(list)
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    exchange = json.loads(line)
+                except json.JSONDecodeError:
+                    # the last line of a recording killed while writing it
+                    logger.warning(f"Skipping a truncated exchange of the cassette {self.path}")
+                    continue
+                exchanges[exchange["key"]].append(exchange)
+        self._exchanges = {key: collections.deque(key_exchanges) for key, key_exchanges in exchanges.items()}
+        logger.info(f"Replaying {sum(len(e) for e in exchanges.values())} LLM exchanges of the cassette {self.path}, "
+                    f"{self.latency} latency")
+
+    def record(self, key, messages, completion, latency, chunks=None):
+        """
+        Append an exchange to the cassette
+
+        :param completion: the Completion of the request
+        :param latency: the wall time of the request, in seconds
+        :param chunks: for a streamed request, the (seconds since the request, content) of its chunks
+        """
+        exchange = {
+            "key": key,
+            "messages": messages,
+            "completion": completion.model_dump(mode="json", exclude_none=True),
+            "latency": round(latency, 4),
+        }
+        if chunks is not None:
+            exchange["chunks"] = [[round(offset, 4), content] for offset, content in chunks]
+        line = json.dumps(exchange, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            self.recorded += 1
+
+    def replay(self, key):
+        """
+        The next recorded exchange of a request
+        """
+        with self._lock:
+            key_exchanges = self._exchanges.get(key)
+            if not key_exchanges:
+                raise CassetteMiss(f"No response recorded for the request {key} in the cassette {self.path}")
+            exchange = key_exchanges.popleft() if len(key_exchanges) > 1 else key_exchanges[0]
+            self.replayed += 1
+        return exchange
+
+    def completion(self, exchange):
+        return Completion.model_validate(exchange["completion"])
+
+    def delay(self, exchange):
+        """
+        The time to wait before serving a replayed completion, in seconds
+        """
+        return exchange["latency"] if self.latency == "original" else 0
+
+    def chunks(self, exchange):
+        """
+        The (seconds to wait, content) of the chunks of a replayed stream; a completion recorded unstreamed is a single
+        chunk
+        """
+        chunks = exchange.get("chunks")
+        if chunks is None:
+            chunks = [[exchange["latency"], exchange["completion"]["choices"][0]["message"]["content"]]]
+        previous = 0
+        for offset, content in chunks:
+            yield (offset - previous if self.latency == "original" else 0), content
+            previous = offset
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def log_stats(self):
+        if self.recording:
+            logger.info(f"LLM cassette: {self.recorded} exchanges recorded to {self.path}")
+        else:
+            logger.info(f"LLM cassette: {self.replayed} responses replayed from {self.path}")
+
+
+_shared_cassette = None
+
+
+def use_cassette(path, mode, latency=LLM_CASSETTE_LATENCY):
+    """
+    Record the LLM exchanges of the process to a cassette, or replay them from it. To be called before the providers are
+    created, e.g. by main.py
+    """
+    global _shared_cassette
+    if _shared_cassette is not None:
+        _shared_cassette.close()
+    _shared_cassette = Cassette(path, mode, latency)
+    return _shared_cassette
+
+
+def shared_cassette():
+    """
+    Returns the cassette of the process: the one of use_cassette or of LLM_PROJECT_HELPER_CASSETTE, or None
+    """
+    global _shared_cassette
+    if _shared_cassette is None and LLM_CASSETTE:
+        _shared_cassette = Cassette(LLM_CASSETTE, LLM_CASSETTE_MODE, LLM_CASSETTE_LATENCY)
+    return _shared_cassette
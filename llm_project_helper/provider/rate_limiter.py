@@ -0,0 +1,184 @@
+import asyncio
+import os
+import re
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows: the buckets are then only shared inside the process
+    fcntl = None
+
+from llm_project_helper.const import (LLM_PROJECT_HELPER_ROOT, LLM_RPM, LLM_TPM, LLM_RATE_LIMIT_HEADROOM,
+                                      LLM_RATE_LIMIT_BURST_SECONDS, LLM_COMPLETION_TOKENS_ESTIMATE)
+from llm_project_helper.logs import logger
+
+# the state of the buckets: requests level, tokens level, time of the last refill
+_STATE = struct.Struct('<ddd')
+_CJK_CHARACTERS = re.compile(r'[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]')
+
+
+def estimate_tokens(text):
+    """
+    Rough number of tokens of a text: about one per CJK character and one per 4 other characters.
+    """
+    cjk = len(_CJK_CHARACTERS.findall(text))
+    return cjk + (len(text) - cjk) // 4 + 1
+
+
+class TokenBucketRateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute quotas, as two token buckets shared by all the processes of the host.
+
+    Both buckets refill continuously at headroom times their quota, and hold at most burst_seconds worth of it, so
+    the requests are spread evenly just under the quotas instead of being sent in bursts. A request takes one request
+    and its estimated tokens; a request estimated larger than the whole tokens bucket only waits for a full bucket,
+    and leaves it in debt. Once the response arrives, the difference between the estimate and the usage reported by
+    the provider is taken from (or given back to) the tokens bucket, and the estimates are scaled by the observed
+    ratio of usage to estimate.
+
+    The state lives in a small file under LLM_PROJECT_HELPER_ROOT, locked with fcntl while it is updated.
+
+    :param rpm: requests per minute, 0 for no limit
+    :param tpm: tokens per minute, 0 for no limit
+    """
+
+    def __init__(self, rpm, tpm, state_path, headroom=LLM_RATE_LIMIT_HEADROOM,
+                 burst_seconds=LLM_RATE_LIMIT_BURST_SECONDS):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.state_path = state_path
+        self.request_rate = rpm * headroom / 60
+        self.token_rate = tpm * headroom / 60
+        self.request_capacity = max(1.0, self.request_rate * burst_seconds)
+        self.token_capacity = max(1.0, self.token_rate * burst_seconds)
+        # usage / estimate, learnt from the responses
+        self.estimate_ratio = 1.0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(state_path), exist_ok=True)
+
+    def estimate(self, messages):
+        """
+        Estimated total tokens of a chat request: its messages plus a typical completion.
+        """
+        prompt_tokens = sum(estimate_tokens(message.get("content") or "") + 4 for message in messages)
+        return int((prompt_tokens + LLM_COMPLETION_TOKENS_ESTIMATE) * self.estimate_ratio)
+
+    def acquire(self, tokens):
+        """
+        Block until a request of the estimated tokens fits in the quotas, and take it from the buckets.
+        """
+        while True:
+            wait = self._try_acquire(tokens)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens):
+        """
+        acquire for coroutines: the event loop keeps running while waiting.
+        """
+        while True:
+            wait = self._try_acquire(tokens)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def settle(self, estimated_tokens, used_tokens):
+        """
+        Correct the tokens bucket with the usage reported for a request that was estimated at estimated_tokens.
+        """
+        if estimated_tokens > 0:
+            ratio = used_tokens * self.estimate_ratio / estimated_tokens
+            self.estimate_ratio = min(4.0, max(0.25, 0.8 * self.estimate_ratio + 0.2 * ratio))
+        if not self.tpm:
+            return
+        with self._locked_state() as state:
+            state[1] -= used_tokens - estimated_tokens
+
+    def _try_acquire(self, tokens):
+        """
+        :return: 0 if the request was taken from the buckets, otherwise the seconds to wait before trying again
+        """
+        with self._locked_state() as state:
+            wait = 0.0
+            if self.rpm and state[0] < 1:
+                wait = (1 - state[0]) / self.request_rate
+            needed_tokens = min(tokens, self.token_capacity)
+            if self.tpm and state[1] < needed_tokens:
+                wait = max(wait, (needed_tokens - state[1]) / self.token_rate)
+            if wait > 0:
+                return wait
+            state[0] -= 1
+            state[1] -= tokens
+            return 0.0
+
+    def _locked_state(self):
+        return _LockedState(self)
+
+
+class _LockedState:
+    """
+    The refilled state of the buckets as a [requests, tokens, refill time] list, locked across threads and processes
+    for the duration of the with block, and written back when it ends.
+    """
+
+    def __init__(self, limiter):
+        self.limiter = limiter
+        self.fd = None
+
+    def __enter__(self):
+        limiter = self.limiter
+        limiter._lock.acquire()
+        try:
+            self.fd = os.open(limiter.state_path, os.O_RDWR | os.O_CREAT, 0o644)
+            if fcntl is not None:
+                fcntl.flock(self.fd, fcntl.LOCK_EX)
+            data = os.pread(self.fd, _STATE.size, 0)
+        except BaseException:
+            self._release()
+            raise
+        now = time.time()
+        if len(data) == _STATE.size:
+            requests, tokens, updated_at = _STATE.unpack(data)
+        else:
+            requests, tokens, updated_at = limiter.request_capacity, limiter.token_capacity, now
+        # the clock may go backwards, e.g. between processes right after a time sync
+        elapsed = max(0.0, now - updated_at)
+        self.state = [
+            min(limiter.request_capacity, requests + elapsed * limiter.request_rate),
+            min(limiter.token_capacity, tokens + elapsed * limiter.token_rate),
+            now,
+        ]
+        return self.state
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            if exc_type is None:
+                os.pwrite(self.fd, _STATE.pack(*self.state), 0)
+        finally:
+            self._release()
+
+    def _release(self):
+        if self.fd is not None:
+            os.close(self.fd)  # also releases the flock
+            self.fd = None
+        self.limiter._lock.release()
+
+
+_shared_rate_limiters = {}
+
+
+def shared_rate_limiter(model):
+    """
+    Returns the rate limiter of the process for a model, configured by LLM_PROJECT_HELPER_RPM and
+    LLM_PROJECT_HELPER_TPM, or None when neither is set.
+    """
+    if not LLM_RPM and not LLM_TPM:
+        return None
+    if model not in _shared_rate_limiters:
+        state_path = os.path.join(LLM_PROJECT_HELPER_ROOT, "rate_limit", f"{model}.bucket")
+        logger.info(f"Rate limiting {model} to {LLM_RPM} requests and {LLM_TPM} tokens per minute")
+        _shared_rate_limiters[model] = TokenBucketRateLimiter(LLM_RPM, LLM_TPM, state_path)
+    return _shared_rate_limiters[model]
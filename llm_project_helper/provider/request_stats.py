@@ -0,0 +1,58 @@
+import statistics
+import threading
+
+from llm_project_helper.logs import logger
+
+
+class RequestLatencies:
+    """
+    Wall time of the LLM requests sent by the providers of the process, from sending the request to the end of the
+    response, so that the cost of new connections (TCP and TLS handshakes) shows up in the slowest requests.
+    The requests answered from the response cache are not counted.
+    """
+
+    def __init__(self):
+        self.samples = []
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def reset(self):
+        with self._lock:
+            self.samples = []
+
+    def stats(self):
+        """
+        The count, mean, min, max and 50th / 90th / 99th percentiles of the latencies, in seconds
+        """
+        with self._lock:
+            samples = sorted(self.samples)
+        if not samples:
+            return {"count": 0}
+        if len(samples) > 1:
+            percentiles = statistics.quantiles(samples, n=100, method="inclusive")
+        else:
+            percentiles = samples * 99
+        return {
+            "count": len(samples),
+            "mean": statistics.fmean(samples),
+            "min": samples[0],
+            "p50": percentiles[49],
+            "p90": percentiles[89],
+            "p99": percentiles[98],
+            "max": samples[-1],
+        }
+
+    def log_stats(self):
+        stats = self.stats()
+        if not stats["count"]:
+            return
+        logger.info(f"LLM requests: {stats['count']}, latency mean {stats['mean'] * 1000:.0f} ms, "
+                    f"p50 {stats['p50'] * 1000:.0f} ms, p90 {stats['p90'] * 1000:.0f} ms, "
+                    f"p99 {stats['p99'] * 1000:.0f} ms, max {stats['max'] * 1000:.0f} ms")
+
+
+# shared by all the providers of the process
+request_latencies = RequestLatencies()
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from llm_project_helper.const import LLM_PROJECT_HELPER_ROOT, LLM_CACHE_ENABLED, LLM_CACHE_MAX_BYTES
+from llm_project_helper.logs import logger
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    response TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used);
+"""
+
+
+def cache_key(model, messages, params=None):
+    """
+    The content address of a chat request: the sha256 of its model, messages and parameters
+    """
+    request = {"model": model, "messages": messages, "params": params or {}}
+    return hashlib.sha256(json.dumps(request, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    Disk-backed cache of the chat completions, keyed by cache_key, so that a request already answered, in this run or a
+    previous one, is not sent again.
+
+    The responses are stored in a sqlite database under LLM_PROJECT_HELPER_ROOT, in WAL mode, so that several
+    processes can read and write it at the same time. Once the stored responses exceed max_bytes, the least recently
+    used ones are evicted.
+    """
+
+    def __init__(self, db_path, max_bytes=LLM_CACHE_MAX_BYTES):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.connection = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(_SCHEMA)
+
+    def get(self, key):
+        """
+        Returns the cached response json of the key, or None
+        """
+        with self._lock:
+            row = self.connection.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.connection.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            return row[0]
+
+    def put(self, key, response):
+        """
+        Store the response json of the key, and evict the least recently used responses beyond max_bytes
+        """
+        size = len(response.encode('utf-8'))
+        with self._lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, size, last_used) VALUES (?, ?, ?, ?)",
+                    (key, response, size, time.time()))
+                self._evict()
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+
+    def _evict(self):
+        total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted_keys = []
+        for key, size in self.connection.execute("SELECT key, size FROM responses ORDER BY last_used"):
+            if total <= self.max_bytes:
+                break
+            evicted_keys.append((key,))
+            total -= size
+        self.connection.executemany("DELETE FROM responses WHERE key = ?", evicted_keys)
+        self.evictions += len(evicted_keys)
+
+    def stats(self):
+        """
+        The hits, misses and evictions of this process, and the entries and bytes of the cache
+        """
+        with self._lock:
+            entries, size = self.connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": size,
+        }
+
+    def log_stats(self):
+        stats = self.stats()
+        logger.info(f"LLM response cache: {stats['hits']} hits, {stats['misses']} misses "
+                    f"({stats['hit_rate']:.1%} hit rate), {stats['evictions']} evictions, "
+                    f"{stats['entries']} entries, {stats['bytes'] / 1024 / 1024:.1f} MiB")
+
+
+_shared_response_cache = None
+
+
+def shared_response_cache():
+    """
+    Returns the response cache of the process, or None when LLM_PROJECT_HELPER_LLM_CACHE is off
+    """
+    global _shared_response_cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    if _shared_response_cache is None:
+        _shared_response_cache = ResponseCache(os.path.join(LLM_PROJECT_HELPER_ROOT, "llm_cache", "responses.db"))
+    return _shared_response_cache
@@ -1,17 +1,28 @@
+import httpx
 from zhipuai import ZhipuAI
+from zhipuai.core._http_client import ZHIPUAI_DEFAULT_TIMEOUT
+from zhipuai.types.chat.chat_completion import Completion, CompletionChoice, CompletionMessage, CompletionUsage
 
 import os
+import time
 from dotenv import load_dotenv
+from llm_project_helper.const import LLM_HTTP_MAX_CONNECTIONS, LLM_HTTP_KEEPALIVE_EXPIRY
 from llm_project_helper.logs import logger
+from llm_project_helper.provider.cassette import shared_cassette
+from llm_project_helper.provider.rate_limiter import shared_rate_limiter
+from llm_project_helper.provider.request_stats import request_latencies
+from llm_project_helper.provider.response_cache import cache_key, shared_response_cache
 
+MODEL = 'glm-4'
 
-class ZhipuAIAPI:
-    def __init__(self):
-        # Load environment variables from .env file
-        load_dotenv()
-        # Get the value of the API key from the environment variable
-        api_key = os.getenv("ZHIPUAI_API_KEY")
-        self.client = ZhipuAI(api_key=api_key)
+
+class ZhipuAIBase:
+    """
+    The message handling shared by the sync and async ZhipuAI providers.
+    """
+    rate_limiter = None
+    response_cache = None
+    cassette = None
 
     def format_history(self, history):
         """
@@ -32,6 +43,134 @@ class ZhipuAIAPI:
         logger.info(f"completion_tokens usage: {usage.completion_tokens}")
         logger.info(f"total_tokens usage: {usage.total_tokens}")
 
+    def acquire_rate_limit(self, messages):
+        """
+        Wait for the request of the messages to fit in the RPM / TPM quotas, and returns its estimated tokens
+        """
+        if self.rate_limiter is None:
+            return 0
+        estimated_tokens = self.rate_limiter.estimate(messages)
+        self.rate_limiter.acquire(estimated_tokens)
+        return estimated_tokens
+
+    async def acquire_rate_limit_async(self, messages):
+        if self.rate_limiter is None:
+            return 0
+        estimated_tokens = self.rate_limiter.estimate(messages)
+        await self.rate_limiter.acquire_async(estimated_tokens)
+        return estimated_tokens
+
+    def settle_rate_limit(self, estimated_tokens, usage):
+        """
+        Correct the TPM quota with the actual usage of a request
+        """
+        if self.rate_limiter is not None and usage is not None:
+            self.rate_limiter.settle(estimated_tokens, usage.total_tokens)
+
+    def cached_completion(self, messages, params=None):
+        """
+        Returns the cache key of the messages (None without a cache), and their cached Completion or None
+
+        :param params: the parameters of a streamed request, see stream_params
+        """
+        if self.response_cache is None:
+            return None, None
+        key = cache_key(MODEL, messages, params)
+        response = self.response_cache.get(key)
+        if response is None:
+            return key, None
+        logger.debug(f"LLM response cache hit: {key}")
+        return key, Completion.model_validate_json(response)
+
+    def store_completion(self, key, completion):
+        if key is not None:
+            self.response_cache.put(key, completion.model_dump_json())
+
+    def replayed_exchange(self, messages, params=None):
+        """
+        The recorded exchange of a request when replaying a cassette, else None
+        """
+        if self.cassette is None or not self.cassette.replaying:
+            return None
+        return self.cassette.replay(cache_key(MODEL, messages, params or stream_params(False)))
+
+    def record_exchange(self, messages, completion, latency, chunks=None, params=None):
+        """
+        Record an exchange to the cassette, when recording one; chunks are the (offset, content) of a streamed response
+        """
+        if self.cassette is not None and self.cassette.recording:
+            self.cassette.record(cache_key(MODEL, messages, params or stream_params(False)), messages, completion,
+                                 latency, chunks)
+
+    def stream_completion(self, content, finish_reason, usage):
+        """
+        The Completion of a streamed response, to be cached like the other responses
+        """
+        if usage is None:
+            usage = CompletionUsage(prompt_tokens=0, completion_tokens=0, total_tokens=0)
+        return Completion(
+            model=MODEL,
+            created=int(time.time()),
+            choices=[CompletionChoice(index=0, finish_reason=finish_reason,
+                                      message=CompletionMessage(role="assistant", content=content))],
+            usage=CompletionUsage.model_validate(usage.model_dump()),
+        )
+
+
+def http_limits(max_connections=LLM_HTTP_MAX_CONNECTIONS):
+    """
+    The connection pool of the providers: the idle connections are kept open for LLM_HTTP_KEEPALIVE_EXPIRY seconds,
+    long enough to be reused by the next request instead of paying a new TCP and TLS handshake
+    """
+    return httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections,
+                        keepalive_expiry=LLM_HTTP_KEEPALIVE_EXPIRY)
+
+
+class ZhipuAIAPI(ZhipuAIBase):
+    """
+    Use shared_zhipuai_api() rather than a new instance per file or per request: each instance has its own
+    connection pool.
+    """
+
+    def __init__(self):
+        # Load environment variables from .env file
+        load_dotenv()
+        # Get the value of the API key from the environment variable
+        api_key = os.getenv("ZHIPUAI_API_KEY")
+        self.http_client = httpx.Client(timeout=ZHIPUAI_DEFAULT_TIMEOUT, limits=http_limits())
+        self.client = ZhipuAI(api_key=api_key, http_client=self.http_client)
+        self.rate_limiter = shared_rate_limiter(MODEL)
+        self.cassette = shared_cassette()
+        # with a cassette, every request goes to the network or to the cassette, with its own latency
+        self.response_cache = shared_response_cache() if self.cassette is None else None
+
+    def _create(self, messages):
+        key, response = self.cached_completion(messages)
+        if response is not None:
+            return response
+        exchange = self.replayed_exchange(messages)
+        if exchange is not None:
+            start = time.perf_counter()
+            time.sleep(self.cassette.delay(exchange))
+            response = self.cassette.completion(exchange)
+            request_latencies.record(time.perf_counter() - start)
+            self.record_usage(response=response)
+            return response
+        estimated_tokens = self.acquire_rate_limit(messages)
+        start = time.perf_counter()
+        response = self.client.chat.completions.create(
+            model=MODEL,
+            messages=messages,
+            stream=False
+        )
+        latency = time.perf_counter() - start
+        request_latencies.record(latency)
+        self.record_exchange(messages, response, latency)
+        self.settle_rate_limit(estimated_tokens, response.usage)
+        self.record_usage(response=response)
+        self.store_completion(key, response)
+        return response
+
     def predict_with_history(self, message, history=[]):
         """
         Predict using sse and stream is true
@@ -39,13 +178,8 @@ class ZhipuAIAPI:
         history.append({"role": "user", "content": message})
         logger.debug(f"history: {history}")
 
-        response = self.client.chat.completions.create(
-            model='glm-4',
-            messages=history,
-            stream=False
-        )
+        response = self._create(history)
 
-        self.record_usage(response=response)
         return response.choices[0].message
 
     def predict(self, message, history=[]):
@@ -55,33 +189,130 @@ class ZhipuAIAPI:
         history_zhipuai_format = self.format_history(history)
         history_zhipuai_format.append({"role": "user", "content": message})
 
-        response = self.client.chat.completions.create(
-            model='glm-4',
-            messages=history_zhipuai_format,
-            stream=False
-        )
+        response = self._create(history_zhipuai_format)
 
-        self.record_usage(response=response)
         return response.choices[0].message
 
     def predict_sse(self, message, history=[]):
         """
-        Predict using sse and stream is true
+        Predict using sse and stream is true: a generator of the partial message
+        """
+        partial_message = ""
+        for content, _ in self.predict_stream(message, history):
+            if content:
+                partial_message = partial_message + content
+                yield partial_message
+        return partial_message
+
+    def predict_stream(self, message, history=[], stop=None):
+        """
+        Predict using sse and stream is true: a generator of the (content, None) of the chunks, then of ("",
+        finish_reason) once the stream is complete, the finish_reason being "length" for a truncated completion.
+
+        :param stop: if given, the stream is closed as soon as this text is generated, the last chunk ending with it,
+                     and finishes with "stop": the tokens after it are neither waited for nor paid for
         """
         history_zhipuai_format = self.format_history(history)
         history_zhipuai_format.append({"role": "user", "content": message})
 
+        # a completion cut at stop is not the one of the same messages without it
+        params = stream_params(True, stop)
+        key, cached = self.cached_completion(history_zhipuai_format, params)
+        if cached is not None:
+            yield cached.choices[0].message.content, None
+            yield "", cached.choices[0].finish_reason
+            return
+
+        exchange = self.replayed_exchange(history_zhipuai_format, params)
+        if exchange is not None:
+            start = time.perf_counter()
+            partial_message = ""
+            finish_reason = None
+            for delay, content in self.cassette.chunks(exchange):
+                time.sleep(delay)
+                content, finish_reason = cut_at_stop(partial_message, content, stop)
+                partial_message = partial_message + content
+                yield content, None
+                if finish_reason is not None:
+                    break
+            request_latencies.record(time.perf_counter() - start)
+            yield "", finish_reason or exchange["completion"]["choices"][0]["finish_reason"]
+            return
+
+        estimated_tokens = self.acquire_rate_limit(history_zhipuai_format)
+        start = time.perf_counter()
         response = self.client.chat.completions.create(
-            model='glm-4',
+            model=MODEL,
             messages=history_zhipuai_format,
             stream=True
         )
 
         partial_message = ""
-        for chunk in response:
-            if len(chunk.choices[0].delta.content) != 0:
-                partial_message = partial_message + chunk.choices[0].delta.content
-                yield partial_message
+        usage = None
+        finish_reason = None
+        chunks = []
+        try:
+            for chunk in response:
+                if chunk.usage is not None:
+                    # the usage comes with the last chunk of the stream
+                    usage = chunk.usage
+                    self.record_usage(response=chunk)
+                if chunk.choices and chunk.choices[0].finish_reason:
+                    finish_reason = chunk.choices[0].finish_reason
+                if chunk.choices and chunk.choices[0].delta.content:
+                    content, stopped = cut_at_stop(partial_message, chunk.choices[0].delta.content, stop)
+                    chunks.append((time.perf_counter() - start, content))
+                    partial_message = partial_message + content
+                    yield content, None
+                    if stopped is not None:
+                        finish_reason = stopped
+                        break
+        finally:
+            # stopped early, or by the consumer: the rest of the completion is not read
+            response.response.close()
 
-        self.record_usage(response=response)
-        return partial_message
+        latency = time.perf_counter() - start
+        request_latencies.record(latency)
+        self.settle_rate_limit(estimated_tokens, usage)
+        # an interrupted stream has no finish_reason, and is neither cached nor recorded
+        if finish_reason is not None:
+            completion = self.stream_completion(partial_message, finish_reason, usage)
+            self.store_completion(key, completion)
+            self.record_exchange(history_zhipuai_format, completion, latency, chunks, params)
+        yield "", finish_reason
+
+
+def stream_params(stream, stop=None):
+    """
+    The parameters of a request that change its completion, in the cache key of its response and recorded exchange
+    """
+    params = {"stream": stream}
+    if stop is not None:
+        params["stop"] = stop
+    return params
+
+
+def cut_at_stop(partial_message, content, stop):
+    """
+    The part of the new content of a stream to keep, up to the end of the stop text, and "stop" if the stop text was
+    generated, else None. The stop text may span the end of the partial message and the new content.
+    """
+    if stop is None:
+        return content, None
+    at = (partial_message + content).find(stop, max(len(partial_message) - len(stop) + 1, 0))
+    if at == -1:
+        return content, None
+    return content[:at + len(stop) - len(partial_message)], "stop"
+
+
+_shared_zhipuai_api = None
+
+
+def shared_zhipuai_api():
+    """
+    Returns the ZhipuAIAPI of the process, created on first use and then shared by all the analyzers
+    """
+    global _shared_zhipuai_api
+    if _shared_zhipuai_api is None:
+        _shared_zhipuai_api = ZhipuAIAPI()
+    return _shared_zhipuai_api
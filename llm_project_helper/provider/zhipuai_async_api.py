@@ -0,0 +1,282 @@
+import asyncio
+import contextlib
+import json
+import os
+import random
+import time
+
+import httpx
+import jwt
+from dotenv import load_dotenv
+from zhipuai import (APIStatusError, APIRequestFailedError, APIAuthenticationError, APIReachLimitError,
+                     APIInternalError, APIServerFlowExceedError, APITimeoutError)
+from zhipuai.core._http_client import ZHIPUAI_DEFAULT_TIMEOUT
+from zhipuai.types.chat.chat_completion import Completion
+from zhipuai.types.chat.chat_completion_chunk import ChatCompletionChunk
+
+from llm_project_helper.const import LLM_MAX_IN_FLIGHT, LLM_MAX_RETRIES, LLM_RETRY_BACKOFF, LLM_RETRY_MAX_DELAY
+from llm_project_helper.logs import logger
+from llm_project_helper.provider.cassette import shared_cassette
+from llm_project_helper.provider.rate_limiter import shared_rate_limiter
+from llm_project_helper.provider.request_stats import request_latencies
+from llm_project_helper.provider.response_cache import shared_response_cache
+from llm_project_helper.provider.zhipuai_api import MODEL, ZhipuAIBase, cut_at_stop, http_limits, stream_params
+
+DEFAULT_BASE_URL = "https://open.bigmodel.cn/api/paas/v4"
+# the lifetime of the JWT of the requests, renewed TOKEN_RENEWAL_SECONDS before it expires
+TOKEN_TTL_SECONDS = 3 * 60
+TOKEN_RENEWAL_SECONDS = 30
+
+_STATUS_ERRORS = {
+    400: APIRequestFailedError,
+    401: APIAuthenticationError,
+    429: APIReachLimitError,
+    500: APIInternalError,
+    503: APIServerFlowExceedError,
+}
+
+
+class AsyncZhipuAIAPI(ZhipuAIBase):
+    """
+    asyncio version of ZhipuAIAPI: the same predict methods, returning the same CompletionMessage, as coroutines.
+
+    The zhipuai SDK only has a blocking client, so the chat completions endpoint is called through an
+    httpx.AsyncClient, with the authentication, base url (ZHIPUAI_BASE_URL) and error types of the SDK. At most
+    max_in_flight requests are sent at the same time; the other callers wait for a free slot. A request answered with a
+    429 or a 5xx, or timed out, is retried up to max_retries times, so that one of them does not fail a whole run.
+    """
+
+    def __init__(self, max_in_flight=LLM_MAX_IN_FLIGHT, max_retries=LLM_MAX_RETRIES, retry_backoff=LLM_RETRY_BACKOFF):
+        # Load environment variables from .env file
+        load_dotenv()
+        self.api_key = os.getenv("ZHIPUAI_API_KEY")
+        base_url = os.getenv("ZHIPUAI_BASE_URL") or DEFAULT_BASE_URL
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.token = None
+        self.token_expiry = 0
+        self.client = httpx.AsyncClient(
+            base_url=base_url.rstrip('/') + '/',
+            timeout=ZHIPUAI_DEFAULT_TIMEOUT,
+            limits=http_limits(max_in_flight),
+        )
+        self.in_flight = asyncio.Semaphore(max_in_flight)
+        self.rate_limiter = shared_rate_limiter(MODEL)
+        self.cassette = shared_cassette()
+        # with a cassette, every request goes to the network or to the cassette, with its own latency
+        self.response_cache = shared_response_cache() if self.cassette is None else None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    def _headers(self):
+        return {
+            "Accept": "application/json",
+            "Content-Type": "application/json; charset=UTF-8",
+            "Authorization": self._token(),
+        }
+
+    def _token(self):
+        """
+        The JWT of the API key, signed with its secret as the SDK does, reused until shortly before it expires
+        """
+        now = time.time()
+        if self.token is None or now > self.token_expiry - TOKEN_RENEWAL_SECONDS:
+            try:
+                api_key, secret = self.api_key.split(".")
+            except (AttributeError, ValueError) as err:
+                raise APIAuthenticationError("invalid api_key") from err
+            self.token_expiry = now + TOKEN_TTL_SECONDS
+            payload = {"api_key": api_key, "exp": int(self.token_expiry * 1000), "timestamp": int(now * 1000)}
+            self.token = jwt.encode(payload, secret, algorithm="HS256", headers={"alg": "HS256", "sign_type": "SIGN"})
+        return self.token
+
+    async def _send(self, payload, stream=False) -> httpx.Response:
+        """
+        POST a request to the chat completions endpoint, retried after a 429, a 5xx or a timeout, up to max_retries
+        times; the other errors, and the last one, are raised with the error type of the SDK. The response of a
+        stream is returned open, for the caller to read and close.
+        """
+        attempt = 0
+        while True:
+            request = self.client.build_request("POST", "chat/completions", json=payload, headers=self._headers())
+            try:
+                response = await self.client.send(request, stream=stream)
+            except httpx.TimeoutException as err:
+                if attempt >= self.max_retries:
+                    raise APITimeoutError(request=err.request) from err
+                delay = self.retry_delay(attempt)
+                logger.warning(f"LLM request timed out, retry {attempt + 1} in {delay:.1f} s")
+            else:
+                if response.is_success:
+                    return response
+                await response.aread()
+                await response.aclose()
+                if not _retryable(response.status_code) or attempt >= self.max_retries:
+                    self._raise_for_status(response)
+                delay = self.retry_delay(attempt, response.headers.get("Retry-After"))
+                logger.warning(f"LLM request answered with a {response.status_code}, retry {attempt + 1} in "
+                               f"{delay:.1f} s")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def retry_delay(self, attempt, retry_after=None):
+        """
+        The seconds to wait before retrying a request: the Retry-After of its response in seconds, if any, else a
+        jittered exponential backoff, at most LLM_RETRY_MAX_DELAY
+        """
+        try:
+            delay = float(retry_after)
+        except (TypeError, ValueError):
+            delay = self.retry_backoff * 2 ** attempt * random.uniform(0.5, 1)
+        return min(max(delay, 0), LLM_RETRY_MAX_DELAY)
+
+    def _raise_for_status(self, response: httpx.Response):
+        if response.is_success:
+            return
+        error_class = _STATUS_ERRORS.get(response.status_code, APIStatusError)
+        raise error_class(f"Error code: {response.status_code}, with error text {response.text.strip()}",
+                          response=response)
+
+    async def _create(self, messages) -> Completion:
+        key, cached = self.cached_completion(messages)
+        if cached is not None:
+            return cached
+        exchange = self.replayed_exchange(messages)
+        if exchange is not None:
+            # a replayed request still takes a slot, so that the replay has the concurrency of the recording
+            async with self.in_flight:
+                start = time.perf_counter()
+                await asyncio.sleep(self.cassette.delay(exchange))
+                completion = self.cassette.completion(exchange)
+                request_latencies.record(time.perf_counter() - start)
+            self.record_usage(response=completion)
+            return completion
+        async with self.in_flight:
+            estimated_tokens = await self.acquire_rate_limit_async(messages)
+            start = time.perf_counter()
+            response = await self._send({"model": MODEL, "messages": messages, "stream": False})
+            latency = time.perf_counter() - start
+            request_latencies.record(latency)
+            completion = Completion.model_validate(response.json())
+            self.record_exchange(messages, completion, latency)
+            self.settle_rate_limit(estimated_tokens, completion.usage)
+        self.record_usage(response=completion)
+        self.store_completion(key, completion)
+        return completion
+
+    async def predict_with_history(self, message, history=None):
+        """
+        Predict with the given history of messages, followed by the message
+        """
+        messages = list(history or []) + [{"role": "user", "content": message}]
+        logger.debug(f"history: {messages}")
+
+        response = await self._create(messages)
+
+        return response.choices[0].message
+
+    async def predict(self, message, history=[]):
+        """
+        Predict with a history of (human, assistant) pairs
+        """
+        history_zhipuai_format = self.format_history(history)
+        history_zhipuai_format.append({"role": "user", "content": message})
+
+        response = await self._create(history_zhipuai_format)
+
+        return response.choices[0].message
+
+    async def predict_sse(self, message, history=[]):
+        """
+        Predict using sse and stream is true: an async generator of the partial message
+        """
+        partial_message = ""
+        async with contextlib.aclosing(self.predict_stream(message, history)) as stream:
+            async for content, _ in stream:
+                if content:
+                    partial_message = partial_message + content
+                    yield partial_message
+
+    async def predict_stream(self, message, history=[], stop=None):
+        """
+        Predict using sse and stream is true: an async generator of the (content, None) of the chunks, then of ("",
+        finish_reason) once the stream is complete, see ZhipuAIAPI.predict_stream
+        """
+        history_zhipuai_format = self.format_history(history)
+        history_zhipuai_format.append({"role": "user", "content": message})
+
+        params = stream_params(True, stop)
+        key, cached = self.cached_completion(history_zhipuai_format, params)
+        if cached is not None:
+            yield cached.choices[0].message.content, None
+            yield "", cached.choices[0].finish_reason
+            return
+
+        exchange = self.replayed_exchange(history_zhipuai_format, params)
+        if exchange is not None:
+            partial_message = ""
+            finish_reason = None
+            async with self.in_flight:
+                start = time.perf_counter()
+                for delay, content in self.cassette.chunks(exchange):
+                    await asyncio.sleep(delay)
+                    content, finish_reason = cut_at_stop(partial_message, content, stop)
+                    partial_message = partial_message + content
+                    yield content, None
+                    if finish_reason is not None:
+                        break
+                request_latencies.record(time.perf_counter() - start)
+            yield "", finish_reason or exchange["completion"]["choices"][0]["finish_reason"]
+            return
+
+        partial_message = ""
+        usage = None
+        finish_reason = None
+        chunks = []
+        async with self.in_flight:
+            estimated_tokens = await self.acquire_rate_limit_async(history_zhipuai_format)
+            start = time.perf_counter()
+            response = await self._send({"model": MODEL, "messages": history_zhipuai_format, "stream": True}, True)
+            # closing the response, also when the stream is stopped early: the rest is not read
+            async with contextlib.aclosing(response):
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    chunk = ChatCompletionChunk.model_validate(json.loads(data))
+                    if chunk.usage is not None:
+                        usage = chunk.usage
+                        self.record_usage(response=chunk)
+                    if chunk.choices and chunk.choices[0].finish_reason:
+                        finish_reason = chunk.choices[0].finish_reason
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        content, stopped = cut_at_stop(partial_message, chunk.choices[0].delta.content, stop)
+                        chunks.append((time.perf_counter() - start, content))
+                        partial_message = partial_message + content
+                        yield content, None
+                        if stopped is not None:
+                            finish_reason = stopped
+                            break
+            latency = time.perf_counter() - start
+            request_latencies.record(latency)
+        self.settle_rate_limit(estimated_tokens, usage)
+        # an interrupted stream has no finish_reason, and is neither cached nor recorded
+        if finish_reason is not None:
+            completion = self.stream_completion(partial_message, finish_reason, usage)
+            self.store_completion(key, completion)
+            self.record_exchange(history_zhipuai_format, completion, latency, chunks, params)
+        yield "", finish_reason
+
+
+def _retryable(status_code):
+    return status_code == 429 or status_code >= 500
@@ -1,20 +1,54 @@
 import os
 import json
+import asyncio
+import functools
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from llm_project_helper import utils
 from dotenv import load_dotenv
-from llm_project_helper.parser.python_parser import python_analyze_code
 from llm_project_helper.parser.treesitter_parser import analyze_code_from_file
+from llm_project_helper.treesitter import dumps_result
+from llm_project_helper.treesitter.treesitter_registry import TreesitterRegistry
 from llm_project_helper.logs import logger
-from llm_project_helper.analyzer.file_summary_analyzer import FileSummaryAnalyzer
-from llm_project_helper.analyzer.code_section_analyzer import CodeSectionAnalyzer
+from llm_project_helper.manifest import TraverseManifest
+from llm_project_helper.job_state import JobStateStore, PARSED, SUMMARIZED, COMMENTED
+from llm_project_helper.analyzer.file_summary_analyzer import FileSummaryAnalyzer, AsyncFileSummaryAnalyzer
+from llm_project_helper.analyzer.code_section_analyzer import CodeSectionAnalyzer, AsyncCodeSectionAnalyzer
+from llm_project_helper.analyzer.section_index import SectionIndex
+from llm_project_helper.provider import AsyncZhipuAIAPI, shared_zhipuai_api
 from llm_project_helper.const import TREE_JSON, FORCE_RE_ANALYZE, FORCE_RE_COMMENT, AVAILABLE_SAAS, WORKSPACE_DIR, Language
+from llm_project_helper.const import STRUCTURE_JSON_INDENT, LLM_MAX_IN_FLIGHT, COMMENT_BATCH_TOKENS
+from llm_project_helper.const import STRUCTURE_PROMPT_DETAIL, SECTION_DEDUP, PIPELINE_QUEUE_SIZE, MAX_PROMPT_TOKENS
 
 load_dotenv()
 
 
 class RepoTraverser:
-    def __init__(self, repo_path):
+    def __init__(self, repo_path, api=None):
+        """
+        :param api: the ZhipuAIAPI of analyze_repo and sectioned_comment, by default the one shared by the process
+        """
         self.repo_path = repo_path
+        self.api = api
+        # the JobStateStore of the run, see begin_job
+        self.job_state = None
+
+    def begin_job(self, options, resume=True):
+        """
+        Keep the state of the run in a JobStateStore of the workspace: the stage reached by every file and the remarks
+        committed as they arrive, so that the run resumes where it stopped if it is started again with the same
+        options after a crash.
+
+        :param options: the options of the run, e.g. the arguments of main.py; they have to be json serializable
+        :param resume: False starts a new job even if an unfinished one has the same options
+        :return: whether an unfinished job was resumed
+        """
+        self.job_state = JobStateStore(self.get_cur_ws_dir())
+        return self.job_state.begin(options, resume)
+
+    def finish_job(self):
+        if self.job_state is not None:
+            self.job_state.finish()
+            self.job_state.log_stats()
 
     def get_cur_ws_dir(self):
         if not self.repo_path:
@@ -45,115 +79,648 @@ class RepoTraverser:
             os.makedirs(cur_ws_dir)
         return cur_ws_dir
 
-    def traverse_repo(self):
+    def traverse_repo(self, jobs=1, only_files=None):
         """
         Traverse the whole repository and analyze the code structure of each file.
 
+        Files recorded as unchanged in the workspace manifest are not parsed again, and the outputs of files that
+        were deleted from the repo are dropped. The counts are kept in self.traverse_stats.
+
+        :param jobs: number of worker processes used for the structure extraction. 1 keeps the serial traversal,
+                     0 or a negative number uses all available CPUs
+        :param only_files: if given, only these files (relative to the repo) are traversed, e.g. the ones from
+                           GitChangeSet.files_to_traverse; deleted files are then handled by apply_git_changes
         :return: traverse the whole repo and analyze their code structure and get result
         """
         
         cur_ws_dir = self.get_cur_ws_dir()
-
-        for root, dirs, files in os.walk(self.repo_path):
-            for file in files:
-                file_extension = utils.get_file_extension(file)
-                programming_language = utils.get_programming_language(file_extension)
-                if programming_language is Language.UNKNOWN:
-                    continue
-                file_path = os.path.join(root, file)
-                relative_path = os.path.relpath(file_path, self.repo_path)
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as file_handler:
-                        code = file_handler.read()
-                    # output = python_analyze_code(code)
-                    raw_output = analyze_code_from_file(file_path)
-                    result_dict = raw_output.model_dump()
-
-                    # Output the result to a json file
-                    result_dict['relative_path'] = relative_path
-
-                    json_file = relative_path.replace(os.sep, '--') + '.json'
-
-                    if TREE_JSON:
-                        # separate the folder and *.py from relative_path by os.sep
-                        py_path = relative_path.split(os.sep)[-1]
-                        folder_path = relative_path.replace(py_path, '')
-
-                        cur_file_path = os.path.join(cur_ws_dir, folder_path)
-                        # src_file_path = os.path.join(self.repo_path, folder_path)
-                        if not os.path.exists(cur_file_path):
-                            logger.debug(f'Creating folder: {cur_file_path}')
-                            os.makedirs(cur_file_path)
-                        json_file = os.path.join(cur_file_path, py_path + '.json')
-
-                        # # 之前是临时的直接拷贝，后续需要通过规则获取源文件，或者记录在json文件中
-                        # # DONE: 在sectioned_comment通过规则获取源文件
-                        # src_file = os.path.join(src_file_path, py_path)
-                        # # copy the src_file to cur_file_path
-                        # shutil.copy2(src_file, os.path.join(cur_file_path, py_path))
-
-                    json_result = json.dumps(result_dict, indent=4, default=str)
-                    with open(os.path.join(cur_ws_dir, json_file), 'w') as f:
-                        f.write(json_result)
-
-                except Exception as e:
-                    logger.error(f"Error reading file {file_path}: {e}")
+        manifest = TraverseManifest(cur_ws_dir).load()
+        reused_files, to_parse, stale_paths = self._plan_traverse(cur_ws_dir, manifest, only_files)
+        parsed_files = self._traverse_files(cur_ws_dir, list(to_parse), jobs)
+        self._mark_parsed(cur_ws_dir, parsed_files)
+        self._finish_traverse(manifest, to_parse, parsed_files, len(reused_files), len(stale_paths))
         return cur_ws_dir
 
-    def analyze_repo(self, analyze_folder, force_re_anlayze):
-        if not analyze_folder:
-            raise ValueError("Analyze folder not found")
+    def _plan_traverse(self, cur_ws_dir, manifest, only_files):
+        """
+        Find the source files to parse, and drop the outputs of the files deleted from the repo.
+
+        :return: the source files whose structure json is up to date, the ones to parse, as
+                 {file_path: (relative_path, stat_result, sha256)}, and the relative paths of the deleted files
+        """
+        if only_files is None:
+            source_files = collect_source_files(self.repo_path)
+            stale_paths = manifest.relative_paths()
+        else:
+            source_files = [os.path.join(self.repo_path, relative_path) for relative_path in only_files
+                            if is_source_file(relative_path)
+                            and os.path.isfile(os.path.join(self.repo_path, relative_path))]
+            stale_paths = set()
+
+        reused_files = []
+        to_parse = {}
+        for file_path in source_files:
+            relative_path = os.path.relpath(file_path, self.repo_path)
+            stale_paths.discard(relative_path)
+            try:
+                stat_result = os.stat(file_path)
+                unchanged, sha256 = manifest.is_unchanged(relative_path, file_path, stat_result)
+            except OSError as e:
+                logger.error(f"Error reading file {file_path}: {e}")
+                continue
+            if unchanged and os.path.exists(structure_json_path(cur_ws_dir, relative_path)):
+                reused_files.append(file_path)
+                continue
+            to_parse[file_path] = (relative_path, stat_result, sha256)
+
+        # the files left in the manifest no longer exist in the repo
+        for relative_path in sorted(stale_paths):
+            logger.debug(f"Removing outputs of deleted file: {relative_path}")
+            remove_outputs(structure_json_path(cur_ws_dir, relative_path))
+            manifest.remove(relative_path)
+        return reused_files, to_parse, stale_paths
+
+    def _mark_parsed(self, cur_ws_dir, parsed_files):
+        """
+        Record in the job state that the structure json of the parsed files are new, to summarize and comment again
+        """
+        if self.job_state is None:
+            return
+        for file_path in parsed_files:
+            self.job_state.set_stage(structure_json_path(cur_ws_dir, os.path.relpath(file_path, self.repo_path)),
+                                     PARSED)
+
+    def _finish_traverse(self, manifest, to_parse, parsed_files, reused, removed):
+        """
+        Record the parsed files in the manifest, and keep the counts of the traversal in self.traverse_stats.
+        """
+        for file_path in parsed_files:
+            relative_path, stat_result, sha256 = to_parse[file_path]
+            manifest.record(relative_path, file_path, stat_result, sha256)
+        manifest.save()
+
+        self.traverse_stats = {
+            "reused": reused,
+            "reparsed": len(parsed_files),
+            "removed": removed,
+            "failed": len(to_parse) - len(parsed_files),
+        }
+        logger.info(f"Traverse finished: {self.traverse_stats['reused']} reused, "
+                    f"{self.traverse_stats['reparsed']} reparsed, {self.traverse_stats['removed']} removed, "
+                    f"{self.traverse_stats['failed']} failed")
+
+    def _traverse_files(self, cur_ws_dir, source_files, jobs):
+        """
+        Parse the given source files into the workspace, serially or in a process pool.
+
+        :return: the list of source files that were parsed successfully
+        """
+        if jobs is None or jobs <= 0:
+            jobs = os.cpu_count() or 1
+
+        if jobs == 1 or len(source_files) <= 1:
+            return [file_path for file_path in source_files
+                    if traverse_file(self.repo_path, cur_ws_dir, file_path)]
+
+        # Schedule the biggest files first, so a huge file picked up late does not leave the other workers idle
+        source_files = sorted(source_files, key=_file_size, reverse=True)
+        logger.info(f"Traversing {len(source_files)} files with {jobs} worker processes")
+        parsed_files = []
+        with ProcessPoolExecutor(max_workers=jobs, initializer=TreesitterRegistry.warm_up) as executor:
+            futures = {executor.submit(traverse_file, self.repo_path, cur_ws_dir, file_path): file_path
+                       for file_path in source_files}
+            for future in as_completed(futures):
+                if future.result():
+                    parsed_files.append(futures[future])
+        return parsed_files
+
+    def apply_git_changes(self, changes):
+        """
+        Bring the workspace in line with the renames and deletions of a GitChangeSet.
+
+        The outputs (.json, .analyze.md, .comments.json) of renamed files are moved to their new place, and the
+        outputs of deleted files are removed. Both are dropped from the traverse manifest, so that traverse_repo
+        builds the structure json of the new paths again. The renames whose summary and comments were both moved are
+        recorded in changes.carried_over: the others have to be summarized and commented again.
+
+        :param changes: a GitChangeSet, from git_diff.get_changed_files
+        """
+        cur_ws_dir = self.get_cur_ws_dir()
+        manifest = TraverseManifest(cur_ws_dir).load()
+
+        for old_path, new_path, similarity in changes.renamed:
+            if not is_source_file(old_path):
+                continue
+            logger.debug(f"Moving outputs of renamed file: {old_path} -> {new_path}")
+            old_json_file = structure_json_path(cur_ws_dir, old_path)
+            if is_source_file(new_path):
+                new_json_file = structure_json_path(cur_ws_dir, new_path)
+                if all(os.path.exists(output_file) for output_file in _output_files(old_json_file)[1:]):
+                    changes.carried_over.add(new_path)
+                move_outputs(old_json_file, new_json_file)
+                self._relocate_comments(new_json_file)
+            else:
+                remove_outputs(old_json_file)
+            manifest.remove(old_path)
+
+        for relative_path in changes.deleted:
+            if not is_source_file(relative_path):
+                continue
+            logger.debug(f"Removing outputs of deleted file: {relative_path}")
+            remove_outputs(structure_json_path(cur_ws_dir, relative_path))
+            manifest.remove(relative_path)
+
+        manifest.save()
+        logger.info(f"Applied git changes: {len(changes.renamed)} renamed, {len(changes.deleted)} deleted")
+
+    def _code_file(self, json_file):
+        """
+        Returns the source file of a structure json, under LOCAL_REPO_FOLDER.
+        """
+        # get relevant code file:
+        code_file = json_file.replace('.json', '')
+        local_repo_folder = os.getenv("LOCAL_REPO_FOLDER")
+        # # if local_repo_folder does not have trailing os.sep, add it. AS WORKSPACE_DIR does not have trailing os.sep, this is not needed
+        # if local_repo_folder[-1] != os.sep:
+        #     local_repo_folder += os.sep
+        return code_file.replace(WORKSPACE_DIR, local_repo_folder)
+
+    def _relocate_comments(self, json_file):
+        """
+        Point the file_path of a moved .comments.json to the new source file.
+        """
+        comments_file = json_file.replace('.json', '.comments.json')
+        if not os.path.exists(comments_file) or not os.getenv("LOCAL_REPO_FOLDER"):
+            return
+        with open(comments_file, 'r', encoding='utf-8') as f:
+            result = json.load(f)
+        result["file_path"] = self._code_file(json_file)
+        utils.atomic_write(comments_file, json.dumps(result, indent=4, ensure_ascii=False), encoding='utf-8')
+
+    def _structure_files(self, analyze_folder, only_files):
+        """
+        Yield the structure json files of the workspace, or only the ones of the given source files.
+        """
+        if only_files is not None:
+            for relative_path in only_files:
+                json_file = structure_json_path(analyze_folder, relative_path)
+                if os.path.exists(json_file):
+                    yield json_file
+            return
 
         for root, dirs, files in os.walk(analyze_folder):
             for file in files:
                 # include *.json but exclude *.comments.json
                 if not file.endswith(".json") or file.endswith(".comments.json"):
                     continue
-                file_path = os.path.join(root, file)
-                # save result in the folder as file_path, add only the suffix .analyze.md
-                analyze_file = file_path.replace('.json', '.analyze.md')
-                # if the file exists, skip the analyze and continue
-                # DONE: if FORCE_RE_ANALYZE is on, then re-do the analysis
-                if os.path.exists(analyze_file) and not FORCE_RE_ANALYZE and not force_re_anlayze:
-                    continue
-                file_summary_analyzer = FileSummaryAnalyzer()
-                result = file_summary_analyzer.analyze_file_summary(file_path)
-                logger.info(result)
-                with open(analyze_file, 'w') as f:
-                    f.write(result)
+                yield os.path.join(root, file)
 
-    def sectioned_comment(self, analyze_folder, force_re_comment):
-        if not analyze_folder:
-            raise ValueError("Analyze folder not found")
+    def _needs_summary(self, file_path, force_re_anlayze, only_files):
+        """
+        Whether the .analyze.md of a structure json has to be written.
+        """
+        if self.job_state is not None and self.job_state.reached(file_path, SUMMARIZED):
+            # summarized by the job being resumed
+            return False
+        analyze_file = file_path.replace('.json', '.analyze.md')
+        # if the file exists, skip the analyze and continue
+        # DONE: if FORCE_RE_ANALYZE is on, then re-do the analysis
+        return not (os.path.exists(analyze_file) and not FORCE_RE_ANALYZE and not force_re_anlayze
+                    and only_files is None)
+
+    def _summary_output(self, file_path):
+        """
+        The .analyze.md of a structure json, written as the summary streams in
+        """
+        # save result in the folder as file_path, add only the suffix .analyze.md
+        return utils.atomic_stream(file_path.replace('.json', '.analyze.md'))
 
+    def _summary_written(self, file_path, result):
+        logger.info(result)
+        if self.job_state is not None:
+            self.job_state.set_stage(file_path, SUMMARIZED)
+
+    def _comment_inputs(self, file_path, force_re_comment, only_files):
+        """
+        Whether the .comments.json of a structure json has to be written, and the comments of the previous run.
+
+        The remarks committed by the job being resumed are added to the previous comments.
+
+        :return: a (needed, previous_comments) pair
+        """
+        if self.job_state is not None and self.job_state.reached(file_path, COMMENTED):
+            # commented by the job being resumed
+            return False, None
+        # save result in the folder as file_path, add only the suffix .comments.json
+        analyze_file = file_path.replace('.json', '.comments.json')
+        force = FORCE_RE_COMMENT or force_re_comment
+        # DONE: if FORCE_RE_COMMENT is on, then re-do the analysis
+        previous_comments = None
+        if os.path.exists(analyze_file) and not force:
+            # if the comments are newer than the structure json, the file did not change: skip it and continue
+            if only_files is None and os.path.getmtime(analyze_file) >= os.path.getmtime(file_path):
+                return False, None
+            # otherwise only the sections whose fingerprint changed are commented again
+            with open(analyze_file, 'r', encoding='utf-8') as f:
+                previous_comments = json.load(f).get("comments")
+        if self.job_state is not None:
+            # the remarks committed for the current source come first
+            previous_comments = self.job_state.checkpoints(file_path) + (previous_comments or [])
+        return True, previous_comments
+
+    def _write_comments(self, file_path, code_file, comments):
+        logger.info(f"Comments of file {code_file} is:\n {comments}")
+        result = {
+            "file_path": code_file,  # DONE: 这里的code_file需要使用SaaS地址+群组+项目+文件名方式
+            "comments": comments
+        }
+        utils.atomic_write(file_path.replace('.json', '.comments.json'),
+                           json.dumps(result, indent=4, ensure_ascii=False), encoding='utf-8')
+        if self.job_state is not None:
+            self.job_state.set_stage(file_path, COMMENTED)
+
+    def _checkpoint(self, file_path):
+        """
+        The callback committing the remarks of a structure json to the job state as they arrive, or None
+        """
+        if self.job_state is None:
+            return None
+        return functools.partial(self.job_state.checkpoint, file_path)
+
+    def _section_index(self, analyze_folder, force_re_comment, section_dedup):
+        """
+        The SectionIndex of a comment pass, seeded with the remarks of the existing .comments.json files of the
+        workspace unless every section is commented from scratch. None if the sections are not deduplicated.
+        """
+        if not section_dedup:
+            return None
+        section_index = SectionIndex()
+        if FORCE_RE_COMMENT or force_re_comment:
+            return section_index
         for root, dirs, files in os.walk(analyze_folder):
             for file in files:
-                if not file.endswith(".json") or file.endswith(".comments.json"):
-                    continue
-                file_path = os.path.join(root, file)
-                # save result in the folder as file_path, add only the suffix .comments.json
-                analyze_file = file_path.replace('.json', '.comments.json')
-                # if the file exists, skip the analyze and continue
-                # DONE: if FORCE_RE_COMMENT is on, then re-do the analysis
-                if os.path.exists(analyze_file) and not FORCE_RE_COMMENT and not force_re_comment:
+                if file.endswith(".comments.json"):
+                    with open(os.path.join(root, file), 'r', encoding='utf-8') as f:
+                        section_index.seed(json.load(f).get("comments"))
+        return section_index
+
+    def _api(self):
+        return self.api if self.api is not None else shared_zhipuai_api()
+
+    def analyze_repo(self, analyze_folder, force_re_anlayze, only_files=None, structure_detail=STRUCTURE_PROMPT_DETAIL,
+                     max_prompt_tokens=MAX_PROMPT_TOKENS):
+        """
+        Summarize every structure json of the workspace into a .analyze.md file using LLM.
+
+        :param only_files: if given, only these files (relative to the repo) are summarized, and their existing
+                           summaries are considered outdated
+        :param structure_detail: how the structure is put in the prompt, see FileSummaryAnalyzer
+        :param max_prompt_tokens: the ceiling of the input tokens of a request, 0 for none, see FileSummaryAnalyzer
+        """
+        if not analyze_folder:
+            raise ValueError("Analyze folder not found")
+
+        api = self._api()
+        for file_path in self._structure_files(analyze_folder, only_files):
+            if not self._needs_summary(file_path, force_re_anlayze, only_files):
+                continue
+            file_summary_analyzer = FileSummaryAnalyzer(api, structure_detail, max_prompt_tokens)
+            with self._summary_output(file_path) as output:
+                result = file_summary_analyzer.analyze_file_summary(file_path, output)
+            self._summary_written(file_path, result)
+
+    def sectioned_comment(self, analyze_folder, force_re_comment, only_files=None,
+                          comment_batch_tokens=COMMENT_BATCH_TOKENS, section_dedup=SECTION_DEDUP,
+                          max_prompt_tokens=MAX_PROMPT_TOKENS):
+        """
+        Comment every function, method and class of the workspace into a .comments.json file using LLM.
+
+        A file whose .comments.json is older than its structure json is commented again, carrying over the remarks
+        of the sections whose fingerprint did not change. force_re_comment comments every section from scratch.
+
+        :param only_files: if given, only these files (relative to the repo) are commented, and their existing
+                           comments are considered outdated
+        :param comment_batch_tokens: the token budget of the batched requests of CodeSectionAnalyzer, 0 requests
+                                     every section alone
+        :param section_dedup: request the sections identical to another one of the repo only once, see SectionIndex
+        :param max_prompt_tokens: the ceiling of the input tokens of a class request, 0 for none, see
+                                  CodeSectionAnalyzer
+        """
+        if not analyze_folder:
+            raise ValueError("Analyze folder not found")
+
+        api = self._api()
+        section_index = self._section_index(analyze_folder, force_re_comment, section_dedup)
+        for file_path in self._structure_files(analyze_folder, only_files):
+            needed, previous_comments = self._comment_inputs(file_path, force_re_comment, only_files)
+            if not needed:
+                continue
+            # get relevant summary file: *.py.analyze.md
+            summary_file = file_path.replace('.json', '.analyze.md')
+            code_file = self._code_file(file_path)
+            logger.info(f"code_file: {code_file}")
+
+            code_section_analyzer = CodeSectionAnalyzer(api, comment_batch_tokens, section_index,
+                                                        self._checkpoint(file_path), max_prompt_tokens)
+            comments = code_section_analyzer.analyze_code_section(file_path, summary_file, code_file, previous_comments)
+            self._write_comments(file_path, code_file, comments)
+        if section_index is not None:
+            section_index.log_stats()
+
+    async def analyze_and_comment_async(self, analyze_folder, force_re_anlayze, force_re_comment, only_files=None,
+                                        max_in_flight=LLM_MAX_IN_FLIGHT, comment_batch_tokens=COMMENT_BATCH_TOKENS,
+                                        structure_detail=STRUCTURE_PROMPT_DETAIL, section_dedup=SECTION_DEDUP,
+                                        max_prompt_tokens=MAX_PROMPT_TOKENS):
+        """
+        analyze_repo and sectioned_comment in one asynchronous pass, with up to max_in_flight LLM requests at once.
+
+        Every file is summarized, then commented as soon as its summary is written, while the other files are being
+        processed. The files to handle and the outputs are the same as with analyze_repo followed by sectioned_comment.
+        """
+        if not analyze_folder:
+            raise ValueError("Analyze folder not found")
+
+        section_index = self._section_index(analyze_folder, force_re_comment, section_dedup)
+        async with AsyncZhipuAIAPI(max_in_flight) as api:
+            # only a few files are opened at a time; their sections are enough to fill the requests in flight
+            files_in_flight = asyncio.Semaphore(max_in_flight)
+
+            async def process(file_path):
+                async with files_in_flight:
+                    await self._analyze_and_comment_file_async(
+                        api, file_path, force_re_anlayze, force_re_comment, only_files, comment_batch_tokens,
+                        structure_detail, section_index, max_prompt_tokens)
+
+            await asyncio.gather(*[process(file_path)
+                                   for file_path in self._structure_files(analyze_folder, only_files)])
+        if section_index is not None:
+            section_index.log_stats()
+
+    async def _analyze_and_comment_file_async(self, api, file_path, force_re_anlayze, force_re_comment, only_files,
+                                              comment_batch_tokens, structure_detail, section_index=None,
+                                              max_prompt_tokens=MAX_PROMPT_TOKENS):
+        summary = await self._summarize_file_async(api, file_path, force_re_anlayze, only_files, structure_detail,
+                                                   max_prompt_tokens=max_prompt_tokens)
+        await self._comment_file_async(api, file_path, force_re_comment, only_files, comment_batch_tokens,
+                                       section_index, summary=summary, max_prompt_tokens=max_prompt_tokens)
+
+    async def _summarize_file_async(self, api, file_path, force_re_anlayze, only_files, structure_detail,
+                                    structure=None, max_prompt_tokens=MAX_PROMPT_TOKENS):
+        """
+        Write the .analyze.md of a structure json if needed.
+
+        :param structure: the structure json if it is at hand, instead of reading file_path
+        :return: the summary written, or None if the existing one is kept
+        """
+        if not self._needs_summary(file_path, force_re_anlayze, only_files):
+            return None
+        analyzer = AsyncFileSummaryAnalyzer(api, structure_detail, max_prompt_tokens)
+        with self._summary_output(file_path) as output:
+            if structure is None:
+                result = await analyzer.analyze_file_summary(file_path, output)
+            else:
+                result = await analyzer.analyze_structure(structure, output)
+        self._summary_written(file_path, result)
+        return result
+
+    async def _comment_file_async(self, api, file_path, force_re_comment, only_files, comment_batch_tokens,
+                                  section_index, structure=None, summary=None, max_prompt_tokens=MAX_PROMPT_TOKENS):
+        """
+        Write the .comments.json of a structure json if needed.
+
+        :param structure: the structure json if it is at hand, instead of reading file_path
+        :param summary: the summary of the file if it is at hand, instead of reading its .analyze.md
+        """
+        needed, previous_comments = self._comment_inputs(file_path, force_re_comment, only_files)
+        if not needed:
+            return
+        summary_file = file_path.replace('.json', '.analyze.md')
+        code_file = self._code_file(file_path)
+        logger.info(f"code_file: {code_file}")
+        analyzer = AsyncCodeSectionAnalyzer(api, comment_batch_tokens, section_index, self._checkpoint(file_path),
+                                            max_prompt_tokens)
+        comments = await analyzer.analyze_code_section(
+            file_path, summary_file, code_file, previous_comments, structure=structure, summary=summary)
+        self._write_comments(file_path, code_file, comments)
+
+    async def pipeline_async(self, force_re_anlayze, force_re_comment, jobs=1, traverse_files=None, only_files=None,
+                             max_in_flight=LLM_MAX_IN_FLIGHT, comment_batch_tokens=COMMENT_BATCH_TOKENS,
+                             structure_detail=STRUCTURE_PROMPT_DETAIL, section_dedup=SECTION_DEDUP,
+                             queue_size=PIPELINE_QUEUE_SIZE, max_prompt_tokens=MAX_PROMPT_TOKENS):
+        """
+        traverse_repo, analyze_repo and sectioned_comment as a pipeline: every file flows from the parser to the
+        summary and then to the comments through bounded queues, so the first files are commented while the others
+        are still being parsed or summarized, and the parsing overlaps the LLM requests.
+
+        The structure json and the summary of a file are handed over to the next stage in memory, besides being
+        written to the workspace. The outputs are the same as with the three passes.
+
+        :param traverse_files: the files to traverse, as only_files of traverse_repo
+        :param only_files: the files to summarize and comment, as only_files of analyze_repo and sectioned_comment
+        :param queue_size: the number of files waiting between two stages, beyond which the previous stage waits
+        :return: the workspace folder, as returned by traverse_repo
+        """
+        if jobs is None or jobs <= 0:
+            jobs = os.cpu_count() or 1
+        cur_ws_dir = self.get_cur_ws_dir()
+        manifest = TraverseManifest(cur_ws_dir).load()
+        reused_files, to_parse, stale_paths = self._plan_traverse(cur_ws_dir, manifest, traverse_files)
+        process_paths = None if only_files is None else {os.path.normpath(path) for path in only_files}
+        section_index = self._section_index(cur_ws_dir, force_re_comment, section_dedup)
+        # the structure json files, with their structure json, or None to read it from the workspace, and for the
+        # comments their new summary, or None to read the existing one
+        to_summarize = asyncio.Queue(queue_size)
+        to_comment = asyncio.Queue(queue_size)
+        workers = max(max_in_flight, 1)
+        parsed_files = []
+        loop = asyncio.get_running_loop()
+
+        def processed(file_path):
+            return process_paths is None or os.path.relpath(file_path, self.repo_path) in process_paths
+
+        async def feed_reused():
+            for file_path in reused_files:
+                if processed(file_path):
+                    json_file = structure_json_path(cur_ws_dir, os.path.relpath(file_path, self.repo_path))
+                    await to_summarize.put((json_file, None))
+
+        async def feed_parsed(executor):
+            # the smallest files first, at most jobs of them being parsed at a time: they reach the LLM stages at once,
+            # and the parsing of the biggest ones overlaps their requests
+            pending = set()
+            for file_path in sorted(to_parse, key=_file_size):
+                pending.add(loop.run_in_executor(executor, _traverse_file_in_pipeline, self.repo_path, cur_ws_dir,
+                                                 file_path))
+                if len(pending) >= jobs:
+                    pending = await put_parsed(pending)
+            while pending:
+                pending = await put_parsed(pending)
+
+        async def put_parsed(pending):
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                file_path, structure = future.result()
+                if structure is None:
                     continue
-                # get relevant summary file: *.py.analyze.md
-                summary_file = file_path.replace('.json', '.analyze.md')
-                # get relevant code file:
-                code_file = file_path.replace('.json', '')
-                local_repo_folder = os.getenv("LOCAL_REPO_FOLDER")
-                # # if local_repo_folder does not have trailing os.sep, add it. AS WORKSPACE_DIR does not have trailing os.sep, this is not needed
-                # if local_repo_folder[-1] != os.sep:
-                #     local_repo_folder += os.sep
-                code_file = code_file.replace(WORKSPACE_DIR, local_repo_folder)
-                logger.info(f"code_file: {code_file}")
-
-                code_section_analyzer = CodeSectionAnalyzer()
-                comments = code_section_analyzer.analyze_code_section(file_path, summary_file, code_file)
-                logger.info(f"Comments of file {code_file} is:\n {comments}")
-                result = {
-                    "file_path": code_file,  # DONE: 这里的code_file需要使用SaaS地址+群组+项目+文件名方式
-                    "comments": comments
-                }
-                with open(analyze_file, 'w', encoding='utf-8') as f:
-                    json.dump(result, f, indent=4, ensure_ascii=False)
+                parsed_files.append(file_path)
+                self._mark_parsed(cur_ws_dir, [file_path])
+                if processed(file_path):
+                    json_file = structure_json_path(cur_ws_dir, os.path.relpath(file_path, self.repo_path))
+                    await to_summarize.put((json_file, structure))
+            return pending
+
+        async def summarize():
+            while (item := await to_summarize.get()) is not None:
+                json_file, structure = item
+                summary = await self._summarize_file_async(api, json_file, force_re_anlayze, only_files,
+                                                           structure_detail, structure, max_prompt_tokens)
+                await to_comment.put((json_file, structure, summary))
+
+        async def comment():
+            while (item := await to_comment.get()) is not None:
+                json_file, structure, summary = item
+                await self._comment_file_async(api, json_file, force_re_comment, only_files, comment_batch_tokens,
+                                               section_index, structure, summary, max_prompt_tokens)
+
+        async def parse():
+            # one worker thread keeps the serial parsing of traverse_repo, off the event loop
+            if jobs == 1:
+                executor = ThreadPoolExecutor(max_workers=1)
+            else:
+                executor = ProcessPoolExecutor(max_workers=jobs, initializer=TreesitterRegistry.warm_up)
+            with executor:
+                await asyncio.gather(feed_reused(), feed_parsed(executor))
+            self._finish_traverse(manifest, to_parse, parsed_files, len(reused_files), len(stale_paths))
+            for _ in range(workers):
+                await to_summarize.put(None)
+
+        async def summarize_all():
+            await asyncio.gather(*[summarize() for _ in range(workers)])
+            for _ in range(workers):
+                await to_comment.put(None)
+
+        async with AsyncZhipuAIAPI(max_in_flight) as api:
+            await asyncio.gather(parse(), summarize_all(), *[comment() for _ in range(workers)])
+        if section_index is not None:
+            section_index.log_stats()
+        return cur_ws_dir
+
+def _file_size(file_path):
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return 0
+
+
+def is_source_file(file_path):
+    """
+    Returns True if the file has a programming language that traverse_repo can parse.
+    """
+    return utils.get_programming_language(utils.get_file_extension(file_path)) is not Language.UNKNOWN
+
+
+def collect_source_files(repo_path):
+    """
+    Walk the repository and collect every file that has a supported programming language.
+
+    :param repo_path: the code repo path
+    :return: a list of file paths, in os.walk order
+    """
+    source_files = []
+    for root, dirs, files in os.walk(repo_path):
+        for file in files:
+            if not is_source_file(file):
+                continue
+            source_files.append(os.path.join(root, file))
+    return source_files
+
+
+def structure_json_path(cur_ws_dir, relative_path):
+    """
+    Returns the path of the structure json of a source file inside the workspace.
+
+    :param cur_ws_dir: the workspace folder of the repo, from RepoTraverser.get_cur_ws_dir
+    :param relative_path: the path of the source file relative to the repo
+    """
+    if TREE_JSON:
+        # separate the folder and *.py from relative_path by os.sep
+        py_path = relative_path.split(os.sep)[-1]
+        folder_path = relative_path.replace(py_path, '')
+        return os.path.join(cur_ws_dir, folder_path, py_path + '.json')
+
+    return os.path.join(cur_ws_dir, relative_path.replace(os.sep, '--') + '.json')
+
+
+def _output_files(json_file):
+    return json_file, json_file.replace('.json', '.analyze.md'), json_file.replace('.json', '.comments.json')
+
+
+def move_outputs(old_json_file, new_json_file):
+    """
+    Move the structure json of a source file, together with its .analyze.md and .comments.json, to a new place.
+    """
+    os.makedirs(os.path.dirname(new_json_file), exist_ok=True)
+    for old_file, new_file in zip(_output_files(old_json_file), _output_files(new_json_file)):
+        if os.path.exists(old_file):
+            os.replace(old_file, new_file)
+
+
+def remove_outputs(json_file):
+    """
+    Remove the structure json of a source file together with the .analyze.md and .comments.json built from it.
+    """
+    for output_file in _output_files(json_file):
+        if os.path.exists(output_file):
+            os.remove(output_file)
+
+
+def traverse_file(repo_path, cur_ws_dir, file_path):
+    """
+    Analyze the code structure of a single file and write it as json into the workspace.
+
+    This is a module level function so that it can be shipped to the worker processes of traverse_repo.
+
+    :param repo_path: the code repo path
+    :param cur_ws_dir: the workspace folder of the repo, from RepoTraverser.get_cur_ws_dir
+    :param file_path: the source file to analyze
+    :return: True if the structure json was written
+    """
+    return traverse_file_structure(repo_path, cur_ws_dir, file_path) is not None
+
+
+def _traverse_file_in_pipeline(repo_path, cur_ws_dir, file_path):
+    return file_path, traverse_file_structure(repo_path, cur_ws_dir, file_path)
+
+
+def traverse_file_structure(repo_path, cur_ws_dir, file_path):
+    """
+    traverse_file, returning the structure json it wrote, for the stages of the pipeline to use without reading it
+    back from the workspace.
+
+    :return: the structure json, or None if the file could not be analyzed
+    """
+    relative_path = os.path.relpath(file_path, repo_path)
+    try:
+        raw_output = analyze_code_from_file(file_path)
+
+        json_file = structure_json_path(cur_ws_dir, relative_path)
+        cur_file_path = os.path.dirname(json_file)
+        if not os.path.exists(cur_file_path):
+            logger.debug(f'Creating folder: {cur_file_path}')
+            # exist_ok: another worker process may create the same folder at the same time
+            os.makedirs(cur_file_path, exist_ok=True)
+
+        # # 之前是临时的直接拷贝，后续需要通过规则获取源文件，或者记录在json文件中
+        # # DONE: 在sectioned_comment通过规则获取源文件
+        # src_file = os.path.join(src_file_path, py_path)
+        # # copy the src_file to cur_file_path
+        # shutil.copy2(src_file, os.path.join(cur_file_path, py_path))
+
+        # Output the result to a json file, along with the relative_path of the source file
+        json_result = dumps_result(raw_output, indent=STRUCTURE_JSON_INDENT, relative_path=relative_path)
+        utils.atomic_write(json_file, json_result)
+        return json_result
+
+    except Exception as e:
+        logger.error(f"Error reading file {file_path}: {e}")
+        return None
@@ -6,6 +6,9 @@ from llm_project_helper.treesitter.treesitter import (Treesitter,
                                                       TreesitterGeneralVariableNode,
                                                       TreesitterGeneralParameterNode,
                                                       TreesitterGlobalVariableNode,
-                                                      TreesitterInferfaceNode,)
+                                                      TreesitterInferfaceNode,
+                                                      SourceBuffer,)
+from llm_project_helper.treesitter.treesitter_json import dumps_result
+from llm_project_helper.treesitter.treesitter_skeleton import render_skeleton, SKELETON_DETAILS
 from llm_project_helper.treesitter.treesitter_py import TreesitterPython
 from llm_project_helper.treesitter.treesitter_java import TreesitterJava
\ No newline at end of file
@@ -1,11 +1,11 @@
 from abc import ABC
+from dataclasses import dataclass, field, fields
 
 import tree_sitter
 from tree_sitter_languages import get_language, get_parser
 
 from llm_project_helper.const import Language
 from llm_project_helper.treesitter.treesitter_registry import TreesitterRegistry
-from pydantic import BaseModel, Field
 from llm_project_helper.logs import logger
 
 # class CustomBaseModel(BaseModel):
@@ -20,29 +20,97 @@ from llm_project_helper.logs import logger
 #         exclude.update({'node', 'source_code'})  # Automatically exclude these fields
 #         return super().model_dump(**kwargs, exclude=exclude)
 
-class TreesitterGeneralVariableNode(BaseModel):
+def _dump_value(value):
+    if isinstance(value, TreesitterRecord):
+        return value.model_dump()
+    if isinstance(value, list):
+        return [_dump_value(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _dump_value(item) for key, item in value.items()}
+    return value
+
+
+class TreesitterRecord:
+    """
+    Base of the result nodes: slotted records, built without any validation as the extractors always pass values of
+    the declared types.
+
+    The fields written to the structure json, in order, are listed in _dump_fields by the treesitter_record
+    decorator: the dataclass fields not marked as excluded, then the _computed_fields.
+    """
+    __slots__ = ()
+    _dump_fields: tuple[str, ...] = ()
+    _computed_fields: tuple[str, ...] = ()
+
+    def model_dump(self) -> dict:
+        """
+        Returns the record as a dict of plain values, the same as the former pydantic model_dump().
+        """
+        return {name: _dump_value(getattr(self, name)) for name in self._dump_fields}
+
+
+def treesitter_record(cls):
+    cls = dataclass(slots=True, kw_only=True)(cls)
+    cls._dump_fields = tuple(f.name for f in fields(cls) if not f.metadata.get('exclude')) + cls._computed_fields
+    return cls
+
+
+def _excluded(default=None):
+    return field(default=default, metadata={'exclude': True})
+
+
+@treesitter_record
+class TreesitterGeneralVariableNode(TreesitterRecord):
     name: str | bytes | None
     line_number: int
 
-class TreesitterGeneralParameterNode(BaseModel):
+@treesitter_record
+class TreesitterGeneralParameterNode(TreesitterRecord):
     name: str | bytes | None
     line_number: int
 
-class TreesitterMethodNode(BaseModel):
+class SourceBuffer:
+    """
+    The bytes of a parsed file, shared by all the nodes extracted from it.
+    """
+    __slots__ = ('data',)
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def text(self, start_byte: int, end_byte: int) -> str:
+        # decode straight from a view, without copying the bytes of the slice first
+        return str(memoryview(self.data)[start_byte:end_byte], 'utf-8')
+
+@treesitter_record
+class TreesitterSourceSpanNode(TreesitterRecord):
+    """
+    A node covering a span of the source file. Only the byte offsets of the span and a reference to the shared
+    SourceBuffer are kept; the source code is decoded when it is asked for.
+    """
+    source: SourceBuffer | None = _excluded()
+    start_byte: int | None = _excluded()
+    end_byte: int | None = _excluded()
+
+    @property
+    def source_code(self) -> str | None:
+        if self.source is None:
+            return None
+        return self.source.text(self.start_byte, self.end_byte)
+
+@treesitter_record
+class TreesitterMethodNode(TreesitterSourceSpanNode):
     name: str | bytes | None
     doc_comment: str | None
-    node: tree_sitter.Node = Field(..., exclude=True)
-    source_code: str | None = Field(exclude=True)
     method_variables: list[TreesitterGeneralVariableNode] | None
     parameters: list[TreesitterGeneralParameterNode] | None
     line_number: int
     end_line_number: int
     async_method_flag: bool
     decorator_line_number: int | None
-    class Config:
-        arbitrary_types_allowed = True
 
-class TreesitterClassNode(BaseModel):
+@treesitter_record
+class TreesitterClassNode(TreesitterSourceSpanNode):
     name: str | bytes | None
     constructors: dict[str, TreesitterMethodNode] | None
     methods: dict[str, TreesitterMethodNode] | None
@@ -50,52 +118,44 @@ class TreesitterClassNode(BaseModel):
     doc_comment: str | None
     line_number: int
     end_line_number: int
-    node: tree_sitter.Node = Field(..., exclude=True)
-    source_code: str | None = Field(exclude=True)
-    class Config:
-        arbitrary_types_allowed = True
 
-class TreesitterInferfaceNode(BaseModel):
+@treesitter_record
+class TreesitterInferfaceNode(TreesitterSourceSpanNode):
     line_number: int
     end_line_number: int
     name: str | bytes | None
     methods: dict[str, TreesitterMethodNode] | None
-    node: tree_sitter.Node = Field(..., exclude=True)
-    source_code: str | None = Field(exclude=True)
     interface_variables: list[TreesitterGeneralVariableNode] | None
-    class Config:
-        arbitrary_types_allowed = True
 
-class TreesitterImportNode(BaseModel):
+@treesitter_record
+class TreesitterImportNode(TreesitterSourceSpanNode):
     import_identifier: str | None
     line_number: int
     from_module: str | None
-    node: tree_sitter.Node = Field(..., exclude=True)
-    source_code: str | None = Field(exclude=True)
-    class Config:
-        arbitrary_types_allowed = True
 
-class TreesitterGlobalVariableNode(BaseModel):
+@treesitter_record
+class TreesitterGlobalVariableNode(TreesitterRecord):
     name: str | bytes | None
     line_number: int
-    class Config:
-        arbitrary_types_allowed = True
 
-class TreesitterMainBlockNode(BaseModel):
-    node: tree_sitter.Node = Field(..., exclude=True)
-    source_code: str | None
-    class Config:
-        arbitrary_types_allowed = True
+@treesitter_record
+class TreesitterMainBlockNode(TreesitterSourceSpanNode):
+    # unlike the other nodes, the source code of the main block is part of the structure json
+    _computed_fields = ('source_code',)
 
-class TreesitterResultNode(BaseModel):
+@treesitter_record
+class TreesitterResultNode(TreesitterRecord):
     imports: list[TreesitterImportNode] | None
     classes: dict[str, TreesitterClassNode] | None
     functions: dict[str, TreesitterMethodNode] | None
     global_variables: list[TreesitterGlobalVariableNode] | None
     main_block: TreesitterMainBlockNode | None
     interfaces: dict[str, TreesitterInferfaceNode] | None
-    class Config:
-        arbitrary_types_allowed = True
+
+# Compiled queries shared by every Treesitter of the process, keyed by (Language, query string). Compiling a query is
+# far more expensive than running it, and the extractors run the same few queries for every function of every file
+_compiled_queries: dict[tuple[Language, str], tree_sitter.Query] = {}
+
 
 class Treesitter(ABC):
     def __init__(
@@ -105,6 +165,7 @@ class Treesitter(ABC):
         name_identifier: str,
         doc_comment_identifier: str,
     ):
+        self.programming_language = language
         self.parser = get_parser(language.value)
         self.language = get_language(language.value)
         self.method_declaration_identifier = method_declaration_identifier
@@ -117,7 +178,32 @@ class Treesitter(ABC):
     def create_treesitter(language: Language) -> "Treesitter":
         return TreesitterRegistry.create_treesitter(language)
 
+    @staticmethod
+    def get_treesitter(language: Language) -> "Treesitter":
+        """
+        Returns the warm Treesitter of the current process for the language, see TreesitterRegistry.get_treesitter.
+        """
+        return TreesitterRegistry.get_treesitter(language)
+
+    def _query(self, query_str: str) -> tree_sitter.Query:
+        """
+        Returns the compiled query of query_str for the language of this Treesitter, compiling it only once per process.
+        """
+        key = (self.programming_language, query_str)
+        query = _compiled_queries.get(key)
+        if query is None:
+            query = self.language.query(query_str)
+            _compiled_queries[key] = query
+        return query
+
+    def _source_span(self, node: tree_sitter.Node) -> dict:
+        """
+        Returns the fields locating node in the source of the file being parsed, for a TreesitterSourceSpanNode.
+        """
+        return {'source': self.source, 'start_byte': node.start_byte, 'end_byte': node.end_byte}
+
     def parse(self, file_bytes: bytes) -> list[TreesitterMethodNode]:
+        self.source = SourceBuffer(file_bytes)
         self.tree = self.parser.parse(file_bytes)
         
         imports=self._query_imports(self.tree.root_node)
@@ -149,7 +235,7 @@ class Treesitter(ABC):
     
     def _query_functions(self, node: tree_sitter.Node) -> dict:
         result = {}
-        query = self.language.query("""
+        query = self._query("""
             (function_definition
                 name: (identifier) @function_name
                 parameters: (parameters) @params
@@ -182,8 +268,7 @@ class Treesitter(ABC):
                     result[name] = TreesitterMethodNode(
                         name=name,
                         doc_comment=doc_comment,
-                        node=captured_node,
-                        source_code=captured_node.text.decode('utf-8'),
+                        **self._source_span(captured_node),
                         method_variables=method_variables,
                         parameters=parameters,
                         line_number=line_number,
@@ -202,7 +287,7 @@ class Treesitter(ABC):
     def _extract_method_variables(self, node: tree_sitter.Node):
         # Example: Extract variables declared at the start of a function
         variables = []
-        query = self.language.query("""
+        query = self._query("""
             (function_definition body: (block (expression_statement (assignment) @assignment)))
         """)
         captures = query.captures(node)
@@ -211,7 +296,7 @@ class Treesitter(ABC):
             # retrieve the line_number of the variable
             line_number = captured_node.start_point[0] + 1
             # append the variable_name and line_number to a dict
-            variables.append({'name': variable_name, 'line_number': line_number})
+            variables.append(TreesitterGeneralVariableNode(name=variable_name, line_number=line_number))
         return variables
 
     def _extract_parameters(self, node: tree_sitter.Node):
@@ -230,7 +315,8 @@ class Treesitter(ABC):
 
     def _check_async_method(self, node: tree_sitter.Node):
         # return node.type == 'async_function_definition'
-        return node.text.decode().startswith('async')
+        # the async keyword is the first child, no need to decode the whole function
+        return node.child(0).type == 'async'
 
     def _extract_decorator_line_number(self, node: tree_sitter.Node):
         # Start with the current node and look backwards for decorators
@@ -263,18 +349,17 @@ class Treesitter(ABC):
     def _query_imports(self, node: tree_sitter.Node) -> list:
         # TODO: This is a simplified example; actual parsing may require more detailed handling
         imports = []
-        query = self.language.query(f"(import_statement) @import")
+        query = self._query(f"(import_statement) @import")
         for captured_node, _ in query.captures(node):
             logger.debug(f'captured_node.text.decode(): {captured_node.text.decode()}')
             imports.append(TreesitterImportNode(
                 import_identifier=captured_node.text.decode(),
                 line_number=captured_node.start_point[0]+1,
                 from_module=None,
-                node=captured_node,
-                source_code=None
+                **self._source_span(captured_node),
             ))
 
-        query = self.language.query(f"(import_from_statement) @import_from")
+        query = self._query(f"(import_from_statement) @import_from")
         for captured_node, _ in query.captures(node):
             if isinstance(captured_node, tree_sitter.Node):
                 from_module = None
@@ -286,15 +371,14 @@ class Treesitter(ABC):
                     import_identifier=captured_node.text.decode(),  # This might need adjustment
                     line_number=captured_node.start_point[0]+1,
                     from_module=from_module,
-                    node=captured_node,
-                    source_code=None
+                    **self._source_span(captured_node),
                 ))
 
         return imports
 
     def _query_classes(self, node: tree_sitter.Node) -> dict:
         classes = {}
-        query = self.language.query("(class_definition) @class")
+        query = self._query("(class_definition) @class")
         captures = query.captures(node)  # Get all captures from the query
 
         for capture in captures:
@@ -316,14 +400,13 @@ class Treesitter(ABC):
                     doc_comment=doc_comment,
                     line_number=line_number,
                     end_line_number=end_line_number,
-                    node=captured_node,
-                    source_code=captured_node.text.decode('utf-8'),
+                    **self._source_span(captured_node),
                 )
         return classes
 
     def _query_methods_within_class(self, class_node: tree_sitter.Node):
         result = {}
-        query = self.language.query("""
+        query = self._query("""
             (function_definition
                 name: (identifier) @function_name
                 parameters: (parameters) @params
@@ -346,8 +429,7 @@ class Treesitter(ABC):
                 result[name] = TreesitterMethodNode(
                     name=name,
                     doc_comment=doc_comment,
-                    node=captured_node,
-                    source_code=captured_node.text.decode('utf-8'),
+                    **self._source_span(captured_node),
                     method_variables=method_variables,
                     parameters=parameters,
                     line_number=line_number,
@@ -371,7 +453,7 @@ class Treesitter(ABC):
                 )
             )
         """
-        query = self.language.query(query_str)
+        query = self._query(query_str)
         captures = query.captures(class_node)
 
         for captured_node, capture_name in captures:
@@ -397,7 +479,7 @@ class Treesitter(ABC):
                 )
             )
         """
-        query = self.language.query(query_str)
+        query = self._query(query_str)
         captures = query.captures(node)
 
         for captured_node, capture_name in captures:
@@ -420,7 +502,7 @@ class Treesitter(ABC):
                 ) @if_stmt
             )
         """
-        query = self.language.query(query_str)
+        query = self._query(query_str)
         captures = query.captures(node)
 
         for captured_node, capture_name in captures:
@@ -440,8 +522,6 @@ class Treesitter(ABC):
                     # Proceed to extract the block associated with this if_statement
                     block_node = next((n for n, n_name in captures if n_name == 'block' and n.parent == captured_node.parent), None)
                     if block_node:
-                        line_number = block_node.start_point[0] + 1
-                        block_code = block_node.text.decode('utf-8')
-                        return TreesitterMainBlockNode(node=block_node, source_code=block_code)
+                        return TreesitterMainBlockNode(**self._source_span(block_node))
 
         return None
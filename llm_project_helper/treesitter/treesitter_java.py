@@ -2,315 +2,259 @@ import tree_sitter
 
 from llm_project_helper.const import Language
 from llm_project_helper.treesitter.treesitter import (Treesitter,
+                                                      SourceBuffer,
                                                       TreesitterGeneralVariableNode,
                                                       TreesitterGeneralParameterNode,
                                                       TreesitterMethodNode,
                                                       TreesitterClassNode,
                                                       TreesitterImportNode,
-                                                      TreesitterGlobalVariableNode,
-                                                      TreesitterMainBlockNode,
                                                       TreesitterResultNode,
                                                       TreesitterInferfaceNode,)
 from llm_project_helper.treesitter.treesitter_registry import TreesitterRegistry
 from llm_project_helper.logs import logger
 
+# 类、枚举和record都作为class输出
+_CLASS_DECLARATIONS = frozenset({'class_declaration', 'enum_declaration', 'record_declaration'})
+# 以下节点中不会出现类、方法或变量声明，遍历时不再深入
+_PRUNED_NODE_TYPES = frozenset({
+    'import_declaration', 'package_declaration', 'line_comment', 'block_comment', 'identifier', 'type_identifier',
+    'scoped_type_identifier', 'generic_type', 'array_type', 'integral_type', 'floating_point_type', 'boolean_type',
+    'void_type', 'modifiers', 'formal_parameters', 'string_literal', 'character_literal', 'decimal_integer_literal',
+    'hex_integer_literal', 'octal_integer_literal', 'binary_integer_literal', 'decimal_floating_point_literal',
+    'true', 'false', 'null_literal', 'this', 'super', 'dimensions', 'type_arguments', 'type_parameters',
+    'throws', 'superclass', 'super_interfaces', 'extends_interfaces',
+})
+
+
+class _TypeScope:
+    """
+    A class (including enum, record and anonymous class) or an interface, while it is being traversed.
+    """
+    __slots__ = ('key', 'name', 'node', 'is_interface', 'constructors', 'methods', 'variables',
+                 'constructor_counter', 'anonymous_counter')
+
+    def __init__(self, key, name, node, is_interface=False):
+        self.key = key
+        self.name = name
+        self.node = node
+        self.is_interface = is_interface
+        self.constructors = {}
+        self.methods = {}
+        self.variables = []
+        self.constructor_counter = 0
+        self.anonymous_counter = 0
+
+
+class _MethodScope:
+    """
+    A method or constructor, while its body is being traversed: collects its local variables.
+    """
+    __slots__ = ('node', 'variables')
+
+    def __init__(self, node):
+        self.node = node
+        self.variables = []
+
 
 class TreesitterJava(Treesitter):
+    """
+    Java extractor, built on a single scoped traversal of the syntax tree.
+
+    The tree is walked once with a TreeCursor, keeping a stack of the type (class, interface, enum, record,
+    anonymous class) and method scopes around the current node. Every method, constructor and variable is attributed
+    to its innermost scope only, so the methods of an inner or anonymous class are not attached to the outer class.
+    Nested types are emitted as their own entries, keyed by their enclosing type: Outer.Inner for named nested and
+    local classes, Outer$1, Outer$2... for anonymous classes, in the order of appearance.
+    """
+
     def __init__(self):
         super().__init__(
             Language.JAVA, "function_definition", "identifier", "expression_statement"
         )
 
-    def parse(self, file_bytes: bytes) -> list[TreesitterMethodNode]:
+    def parse(self, file_bytes: bytes) -> TreesitterResultNode:
+        self.source = SourceBuffer(file_bytes)
         self.tree = self.parser.parse(file_bytes)
-        
-        imports=self._query_imports(self.tree.root_node)
-        logger.debug(f'typeof imports: {type(imports)}')
-        classes=self._query_classes(self.tree.root_node)
-        logger.debug(f'typeof classes: {type(classes)}')
-        # functions=self._query_functions(self.tree.root_node)
-        # logger.debug(f'typeof functions: {type(functions)}')
-        # global_variables=self._query_global_variables(self.tree.root_node)
-        # logger.debug(f'typeof global_variables: {type(global_variables)}')
-        # main_block=self._query_main_block(self.tree.root_node)
-        # logger.debug(f'typeof main_block: {type(main_block)}')
-        interfaces = self._query_interfaces(self.tree.root_node)
-        logger.debug(f'typeof interfaces: {type(interfaces)}')
 
+        self.imports = []
+        self.classes = {}
+        self.interfaces = {}
+        # the type and method scopes around the current node, innermost last
+        self.scopes = []
+        # the nodes owning the scopes, to pop them when the cursor leaves their node
+        self.scope_nodes = []
+
+        cursor = self.tree.walk()
+        reached_root = False
+        while not reached_root:
+            node = cursor.node
+            if self._enter(node) and cursor.goto_first_child():
+                continue
+            self._leave(node)
+            while not cursor.goto_next_sibling():
+                if not cursor.goto_parent():
+                    reached_root = True
+                    break
+                self._leave(cursor.node)
+
+        logger.debug(f'imports: {len(self.imports)}, classes: {len(self.classes)}, interfaces: {len(self.interfaces)}')
         all_result = TreesitterResultNode(
-            imports=imports,
-            classes=classes,
+            imports=self.imports,
+            classes={key: self._build_class(scope) for key, scope in self.classes.items()},
             functions=None,
             global_variables=None,
             main_block=None,
-            interfaces=interfaces,
+            interfaces={key: self._build_interface(scope) for key, scope in self.interfaces.items()},
         )
-        # logger.debug(f'all_result: {all_result}')
         return all_result
 
-    def _query_imports(self, node: tree_sitter.Node) -> list:
-        # TODO: This is a simplified example; actual parsing may require more detailed handling
-        imports = []
-        query = self.language.query(f"(import_declaration) @import")
-        for captured_node, _ in query.captures(node):
-            logger.debug(f'captured_node.text.decode(): {captured_node.text.decode()}')
-            imports.append(TreesitterImportNode(
-                import_identifier=captured_node.text.decode(),
-                line_number=captured_node.start_point[0]+1,
-                from_module=None,
-                node=captured_node,
-                source_code=None
-            ))
-        logger.debug(f'imports: {imports}')
-        return imports
-
-    def _query_interfaces(self, node: tree_sitter.Node) -> dict:
-        interfaces = {}
-        query_str = """
-            (interface_declaration
-                name: (identifier) @interface_name
-                body: (interface_body) @body
-            )@interface
+    def _enter(self, node: tree_sitter.Node) -> bool:
         """
-        query = self.language.query(query_str)
-        captures = query.captures(node)
-
-        for captured_node, capture_name in captures:
-            if capture_name == 'interface':
-                name_node = captured_node.child_by_field_name('name')
-                if name_node:
-                    name = name_node.text.decode('utf-8')
-                    methods = self._query_methods_within_interface(captured_node)
-                    interface_variables = self._extract_class_variables(captured_node)
-                    line_number = captured_node.start_point[0] + 1
-                    end_line_number = captured_node.end_point[0] + 1
-
-                    interfaces[name] = TreesitterInferfaceNode(
-                        name=name,
-                        methods=methods,
-                        interface_variables=interface_variables,
-                        line_number=line_number,
-                        end_line_number=end_line_number,
-                        node=captured_node,
-                        source_code=None
-                    )
-        return interfaces
-    
-    def _query_methods_within_interface(self, interface_node: tree_sitter.Node):
-        result = {}
-        query = self.language.query("""
-            (method_declaration
-                name: (identifier) @function_name
-                parameters: (formal_parameters) @params
-            ) @function
-        """)
-        captures = query.captures(interface_node)
-
-        for captured_node, _ in captures:
-            if captured_node.type == 'method_declaration':
-                name = self._query_method_name(captured_node)
-                doc_comment = None
-                method_variables = None
-                parameters = self._extract_parameters(captured_node)
-                line_number = captured_node.start_point[0] + 1
-                end_line_number = captured_node.end_point[0] + 1
-                async_method_flag = False
-                decorator_line_number = None
-
-                result[name] = TreesitterMethodNode(
-                    name=name,
-                    doc_comment=doc_comment,
-                    node=captured_node,
-                    source_code=captured_node.text.decode('utf-8'),
-                    method_variables=method_variables,
-                    parameters=parameters,
-                    line_number=line_number,
-                    end_line_number=end_line_number,
-                    async_method_flag=async_method_flag,
-                    decorator_line_number=decorator_line_number
-                )
-        return result
-
-    def _query_classes(self, node: tree_sitter.Node) -> dict:
-        classes = {}
-        # Java 的类定义查询
-        query = self.language.query("""
-            (class_declaration
-                name: (identifier) @class_name
-                body: (class_body) @body
-            ) @class
-        """)
-        captures = query.captures(node)
-
-        for captured_node, capture_name in captures:
-            if capture_name == 'class':
-                name_node = captured_node.child_by_field_name('name')
-                if name_node:
-                    name = name_node.text.decode('utf-8')
-                    constructors = self._query_constructors_with_class(captured_node)
-                    methods = self._query_methods_within_class(captured_node)
-                    class_variables = self._extract_class_variables(captured_node)
-                    line_number = captured_node.start_point[0] + 1
-                    end_line_number = captured_node.end_point[0] + 1
-
-                    classes[name] = TreesitterClassNode(
-                        name=name,
-                        constructors=constructors,
-                        methods=methods,
-                        class_variables=class_variables,
-                        doc_comment=None,  # Java 文档注释的处理
-                        line_number=line_number,
-                        end_line_number=end_line_number,
-                        node=captured_node,
-                        source_code=None
-                    )
-        return classes
+        Handle a node when the cursor reaches it.
 
-    def _query_functions(self, node: tree_sitter.Node) -> dict:
-        functions = {}
-        # Java 的方法定义查询
-        query = self.language.query("""
-            (method_declaration
-                name: (identifier) @method_name
-                parameters: (formal_parameters) @params
-                body: (block) @body
-            ) @method
-        """)
-        captures = query.captures(node)
-
-        for captured_node, capture_name in captures:
-            if capture_name == 'method':
-                name_node = captured_node.child_by_field_name('name')
-                if name_node:
-                    name = name_node.text.decode('utf-8')
-                    parameters = self._extract_parameters(captured_node)
-                    line_number = captured_node.start_point[0] + 1
-                    end_line_number = captured_node.end_point[0] + 1
-                    method_variables = self._extract_method_variables(captured_node)
-                    # TODO: 添加 async_method_flag 和 decorator_line_number 的处理（如果在 Java 中适用）
-
-                    functions[name] = TreesitterMethodNode(
-                        name=name,
-                        doc_comment=None,  # Java 文档注释的处理
-                        node=captured_node,
-                        source_code=None,
-                        method_variables=method_variables,
-                        parameters=parameters,
-                        line_number=line_number,
-                        end_line_number=end_line_number,
-                        async_method_flag=False,  # 根据 Java 语法适当调整
-                        decorator_line_number=None  # Java 注解处理
-                    )
-        return functions
-
-
-    def _query_constructors_with_class(self, class_node: tree_sitter.Node):
-        result = {}
-        query = self.language.query("""
-            (constructor_declaration
-                name: (identifier) @constructor_name
-                parameters: (formal_parameters) @params
-                body: (constructor_body) @body
-            ) @constructor
-        """)
-        captures = query.captures(class_node)
-
-        counter = 0
-
-        for captured_node, _ in captures:
-            if captured_node.type == 'constructor_declaration':
-                name = self._query_method_name(captured_node)
-                doc_comment = None
-                method_variables = self._extract_method_variables(captured_node)
-                parameters = self._extract_parameters(captured_node)
-                line_number = captured_node.start_point[0] + 1
-                end_line_number = captured_node.end_point[0] + 1
-                async_method_flag = False
-                decorator_line_number = None
-
-                if name not in result:
-                    result[name] = TreesitterMethodNode(
-                        name=name,
-                        doc_comment=doc_comment,
-                        node=captured_node,
-                        source_code=captured_node.text.decode('utf-8'),
-                        method_variables=method_variables,
-                        parameters=parameters,
-                        line_number=line_number,
-                        end_line_number=end_line_number,
-                        async_method_flag=async_method_flag,
-                        decorator_line_number=decorator_line_number
-                    )
-                else:
-                    result[name + str(counter)] = TreesitterMethodNode(
-                        name=name,
-                        doc_comment=doc_comment,
-                        node=captured_node,
-                        source_code=captured_node.text.decode('utf-8'),
-                        method_variables=method_variables,
-                        parameters=parameters,
-                        line_number=line_number,
-                        end_line_number=end_line_number,
-                        async_method_flag=async_method_flag,
-                        decorator_line_number=decorator_line_number
-                    )
-                counter += 1
-        return result
-
-
-    def _query_methods_within_class(self, class_node: tree_sitter.Node):
-        result = {}
-        query = self.language.query("""
-            (method_declaration
-                name: (identifier) @function_name
-                parameters: (formal_parameters) @params
-                body: (block) @body
-            ) @function
-        """)
-        captures = query.captures(class_node)
+        :return: whether the traversal should descend into the children of the node
+        """
+        node_type = node.type
+        if node_type == 'import_declaration':
+            self.imports.append(TreesitterImportNode(
+                import_identifier=node.text.decode(),
+                line_number=node.start_point[0] + 1,
+                from_module=None,
+                **self._source_span(node),
+            ))
+            return False
+        if node_type in _CLASS_DECLARATIONS or node_type == 'interface_declaration':
+            name_node = node.child_by_field_name('name')
+            if name_node is None:
+                return True
+            name = name_node.text.decode('utf-8')
+            enclosing = self._enclosing_type()
+            key = name if enclosing is None else f'{enclosing.key}.{name}'
+            is_interface = node_type == 'interface_declaration'
+            self._push(node, _TypeScope(key, name, node, is_interface))
+            if is_interface:
+                self.interfaces[key] = self.scopes[-1]
+            else:
+                self.classes[key] = self.scopes[-1]
+            return True
+        if node_type == 'class_body' and node.parent is not None \
+                and node.parent.type in ('object_creation_expression', 'enum_constant'):
+            # an anonymous class, or the body of an enum constant
+            enclosing = self._enclosing_type()
+            if enclosing is None:
+                return True
+            enclosing.anonymous_counter += 1
+            key = f'{enclosing.key}${enclosing.anonymous_counter}'
+            name_node = node.parent.child_by_field_name('type') or node.parent.child_by_field_name('name')
+            name = name_node.text.decode('utf-8') if name_node else key
+            # the line numbers are the ones of the whole `new Type() {...}` expression
+            self._push(node, _TypeScope(key, name, node.parent))
+            self.classes[key] = self.scopes[-1]
+            return True
+        if node_type in ('method_declaration', 'constructor_declaration'):
+            owner = self.scopes[-1] if self.scopes else None
+            if isinstance(owner, _TypeScope):
+                self._push(node, _MethodScope(node))
+            return True
+        if node_type == 'variable_declarator':
+            self._handle_variable_declarator(node)
+            return True
+        return node_type not in _PRUNED_NODE_TYPES
+
+    def _leave(self, node: tree_sitter.Node):
+        if not self.scope_nodes or self.scope_nodes[-1] != node:
+            return
+        self.scope_nodes.pop()
+        scope = self.scopes.pop()
+        if isinstance(scope, _MethodScope):
+            self._add_method(self.scopes[-1], scope)
+
+    def _push(self, node, scope):
+        self.scope_nodes.append(node)
+        self.scopes.append(scope)
+
+    def _enclosing_type(self):
+        for scope in reversed(self.scopes):
+            if isinstance(scope, _TypeScope):
+                return scope
+        return None
 
-        for captured_node, _ in captures:
-            if captured_node.type == 'method_declaration':
-                name = self._query_method_name(captured_node)
-                doc_comment = self._extract_doc_comment(captured_node)
-                method_variables = self._extract_method_variables(captured_node)
-                parameters = self._extract_parameters(captured_node)
-                line_number = captured_node.start_point[0] + 1
-                end_line_number = captured_node.end_point[0] + 1
-                async_method_flag = self._check_async_method(captured_node)
-                decorator_line_number = self._extract_decorator_line_number(captured_node)
+    def _handle_variable_declarator(self, node: tree_sitter.Node):
+        if not self.scopes:
+            return
+        name_node = node.child_by_field_name('name')
+        if name_node is None or name_node.type != 'identifier':
+            return
+        scope = self.scopes[-1]
+        declaration_type = node.parent.type if node.parent is not None else None
+        if isinstance(scope, _MethodScope):
+            # local variables, including the ones in lambdas and loops of the method
+            if declaration_type != 'local_variable_declaration':
+                return
+        elif scope.is_interface:
+            if declaration_type != 'constant_declaration':
+                return
+        elif declaration_type != 'field_declaration':
+            return
+        scope.variables.append(TreesitterGeneralVariableNode(
+            name=name_node.text.decode('utf-8'),
+            line_number=name_node.start_point[0] + 1
+        ))
+
+    def _add_method(self, owner: _TypeScope, method_scope: _MethodScope):
+        node = method_scope.node
+        name = self._query_method_name(node)
+        parameters = self._extract_parameters(node)
+        is_constructor = node.type == 'constructor_declaration'
+        method = TreesitterMethodNode(
+            name=name,
+            doc_comment=None,
+            **self._source_span(node),
+            method_variables=None if owner.is_interface else method_scope.variables,
+            parameters=parameters,
+            line_number=node.start_point[0] + 1,
+            end_line_number=node.end_point[0] + 1,
+            async_method_flag=False,
+            decorator_line_number=None if is_constructor or owner.is_interface
+            else self._extract_decorator_line_number(node)
+        )
 
-                # if result[name] does not exist, then add in the dictionary
-                if name not in result:
-                    result[name] = TreesitterMethodNode(
-                        name=name,
-                        doc_comment=doc_comment,
-                        node=captured_node,
-                        source_code=captured_node.text.decode('utf-8'),
-                        method_variables=method_variables,
-                        parameters=parameters,
-                        line_number=line_number,
-                        end_line_number=end_line_number,
-                        async_method_flag=async_method_flag,
-                        decorator_line_number=decorator_line_number
-                    )
-                else:
-                    # if result[name] exists, append all parameter's name to the existing name, separated by -
-                    new_name = name + '-' + '-'.join([param.name for param in parameters])
+        if is_constructor:
+            # overloaded constructors get the index of the constructor as suffix
+            if name not in owner.constructors:
+                owner.constructors[name] = method
+            else:
+                owner.constructors[name + str(owner.constructor_counter)] = method
+            owner.constructor_counter += 1
+        elif name not in owner.methods:
+            owner.methods[name] = method
+        else:
+            # overloaded methods get the parameter names as suffix, separated by -
+            owner.methods[name + '-' + '-'.join([param.name for param in parameters])] = method
+
+    def _build_class(self, scope: _TypeScope) -> TreesitterClassNode:
+        node = scope.node
+        return TreesitterClassNode(
+            name=scope.name,
+            constructors=scope.constructors,
+            methods=scope.methods,
+            class_variables=scope.variables,
+            doc_comment=None,  # Java 文档注释的处理
+            line_number=node.start_point[0] + 1,
+            end_line_number=node.end_point[0] + 1,
+            **self._source_span(node),
+        )
 
-                    result[new_name] = TreesitterMethodNode(
-                        name=name,
-                        doc_comment=doc_comment,
-                        node=captured_node,
-                        source_code=captured_node.text.decode('utf-8'),
-                        method_variables=method_variables,
-                        parameters=parameters,
-                        line_number=line_number,
-                        end_line_number=end_line_number,
-                        async_method_flag=async_method_flag,
-                        decorator_line_number=decorator_line_number
-                    )
-        return result
+    def _build_interface(self, scope: _TypeScope) -> TreesitterInferfaceNode:
+        node = scope.node
+        return TreesitterInferfaceNode(
+            name=scope.name,
+            methods=scope.methods,
+            interface_variables=scope.variables,
+            line_number=node.start_point[0] + 1,
+            end_line_number=node.end_point[0] + 1,
+            **self._source_span(node),
+        )
 
     def _query_method_name(self, node: tree_sitter.Node):
         # Assuming 'method_declaration' nodes have a direct 'identifier' child for the name.
@@ -321,172 +265,30 @@ class TreesitterJava(Treesitter):
         return "UnnamedMethod"  # Or handle this case as appropriate
 
     def _extract_decorator_line_number(self, node: tree_sitter.Node):
-        query_str = """
-                (annotation) @annotation
-        """
-        query = self.language.query(query_str)
-        captures = query.captures(node)
-        for captured_node, capture_name in captures:
-            if capture_name == 'annotation':
-                return captured_node.start_point[0] + 1
+        # the first annotation among the modifiers of the method itself, not the ones inside its body
+        for child in node.children:
+            if child.type == 'modifiers':
+                for modifier in child.children:
+                    if modifier.type in ('annotation', 'marker_annotation'):
+                        return modifier.start_point[0] + 1
+                break
         return None
 
-    def _extract_method_variables(self, node: tree_sitter.Node):
-        # Example: Extract variables declared at the start of a function
-        variables = []
-        query_str = """
-            declarator: (variable_declarator
-                name: (identifier) @variable_name
-            )
-        """
-        query = self.language.query(query_str)
-        captures = query.captures(node)
-        for captured_node, capture_name in captures:
-            if capture_name == 'variable_name':
-                variable_name = captured_node.text.decode('utf-8')
-                line_number = captured_node.start_point[0] + 1
-                variables.append(TreesitterGeneralVariableNode(
-                    name=variable_name,
-                    line_number=line_number
-                ))
-        return variables
-
     def _extract_parameters(self, node: tree_sitter.Node):
         params = []
-        if node.type in ['method_declaration', 'constructor_declaration']:
-            query_str = """
-                parameters: (formal_parameters
-                    (formal_parameter
-                        name: (identifier) @param_name
-                    )
-                )
-            """
-            query = self.language.query(query_str)
-            captures = query.captures(node)
-            for captured_node, capture_name in captures:
-                if capture_name == 'param_name':
-                    param_name = captured_node.text.decode('utf-8')
-                    line_number = captured_node.start_point[0] + 1
+        params_node = node.child_by_field_name('parameters')
+        if params_node is None:
+            return params
+        for param in params_node.children:
+            if param.type == 'formal_parameter':
+                name_node = param.child_by_field_name('name')
+                if name_node is not None and name_node.type == 'identifier':
                     params.append(TreesitterGeneralParameterNode(
-                        name=param_name,
-                        line_number=line_number
+                        name=name_node.text.decode('utf-8'),
+                        line_number=name_node.start_point[0] + 1
                     ))
-
         return params
 
-    def _extract_class_variables(self, class_node: tree_sitter.Node):
-        class_variables = []
-        # 更新了查询字符串以匹配 Java 中的字段声明
-        query_str = """
-            (class_declaration
-                body: (class_body
-                    (field_declaration
-                        declarator: (variable_declarator
-                            name: (identifier) @variable_name
-                        )
-                    )
-                )
-            )
-        """
-        query = self.language.query(query_str)
-        captures = query.captures(class_node)
-
-        for captured_node, capture_name in captures:
-            if capture_name == 'variable_name':
-                variable_name = captured_node.text.decode('utf-8')
-                line_number = captured_node.start_point[0] + 1
-                # 可以在这里添加更多逻辑，比如提取变量类型等
-                class_variables.append(TreesitterGeneralVariableNode(
-                    name=variable_name,
-                    line_number=line_number
-                ))
-
-        return class_variables
-    
-    def _query_global_variables(self, class_node: tree_sitter.Node):
-        # 全局变量在 Java 中一般指的是静态变量，可以在类级别定义。注意这里的node应该是class_node，而不是一般的node
-        class_variables = []
-        # 查询静态变量的字符串
-        query_str = """
-            (class_declaration
-                body: (class_body
-                    (field_declaration
-                        (modifier) @modifier
-                        declarator: (variable_declarator
-                            name: (identifier) @variable_name
-                        )
-                    )
-                )
-            )
-        """
-        query = self.language.query(query_str)
-        captures = query.captures(class_node)
-
-        for captured_node, capture_name in captures:
-            if capture_name == 'variable_name':
-                # 检查是否有静态修饰符
-                modifier_node = captured_node.prev_sibling
-                while modifier_node is not None:
-                    if modifier_node.type == 'modifier' and 'static' in modifier_node.text.decode('utf-8'):
-                        variable_name = captured_node.text.decode('utf-8')
-                        line_number = captured_node.start_point[0] + 1
-                        class_variables.append(TreesitterGeneralVariableNode(
-                            name=variable_name,
-                            line_number=line_number
-                        ))
-                        break  # 找到静态修饰符后就不需要继续查找
-                    modifier_node = modifier_node.prev_sibling
-
-        return class_variables
-
-    def _query_main_block(self, root_node: tree_sitter.Node):
-        # 构建查询字符串以查找 main 方法
-        query_str = """
-            (class_declaration
-                body: (class_body
-                    (method_declaration
-                        modifiers: (modifiers
-                            (modifier) @public
-                            (modifier) @static
-                        )
-                        type: (void_type) @return_type
-                        name: (identifier) @method_name
-                        parameters: (formal_parameters
-                            (formal_parameter
-                                type: (type_identifier) @param_type
-                                name: (identifier) @param_name
-                            )
-                        )
-                        body: (block) @body
-                    ) @main_method
-                    (#match? @method_name "main")
-                    (#match? @param_type "String\\[\\]")
-                )
-            )
-        """
-        query = self.language.query(query_str)
-        captures = query.captures(root_node)
-
-        main_blocks = []
-
-        for captured_node, capture_name in captures:
-            if capture_name == 'body':
-                # 提取 main 方法的信息
-                source_code = captured_node.text.decode('utf-8')
-                line_number = captured_node.start_point[0] + 1
-                end_line_number = captured_node.end_point[0] + 1
-
-                main_blocks.append(TreesitterMainBlockNode(
-                    node=captured_node,
-                    source_code=source_code,
-                    line_number=line_number,
-                    end_line_number=end_line_number
-                ))
-
-        return main_blocks
-
-
 
 # Register the TreesitterJava class in the registry
 TreesitterRegistry.register_treesitter(Language.JAVA, TreesitterJava)
-
@@ -0,0 +1,85 @@
+import json
+from json.encoder import encode_basestring_ascii
+
+from llm_project_helper.treesitter.treesitter import TreesitterRecord
+
+
+def dumps_result(result: TreesitterRecord, indent: int | None = None, **extra_fields) -> str:
+    """
+    Serialize a treesitter result (or any TreesitterRecord) to the structure json.
+
+    Compact by default, without any whitespace. With an indent, the output is byte-identical to
+    json.dumps(result.model_dump() | extra_fields, indent=indent, default=str), which is what FileSummaryAnalyzer
+    reads, but is written straight from the records instead of going through the pure python encoder of json.dumps.
+
+    :param extra_fields: fields appended after the ones of result, e.g. relative_path
+    """
+    out = []
+    if indent:
+        _emit_record(result, out, '\n', ' ' * indent, ': ', extra_fields)
+    else:
+        _emit_record(result, out, '', '', ':', extra_fields)
+    return ''.join(out)
+
+
+def _emit_record(record, out, newline, step, colon, extra_fields=None):
+    names = record._dump_fields
+    if not names and not extra_fields:
+        out.append('{}')
+        return
+    inner = newline + step
+    separator = '{' + inner
+    for name in names:
+        out.append(separator + encode_basestring_ascii(name) + colon)
+        _emit(getattr(record, name), out, inner, step, colon)
+        separator = ',' + inner
+    if extra_fields:
+        for name, value in extra_fields.items():
+            out.append(separator + encode_basestring_ascii(name) + colon)
+            _emit(value, out, inner, step, colon)
+            separator = ',' + inner
+    out.append(newline + '}')
+
+
+def _emit(value, out, newline, step, colon):
+    """
+    Append the json of value to out, newline being the line break and indentation of the current nesting level (empty
+    when compact), step the indentation added per level and colon the separator between keys and values.
+    """
+    if isinstance(value, str):
+        out.append(encode_basestring_ascii(value))
+    elif value is None:
+        out.append('null')
+    elif value is True:
+        out.append('true')
+    elif value is False:
+        out.append('false')
+    elif isinstance(value, int):
+        out.append(int.__repr__(value))
+    elif isinstance(value, TreesitterRecord):
+        _emit_record(value, out, newline, step, colon)
+    elif isinstance(value, list):
+        if not value:
+            out.append('[]')
+            return
+        inner = newline + step
+        separator = '[' + inner
+        for item in value:
+            out.append(separator)
+            _emit(item, out, inner, step, colon)
+            separator = ',' + inner
+        out.append(newline + ']')
+    elif isinstance(value, dict):
+        if not value:
+            out.append('{}')
+            return
+        inner = newline + step
+        separator = '{' + inner
+        for key, item in value.items():
+            out.append(separator + encode_basestring_ascii(key) + colon)
+            _emit(item, out, inner, step, colon)
+            separator = ',' + inner
+        out.append(newline + '}')
+    else:
+        # floats, bytes and anything else: the same as json.dumps(..., default=str)
+        out.append(json.dumps(value, default=str))
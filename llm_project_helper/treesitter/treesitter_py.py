@@ -1,16 +1,24 @@
-import tree_sitter
-
-from llm_project_helper.const import Language
+from llm_project_helper.const import Language, TREESITTER_ENGINE
 from llm_project_helper.treesitter.treesitter import (Treesitter,
-                                                      TreesitterMethodNode)
+                                                      SourceBuffer,
+                                                      TreesitterResultNode)
+from llm_project_helper.treesitter.treesitter_py_cursor import PythonCursorExtractor
 from llm_project_helper.treesitter.treesitter_registry import TreesitterRegistry
 
 
 class TreesitterPython(Treesitter):
-    def __init__(self):
+    def __init__(self, engine: str = TREESITTER_ENGINE):
         super().__init__(
             Language.PYTHON, "function_definition", "identifier", "expression_statement"
         )
+        self.engine = engine
+
+    def parse(self, file_bytes: bytes) -> TreesitterResultNode:
+        if self.engine != "cursor":
+            return super().parse(file_bytes)
+        self.source = SourceBuffer(file_bytes)
+        self.tree = self.parser.parse(file_bytes)
+        return PythonCursorExtractor(self).extract(self.tree)
 
 
 # Register the TreesitterPython class in the registry
@@ -0,0 +1,246 @@
+import tree_sitter
+
+from llm_project_helper.treesitter.treesitter import (TreesitterMethodNode,
+                                                      TreesitterResultNode,
+                                                      TreesitterImportNode,
+                                                      TreesitterClassNode,
+                                                      TreesitterGeneralVariableNode,
+                                                      TreesitterGeneralParameterNode,
+                                                      TreesitterGlobalVariableNode,
+                                                      TreesitterMainBlockNode,)
+
+# Node types that cannot contain an import, a class or a function, so the traversal does not descend into them
+_PRUNED_NODE_TYPES = frozenset({
+    'expression_statement', 'return_statement', 'decorator', 'parameters', 'lambda_parameters', 'comment', 'string',
+    'identifier', 'pass_statement', 'raise_statement', 'assert_statement', 'delete_statement', 'global_statement',
+    'nonlocal_statement', 'break_statement', 'continue_statement', 'print_statement', 'exec_statement',
+    'future_import_statement', 'import_statement', 'import_from_statement', 'type', 'call', 'attribute',
+    'comparison_operator', 'boolean_operator', 'not_operator', 'binary_operator', 'unary_operator', 'subscript',
+    'parenthesized_expression', 'tuple', 'list', 'dictionary', 'set', 'list_comprehension',
+    'dictionary_comprehension', 'set_comprehension', 'generator_expression', 'conditional_expression', 'lambda',
+    'await', 'pattern_list', 'tuple_pattern', 'list_pattern', 'integer', 'float', 'true', 'false', 'none',
+    'concatenated_string', 'keyword_argument',
+})
+
+
+class _FunctionRecord:
+    __slots__ = ('node', 'variables', 'built')
+
+    def __init__(self, node):
+        self.node = node
+        self.variables = []
+        self.built = None
+
+
+class _ClassRecord:
+    __slots__ = ('node', 'name', 'methods', 'class_variables')
+
+    def __init__(self, node, name):
+        self.node = node
+        self.name = name
+        self.methods = {}
+        self.class_variables = []
+
+
+class PythonCursorExtractor:
+    """
+    Single pass extraction engine for python, an alternative to the query based Treesitter.parse.
+
+    The syntax tree is walked once with a TreeCursor, keeping an explicit stack of the class and function scopes
+    around the current node; an empty stack is the module scope. Every entity is attributed to its scopes while
+    walking, instead of running a whole-tree query per entity kind and per function, and instead of walking up the
+    ancestors of every function. The produced TreesitterResultNode is the same as the one of Treesitter.parse.
+    """
+
+    def __init__(self, treesitter):
+        # the TreesitterPython instance, whose helpers are shared with the query based engine
+        self.treesitter = treesitter
+
+    def extract(self, tree: tree_sitter.Tree) -> TreesitterResultNode:
+        self.imports = []
+        self.import_froms = []
+        self.classes = {}
+        self.functions = {}
+        self.global_variables = []
+        self.main_block = None
+        # the classes and functions enclosing the current node, innermost last
+        self.class_scopes = []
+        self.function_scopes = []
+        # the nodes of the scopes on the stack, to pop them when the cursor leaves their node
+        self.scope_stack = []
+
+        cursor = tree.walk()
+        reached_root = False
+        while not reached_root:
+            node = cursor.node
+            if self._enter(node) and cursor.goto_first_child():
+                continue
+            self._leave(node)
+            while not cursor.goto_next_sibling():
+                if not cursor.goto_parent():
+                    reached_root = True
+                    break
+                self._leave(cursor.node)
+
+        return TreesitterResultNode(
+            imports=self.imports + self.import_froms,
+            classes={name: self._build_class(record) for name, record in self.classes.items()},
+            functions={name: self._build_function(record) for name, record in self.functions.items()},
+            global_variables=self.global_variables,
+            main_block=self.main_block,
+            interfaces=None,
+        )
+
+    def _enter(self, node: tree_sitter.Node) -> bool:
+        """
+        Handle a node when the cursor reaches it.
+
+        :return: whether the traversal should descend into the children of the node
+        """
+        node_type = node.type
+        if node_type == 'function_definition':
+            record = _FunctionRecord(node)
+            name = self.treesitter._query_method_name(node)
+            # a function anywhere below a class is a method of every enclosing class
+            for class_record in self.class_scopes:
+                class_record.methods[name] = record
+            if not self.class_scopes:
+                self.functions[name] = record
+            self.function_scopes.append(record)
+            self.scope_stack.append(node)
+            return True
+        if node_type == 'class_definition':
+            name_node = node.child_by_field_name('name')
+            if name_node:
+                record = _ClassRecord(node, name_node.text.decode('utf-8'))
+                self.classes[record.name] = record
+                self.class_scopes.append(record)
+                self.scope_stack.append(node)
+            return True
+        if node_type == 'expression_statement':
+            self._handle_expression_statement(node)
+            return False
+        if node_type == 'import_statement':
+            self.imports.append(self._build_import(node, None))
+            return False
+        if node_type == 'import_from_statement':
+            module_name_node = node.child_by_field_name('module_name')
+            from_module = module_name_node.text.decode() if module_name_node else None
+            self.import_froms.append(self._build_import(node, from_module))
+            return False
+        if node_type == 'if_statement':
+            if self.main_block is None and node.parent.type == 'module':
+                self.main_block = self._main_block(node)
+            return True
+        return node_type not in _PRUNED_NODE_TYPES
+
+    def _leave(self, node: tree_sitter.Node):
+        if self.scope_stack and self.scope_stack[-1] == node:
+            self.scope_stack.pop()
+            if node.type == 'function_definition':
+                self.function_scopes.pop()
+            else:
+                self.class_scopes.pop()
+
+    def _handle_expression_statement(self, node: tree_sitter.Node):
+        assignment = next((child for child in node.named_children if child.type == 'assignment'), None)
+        if assignment is None:
+            return
+        block = node.parent
+        owner = block.parent if block.type == 'block' else block
+        left = assignment.child_by_field_name('left')
+
+        if owner.type == 'function_definition':
+            # a function also lists the variables of the functions nested in it
+            variable = TreesitterGeneralVariableNode(
+                name=left.text.decode('utf-8'),
+                line_number=assignment.start_point[0] + 1,
+            )
+            for function_record in self.function_scopes:
+                function_record.variables.append(variable)
+            return
+
+        if left.type != 'identifier' or assignment.child_by_field_name('right') is None:
+            return
+        if owner.type == 'class_definition':
+            # a class also lists the variables of the classes nested in it
+            variable = TreesitterGeneralVariableNode(
+                name=left.text.decode('utf-8'),
+                line_number=left.start_point[0] + 1,
+            )
+            for class_record in self.class_scopes:
+                class_record.class_variables.append(variable)
+        elif owner.type == 'module':
+            self.global_variables.append(TreesitterGlobalVariableNode(
+                name=left.text.decode('utf-8'),
+                line_number=left.start_point[0] + 1,
+            ))
+
+    def _main_block(self, if_node: tree_sitter.Node):
+        condition = if_node.child_by_field_name('condition')
+        consequence = if_node.child_by_field_name('consequence')
+        if condition is None or condition.type != 'comparison_operator' or consequence is None:
+            return None
+        identifier_node = None
+        string_node = None
+        for child in condition.children:
+            if child.type == 'identifier' and child.text.decode('utf-8') == '__name__':
+                identifier_node = child
+            elif child.type == 'string':
+                string_content = child.text.decode('utf-8').strip('"\'')
+                if string_content == '__main__':
+                    string_node = child
+        if identifier_node and string_node:
+            return TreesitterMainBlockNode(**self.treesitter._source_span(consequence))
+        return None
+
+    def _build_import(self, node: tree_sitter.Node, from_module):
+        return TreesitterImportNode(
+            import_identifier=node.text.decode(),
+            line_number=node.start_point[0] + 1,
+            from_module=from_module,
+            **self.treesitter._source_span(node),
+        )
+
+    def _build_function(self, record: _FunctionRecord) -> TreesitterMethodNode:
+        # a nested function is shared by the method lists of all its enclosing classes, build it once
+        if record.built is not None:
+            return record.built
+        node = record.node
+        record.built = TreesitterMethodNode(
+            name=self.treesitter._query_method_name(node),
+            doc_comment=self.treesitter._extract_doc_comment(node),
+            **self.treesitter._source_span(node),
+            method_variables=record.variables,
+            parameters=self._extract_parameters(node),
+            line_number=node.start_point[0] + 1,
+            end_line_number=node.end_point[0] + 1,
+            async_method_flag=node.child(0).type == 'async',
+            decorator_line_number=self.treesitter._extract_decorator_line_number(node)
+        )
+        return record.built
+
+    def _build_class(self, record: _ClassRecord) -> TreesitterClassNode:
+        node = record.node
+        return TreesitterClassNode(
+            name=record.name,
+            constructors=None,
+            methods={name: self._build_function(method) for name, method in record.methods.items()},
+            class_variables=record.class_variables,
+            doc_comment=self.treesitter._extract_doc_comment(node),
+            line_number=node.start_point[0] + 1,
+            end_line_number=node.end_point[0] + 1,
+            **self.treesitter._source_span(node),
+        )
+
+    def _extract_parameters(self, node: tree_sitter.Node):
+        params = []
+        params_node = node.child_by_field_name('parameters')
+        if params_node:
+            for param in params_node.children:
+                if param.type == 'identifier':
+                    params.append(TreesitterGeneralParameterNode(
+                        name=param.text.decode('utf-8'),
+                        line_number=param.start_point[0] + 1
+                    ))
+        return params
@@ -2,6 +2,9 @@ from llm_project_helper.const import Language
 
 class TreesitterRegistry:
     _registry = {}
+    # the warm Treesitter instances of the current process, keyed by Language. A Treesitter keeps the state of the
+    # file being parsed, so an instance must not be used by two threads at the same time
+    _pool = {}
 
     @classmethod
     def register_treesitter(cls, name, treesitter_class):
@@ -14,3 +17,23 @@ class TreesitterRegistry:
             return treesitter_class()
         else:
             raise ValueError("Invalid tree type")
+
+    @classmethod
+    def get_treesitter(cls, name: Language):
+        """
+        Returns the warm Treesitter of the process for the language, creating it on first use.
+        """
+        treesitter = cls._pool.get(name)
+        if treesitter is None:
+            treesitter = cls.create_treesitter(name)
+            cls._pool[name] = treesitter
+        return treesitter
+
+    @classmethod
+    def warm_up(cls):
+        """
+        Create the pooled Treesitter of every registered language up front, e.g. in the initializer of a worker
+        process. Worker processes forked after a warm up inherit the instances of their parent.
+        """
+        for name in cls._registry:
+            cls.get_treesitter(name)
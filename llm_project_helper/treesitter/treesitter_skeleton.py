@@ -0,0 +1,115 @@
+from llm_project_helper.treesitter.treesitter import TreesitterRecord
+
+# from the fewest to the most tokens
+SKELETON_DETAILS = ("minimal", "standard", "full")
+
+
+def render_skeleton(result, detail="standard") -> str:
+    """
+    Render a treesitter result as a compact, indented outline of the file, for the prompts of the LLM: one line per
+    class, interface, method and function, with its line range, instead of the structure json.
+
+    - minimal: the imported modules, and the names and line ranges of the classes, interfaces, methods and functions
+    - standard: plus the import statements, the parameters, the first line of the doc comments, the class, interface
+      and global variables, the async and decorator marks, and the line range of the main block
+    - full: plus the whole doc comments, the line numbers of the variables, the variables of the methods and the
+      source of the main block
+
+    :param result: a TreesitterResultNode, or the structure json of one as loaded by json.load
+    """
+    if detail not in SKELETON_DETAILS:
+        raise ValueError(f"Unknown skeleton detail {detail}, expected one of {', '.join(SKELETON_DETAILS)}")
+    if isinstance(result, TreesitterRecord):
+        result = result.model_dump()
+    full = detail == "full"
+    lines = []
+
+    imports = result.get("imports") or []
+    if imports:
+        if detail == "minimal":
+            lines.append("imports: " + ", ".join(_imported_module(node) for node in imports))
+        else:
+            lines.extend(f"L{node['line_number']} {node['import_identifier']}" for node in imports)
+
+    if detail != "minimal":
+        global_variables = result.get("global_variables") or []
+        if global_variables:
+            lines.append("globals: " + _variables(global_variables, full))
+
+    # the keys, unlike the names, tell the nested (Outer.Inner) and anonymous (Outer$1) java classes apart
+    for class_name, class_node in (result.get("classes") or {}).items():
+        _render_type("class", class_name, class_node, class_node.get("class_variables"), detail, lines)
+    for interface_name, interface_node in (result.get("interfaces") or {}).items():
+        _render_type("interface", interface_name, interface_node, interface_node.get("interface_variables"), detail,
+                     lines)
+    for function_node in (result.get("functions") or {}).values():
+        _render_method(function_node, detail, "", lines)
+
+    main_block = result.get("main_block")
+    if main_block and detail != "minimal":
+        lines.append(f"main block {_line_range(main_block)}")
+        if full and main_block.get("source_code"):
+            lines.extend("  " + line for line in main_block["source_code"].splitlines())
+    return "\n".join(lines) + "\n"
+
+
+def _render_type(kind, name, node, variables, detail, lines):
+    lines.append(f"{kind} {name} {_line_range(node)}")
+    if detail != "minimal":
+        _render_doc(node.get("doc_comment"), detail, "  ", lines)
+        if variables:
+            lines.append("  vars: " + _variables(variables, detail == "full"))
+    for constructor in (node.get("constructors") or {}).values():
+        _render_method(constructor, detail, "  ", lines)
+    for method in (node.get("methods") or {}).values():
+        _render_method(method, detail, "  ", lines)
+
+
+def _render_method(node, detail, indent, lines):
+    if detail == "minimal":
+        lines.append(f"{indent}{node['name']}() {_line_range(node)}")
+        return
+    decorator = "@" if node.get("decorator_line_number") is not None else ""
+    prefix = "async " if node.get("async_method_flag") else ""
+    parameters = ", ".join(parameter["name"] for parameter in node.get("parameters") or [])
+    lines.append(f"{indent}{decorator}{prefix}{node['name']}({parameters}) {_line_range(node)}")
+    _render_doc(node.get("doc_comment"), detail, indent + "  ", lines)
+    if detail == "full" and node.get("method_variables"):
+        lines.append(f"{indent}  locals: " + _variables(node["method_variables"], True))
+
+
+def _render_doc(doc_comment, detail, indent, lines):
+    if not doc_comment:
+        return
+    # python docstrings keep their quotes, and java doc comments their /** */ and leading *
+    text = doc_comment.strip().strip('"\'').removeprefix("/**").removesuffix("*/")
+    doc_lines = [line.strip().lstrip("*").strip() for line in text.splitlines()]
+    doc_lines = [line for line in doc_lines if line]
+    if not doc_lines:
+        return
+    if detail != "full":
+        doc_lines = doc_lines[:1]
+    lines.extend(f"{indent}# {line}" for line in doc_lines)
+
+
+def _variables(variables, with_line_numbers):
+    if with_line_numbers:
+        return ", ".join(f"{variable['name']} L{variable['line_number']}" for variable in variables)
+    return ", ".join(variable["name"] for variable in variables)
+
+
+def _imported_module(import_node):
+    if import_node.get("from_module"):
+        return import_node["from_module"]
+    identifier = import_node["import_identifier"]
+    for keyword in ("import static ", "import "):
+        if identifier.startswith(keyword):
+            return identifier[len(keyword):].rstrip(";").strip()
+    return identifier
+
+
+def _line_range(node):
+    start, end = node.get("line_number"), node.get("end_line_number")
+    if end is None or end == start:
+        return f"L{start}"
+    return f"L{start}-{end}"
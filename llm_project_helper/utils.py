@@ -1,5 +1,9 @@
+import contextlib
 import os
 import re
+import hashlib
+import textwrap
+import uuid
 
 from llm_project_helper.const import Language
 
@@ -59,4 +63,168 @@ def extract_content_from_markdown_code_block(markdown_code_block) -> str:
     if match:
         return match.group(1).strip()
     else:
-        return markdown_code_block.strip()
\ No newline at end of file
+        return markdown_code_block.strip()
+
+
+def normalize_source(code: str, programming_language: Language = Language.UNKNOWN) -> str:
+    """
+    Normalizes a piece of source code so that formatting-only edits do not change it.
+
+    Trailing whitespace, blank lines, comments and the common indentation are removed. The relative indentation is
+    kept, as it is meaningful in python. Python comments are removed when they fill a line; java ones, // and /* */,
+    wherever they start, the code around them being kept.
+
+    Args:
+        code (str): The source code of a section (function, method, class).
+        programming_language (Language): The language of the code, used to recognize comments.
+
+    Returns:
+        str: The normalized source code.
+    """
+    lines = [line.rstrip() for line in textwrap.dedent(code).splitlines()]
+    if programming_language is not Language.JAVA:
+        return "\n".join(line for line in lines if line and not line.lstrip().startswith("#"))
+    kept = []
+    for line, code_line in zip(lines, _strip_java_comments(lines)):
+        if code_line.strip():
+            # the indentation of the line, not the space left by a comment before its code
+            kept.append(line[:len(line) - len(line.lstrip())] + code_line.strip())
+    return "\n".join(kept)
+
+
+_JAVA_COMMENT_OR_LITERAL = re.compile(r'//|/\*|"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'')
+
+
+def _strip_java_comments(lines):
+    """
+    Yields the lines of java code without their comments. A /* */ comment is tracked across the lines it spans; the
+    comment markers in string and char literals are code.
+    """
+    in_block = False
+    for line in lines:
+        code = ""
+        pos = 0
+        while pos < len(line):
+            if in_block:
+                end = line.find("*/", pos)
+                if end < 0:
+                    break
+                in_block = False
+                pos = end + 2
+                continue
+            match = _JAVA_COMMENT_OR_LITERAL.search(line, pos)
+            if match is None:
+                code += line[pos:]
+                break
+            code += line[pos:match.start()]
+            if match.group() == "//":
+                break
+            in_block = match.group() == "/*"
+            if not in_block:
+                code += match.group()
+            pos = match.end()
+        yield code
+
+
+def section_fingerprint(code: str, programming_language: Language = Language.UNKNOWN) -> str:
+    """
+    Returns a short fingerprint of the normalized source of a section.
+
+    Args:
+        code (str): The source code of a section (function, method, class).
+        programming_language (Language): The language of the code.
+
+    Returns:
+        str: The first 16 hex digits of the sha256 of the normalized source.
+    """
+    normalized = normalize_source(code, programming_language)
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()[:16]
+
+
+class SourceLines:
+    """
+    The text of a source file, read once, with the offset of the start of every line, so that the lines of a section
+    are sliced from the text instead of scanning the file from its first line.
+
+    The lines are the ones of iterating over the file opened in text mode: universal newlines, and no line after a
+    trailing newline.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.line_starts = [0] + [match.end() for match in re.finditer("\n", text)]
+        if self.line_starts[-1] == len(text):
+            # a trailing newline (or an empty file) does not start a line
+            self.line_starts.pop()
+        # the end of the last line
+        self.line_starts.append(len(text))
+
+    @classmethod
+    def from_file(cls, filename: str) -> "SourceLines":
+        with open(filename, 'r') as file:
+            return cls(file.read())
+
+    def __len__(self):
+        return len(self.line_starts) - 1
+
+    def lines(self, start_line: int, end_line: int) -> list:
+        """
+        Returns the lines from start_line to end_line (1-based, inclusive), stripped of their trailing whitespace. The
+        lines past the end of the file are left out.
+        """
+        if start_line < 1 or end_line < start_line:
+            raise ValueError("Start line must be >= 1 and end line must be >= start line.")
+        chunk = self.text[self.line_starts[min(start_line - 1, len(self))]:self.line_starts[min(end_line, len(self))]]
+        if not chunk:
+            return []
+        lines = chunk.split("\n")
+        if chunk.endswith("\n"):
+            lines.pop()
+        return [line.rstrip() for line in lines]
+
+
+def atomic_write(file_path: str, text: str, encoding: str = None):
+    """
+    Writes a text file atomically: the text goes to a temporary file of the same folder, renamed over file_path once
+    complete, so that a reader, e.g. another worker process sharing the workspace, never sees a partial file, and an
+    interrupted run never leaves a truncated one behind.
+
+    Args:
+        file_path (str): The file to write.
+        text (str): The content of the file.
+        encoding (str): The encoding of the file, the locale encoding by default as with open.
+    """
+    tmp_path = f"{file_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding=encoding) as f:
+            f.write(text)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+@contextlib.contextmanager
+def atomic_stream(file_path: str, encoding: str = None):
+    """
+    Like atomic_write, for a text file written piece by piece, e.g. as an LLM streams it: the pieces go to
+    file_path + ".partial", where its progress can be followed, and it replaces file_path once the block completes.
+    If the block fails, the partial file is removed and file_path is left as it was.
+
+    Args:
+        file_path (str): The file to write.
+        encoding (str): The encoding of the file, the locale encoding by default as with open.
+
+    Yields:
+        The partial file, opened for writing; flush it after every piece to make the piece visible.
+    """
+    partial_path = file_path + ".partial"
+    try:
+        with open(partial_path, 'w', encoding=encoding) as f:
+            yield f
+        os.replace(partial_path, file_path)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
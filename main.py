@@ -1,7 +1,16 @@
 import argparse
+import asyncio
+import subprocess
 import sys
 from llm_project_helper import RepoTraverser
+from llm_project_helper.const import COMMENT_BATCH_TOKENS, STRUCTURE_PROMPT_DETAIL, SECTION_DEDUP, LLM_CASSETTE_LATENCY
+from llm_project_helper.const import MAX_PROMPT_TOKENS
+from llm_project_helper.treesitter import SKELETON_DETAILS
+from llm_project_helper.git_diff import get_changed_files
 from llm_project_helper.logs import logger
+from llm_project_helper.provider.cassette import CASSETTE_LATENCIES, RECORD, REPLAY, shared_cassette, use_cassette
+from llm_project_helper.provider.request_stats import request_latencies
+from llm_project_helper.provider.response_cache import shared_response_cache
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -28,6 +37,88 @@ if __name__ == '__main__':
         action="store_true",
         help="Force re-comment the whole repo"
     )
+    # number of worker processes for the structure analyzation; 1 keeps the serial traversal
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of worker processes used to parse the repo structure, 0 uses all CPUs"
+    )
+    # only handle the files changed since a git revision, e.g. the last commit that was analyzed
+    parser.add_argument(
+        "--since",
+        type=str,
+        default=None,
+        help="Only analyze and comment the files changed since this git revision of the repo"
+    )
+    # number of LLM requests sent at the same time; 1 keeps the sequential analyzers
+    parser.add_argument(
+        "--max-in-flight",
+        type=int,
+        default=1,
+        help="Maximum number of concurrent LLM requests when summarizing and commenting, 1 sends them one by one"
+    )
+    # pack the functions and methods of a file into a few batched comment requests; 0 requests them one by one
+    parser.add_argument(
+        "--comment-batch-tokens",
+        type=int,
+        default=COMMENT_BATCH_TOKENS,
+        help="Token budget of a batched comment request, 0 requests every function and method alone"
+    )
+    # put a compact skeleton of the structure in the summary prompts instead of the structure json
+    parser.add_argument(
+        "--structure-detail",
+        choices=("json",) + SKELETON_DETAILS,
+        default=STRUCTURE_PROMPT_DETAIL,
+        help="How the structure of a file is put in its summary prompt: the json as is, or a skeleton of this detail"
+    )
+    # summarize the files and classes too large for a prompt map-reduce, part by part; 0 puts them whole in the prompt
+    parser.add_argument(
+        "--max-prompt-tokens",
+        type=int,
+        default=MAX_PROMPT_TOKENS,
+        help="Ceiling of the input tokens of a summary or class request, 0 for none"
+    )
+    # comment the identical functions, methods and classes of the repo once, the copies taking the same remark
+    parser.add_argument(
+        "--section-dedup",
+        action=argparse.BooleanOptionalAction,
+        default=SECTION_DEDUP,
+        help="Request the sections identical to another one of the repo only once"
+    )
+    # parse, summarize and comment the files as a pipeline instead of three passes over the repo
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="Summarize and comment every file as soon as it is parsed, the parsing overlapping the LLM requests"
+    )
+    # a run killed halfway resumes where it stopped when it is started again with the same arguments
+    parser.add_argument(
+        "--resume",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="Resume the unfinished run started with the same arguments, keeping the files and remarks it finished"
+    )
+    # record the LLM exchanges of the run, to replay them offline later with the same repo and arguments
+    cassette = parser.add_mutually_exclusive_group()
+    cassette.add_argument(
+        "--record-cassette",
+        type=str,
+        default=None,
+        help="Append every LLM request and response of the run to this cassette file"
+    )
+    cassette.add_argument(
+        "--replay-cassette",
+        type=str,
+        default=None,
+        help="Serve the LLM responses from this cassette file instead of requesting the LLM"
+    )
+    parser.add_argument(
+        "--replay-latency",
+        choices=CASSETTE_LATENCIES,
+        default=LLM_CASSETTE_LATENCY,
+        help="Serve the replayed responses after their recorded latency, or at once"
+    )
 
     args = parser.parse_args()
     repo_path = args.repo_path
@@ -39,7 +130,45 @@ if __name__ == '__main__':
     logger.info(f"Force re-analyze: {force_re_analyze}")
     force_re_comment = args.force_re_comment
     logger.info(f"Force re-comment: {force_re_comment}")
+    jobs = args.jobs
+    logger.info(f"Jobs: {jobs}")
+    since = args.since
+    logger.info(f"Since: {since}")
+    max_in_flight = args.max_in_flight
+    logger.info(f"Max in flight: {max_in_flight}")
+    comment_batch_tokens = args.comment_batch_tokens
+    logger.info(f"Comment batch tokens: {comment_batch_tokens}")
+    structure_detail = args.structure_detail
+    logger.info(f"Structure detail: {structure_detail}")
+    max_prompt_tokens = args.max_prompt_tokens
+    logger.info(f"Max prompt tokens: {max_prompt_tokens}")
+    section_dedup = args.section_dedup
+    logger.info(f"Section dedup: {section_dedup}")
+    pipeline = args.pipeline
+    logger.info(f"Pipeline: {pipeline}")
+    if args.record_cassette:
+        use_cassette(args.record_cassette, RECORD)
+    elif args.replay_cassette:
+        use_cassette(args.replay_cassette, REPLAY, args.replay_latency)
+    logger.info(f"Cassette: {args.record_cassette or args.replay_cassette}")
     traverser = RepoTraverser(repo_path)
+    # the state of the run is kept in the workspace, so that a crashed run started again resumes where it stopped
+    job_options = {name: value for name, value in vars(args).items() if name != "resume"}
+    resumed = traverser.begin_job(job_options, resume=args.resume)
+    logger.info(f"Resumed: {resumed}")
+
+    # 0. In incremental mode, find the changed files through git, and move or drop the outputs of renamed and
+    # deleted files. The three steps below then only handle the changed files
+    files_to_traverse = None
+    files_to_process = None
+    if since:
+        try:
+            changes = get_changed_files(repo_path, since)
+        except subprocess.CalledProcessError as e:
+            sys.exit(f"Cannot get the changes since {since}: {e.stderr.decode().strip()}. Exiting")
+        traverser.apply_git_changes(changes)
+        files_to_traverse = changes.files_to_traverse()
+        files_to_process = changes.files_to_process()
 
     # # concat current folder with workspaces; if env defined a home folder, then use that
     # workspaces_dir = os.path.join(os.getcwd(), WORKSPACE_DIR)
@@ -47,13 +176,43 @@ if __name__ == '__main__':
     #     workspaces_dir = llm_project_helper.const.WORKSPACE_DIR
     # logger.info(f"workspaces_dir: {workspaces_dir}")
 
-    # 1. Doing the structure analyzation. LLM is not USED HERE
-    # DONE: try to parse using treesitter. change the parser from python_parser to treesitter parser
-    analyze_folder = traverser.traverse_repo()
-    logger.info(f"Analyze folder: {analyze_folder}")
+    if pipeline:
+        # 1, 2 and 3 at once: every file flows from the parser to the summary and to the comments
+        analyze_folder = asyncio.run(traverser.pipeline_async(
+            force_re_analyze, force_re_comment, jobs=jobs, traverse_files=files_to_traverse,
+            only_files=files_to_process, max_in_flight=max_in_flight, comment_batch_tokens=comment_batch_tokens,
+            structure_detail=structure_detail, section_dedup=section_dedup, max_prompt_tokens=max_prompt_tokens))
+        logger.info(f"Analyze folder: {analyze_folder}")
+    else:
+        # 1. Doing the structure analyzation. LLM is not USED HERE
+        # DONE: try to parse using treesitter. change the parser from python_parser to treesitter parser
+        analyze_folder = traverser.traverse_repo(jobs, only_files=files_to_traverse)
+        logger.info(f"Analyze folder: {analyze_folder}")
+
+        if max_in_flight > 1:
+            # 2 and 3 at once: every file is summarized then commented, many LLM requests being sent concurrently
+            asyncio.run(traverser.analyze_and_comment_async(
+                analyze_folder, force_re_analyze, force_re_comment, only_files=files_to_process,
+                max_in_flight=max_in_flight, comment_batch_tokens=comment_batch_tokens,
+                structure_detail=structure_detail, section_dedup=section_dedup, max_prompt_tokens=max_prompt_tokens))
+        else:
+            # 2. Traverse and output the xxx.py.analyze.md file using LLM
+            traverser.analyze_repo(analyze_folder, force_re_analyze, only_files=files_to_process,
+                                   structure_detail=structure_detail, max_prompt_tokens=max_prompt_tokens)
 
-    # 2. Traverse and output the xxx.py.analyze.md file using LLM
-    traverser.analyze_repo(analyze_folder, force_re_analyze)
+            # 3. Analyze code section by section and output to xxx.py.comments.json
+            traverser.sectioned_comment(analyze_folder, force_re_comment, only_files=files_to_process,
+                                        comment_batch_tokens=comment_batch_tokens, section_dedup=section_dedup,
+                                        max_prompt_tokens=max_prompt_tokens)
 
-    # 3. Analyze code section by section and output to xxx.py.comments.json
-    traverser.sectioned_comment(analyze_folder, force_re_comment)
+    traverser.finish_job()
+    request_latencies.log_stats()
+    cassette = shared_cassette()
+    if cassette is not None:
+        # the providers do not use the response cache with a cassette
+        cassette.log_stats()
+        cassette.close()
+    else:
+        response_cache = shared_response_cache()
+        if response_cache is not None:
+            response_cache.log_stats()
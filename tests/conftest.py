@@ -0,0 +1,6 @@
+import os
+import tempfile
+
+# llm_project_helper reads its settings at import: the tests get a workspace of their own, without the response cache
+os.environ.setdefault("LLM_PROJECT_HELPER_PROJECT_ROOT", tempfile.mkdtemp(prefix="llm_project_helper_tests_"))
+os.environ.setdefault("LLM_PROJECT_HELPER_LLM_CACHE", "False")
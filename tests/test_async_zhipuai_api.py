@@ -0,0 +1,104 @@
+"""
+The retries of AsyncZhipuAIAPI after a 429, a 5xx or a timeout, against an httpx.MockTransport.
+"""
+import asyncio
+import json
+
+import httpx
+import jwt
+import pytest
+from zhipuai import APIRequestFailedError, APIServerFlowExceedError
+
+from llm_project_helper.provider import AsyncZhipuAIAPI
+
+COMPLETION = {
+    "id": "1", "created": 0, "model": "glm-4",
+    "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "answer"}}],
+    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+}
+STREAM = "".join(f"data: {json.dumps(chunk)}\n\n" for chunk in [
+    {"id": "1", "created": 0, "model": "glm-4", "choices": [{"index": 0, "delta": {"content": "ans"}}]},
+    {"id": "1", "created": 0, "model": "glm-4", "choices": [{"index": 0, "delta": {"content": "wer"},
+                                                            "finish_reason": "stop"}]},
+]) + "data: [DONE]\n\n"
+
+
+def scripted_api(responses, max_retries=3):
+    """
+    An AsyncZhipuAIAPI whose requests are answered by the given responses in order, an exception being raised instead
+    """
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    api = AsyncZhipuAIAPI(max_retries=max_retries, retry_backoff=0)
+    api.api_key = "key.secret"
+    api.response_cache = None
+    api.cassette = None
+    api.client = httpx.AsyncClient(base_url="http://stub/", transport=httpx.MockTransport(handler))
+    return api, requests
+
+
+def predict(api):
+    async def run():
+        async with api:
+            return (await api.predict("question")).content
+    return asyncio.run(run())
+
+
+def test_retries_after_a_429_a_5xx_and_a_timeout():
+    api, requests = scripted_api([
+        httpx.Response(429, json={"error": {"code": "1302"}}, headers={"Retry-After": "0"}),
+        httpx.Response(500, json={"error": {"code": "500"}}),
+        httpx.ReadTimeout("timed out"),
+        httpx.Response(200, json=COMPLETION),
+    ])
+    assert predict(api) == "answer"
+    assert len(requests) == 4
+
+
+def test_other_errors_are_not_retried():
+    api, requests = scripted_api([httpx.Response(400, json={"error": {"code": "1214"}})])
+    with pytest.raises(APIRequestFailedError):
+        predict(api)
+    assert len(requests) == 1
+
+
+def test_last_error_is_raised_once_the_retries_are_exhausted():
+    api, requests = scripted_api([httpx.Response(503, json={"error": {}})] * 3, max_retries=2)
+    with pytest.raises(APIServerFlowExceedError):
+        predict(api)
+    assert len(requests) == 3
+
+
+def test_stream_is_retried_before_its_first_chunk():
+    api, requests = scripted_api([
+        httpx.Response(429, json={"error": {"code": "1302"}}, headers={"Retry-After": "0"}),
+        httpx.Response(200, text=STREAM, headers={"Content-Type": "text/event-stream"}),
+    ])
+
+    async def run():
+        async with api:
+            return [item async for item in api.predict_stream("question")]
+    assert asyncio.run(run()) == [("ans", None), ("wer", None), ("", "stop")]
+    assert len(requests) == 2
+
+
+def test_retry_delay():
+    api = AsyncZhipuAIAPI(retry_backoff=1)
+    assert api.retry_delay(0, "2") == 2
+    assert 4 <= api.retry_delay(3) <= 8
+    assert api.retry_delay(10) == 30
+
+
+def test_token_is_signed_with_the_secret_and_reused():
+    api, requests = scripted_api([httpx.Response(200, json=COMPLETION)] * 2)
+    predict(api)
+    token = requests[0].headers["Authorization"]
+    assert jwt.decode(token, "secret", algorithms=["HS256"], options={"verify_exp": False})["api_key"] == "key"
+    assert api._token() == token
@@ -0,0 +1,76 @@
+"""
+The batched comments of CodeSectionAnalyzer: the parsing of a batched reply, and the batches of the sections.
+"""
+import re
+from types import SimpleNamespace
+
+from llm_project_helper.analyzer.code_section_analyzer import CodeSectionAnalyzer, parse_batch_remarks
+
+LINE_NO = re.compile(r"^### line_no: (\d+)$", re.MULTILINE)
+
+
+class ScriptedAPI:
+    """
+    A provider answering a batched prompt with a JSON object of a remark per line_no, and a single section with its
+    code, reversed
+    """
+
+    def __init__(self):
+        self.prompts = []
+
+    def predict(self, message, history=None):
+        self.prompts.append(message)
+        line_nos = LINE_NO.findall(message)
+        if line_nos:
+            content = "{" + ", ".join(f'"{line_no}": "remark {line_no}"' for line_no in line_nos) + "}"
+        else:
+            content = message[message.rindex("```\n", 0, len(message) - 4) + 4:].strip("`\n")[::-1]
+        return SimpleNamespace(content=content)
+
+
+def section(line_no, code):
+    return {"line_no": line_no, "remark": None, "fingerprint": None}, code, ""
+
+
+def test_parse_a_reply_of_valid_json():
+    reply = '好的：\n```json\n{"12": "第一段", " 30 ": "第二段\\n换行", "x": "no line_no", "40": "", "50": 1}\n```'
+    assert parse_batch_remarks(reply) == {12: "第一段", 30: "第二段\n换行"}
+
+
+def test_parse_a_truncated_reply_gives_its_complete_entries():
+    reply = '{"12": "第一段", "30": "带\\"引号\\"的第二段", "45": "被截断的第'
+    assert parse_batch_remarks(reply) == {12: "第一段", 30: '带"引号"的第二段'}
+
+
+def test_parse_a_malformed_reply():
+    assert parse_batch_remarks('{"12": "第一段",, "30": "第二段"}') == {12: "第一段", 30: "第二段"}
+    assert parse_batch_remarks("这段代码用于计算。") == {}
+    assert parse_batch_remarks("") == {}
+
+
+def test_sections_on_the_same_line_are_requested_alone():
+    analyzer = CodeSectionAnalyzer(ScriptedAPI(), batch_tokens=10000)
+    sections = [section(3, "void a() {}"), section(5, "void b() {}"), section(5, "void c() {}"),
+                section(8, "void d() {}")]
+    batches = analyzer.batch_sections(sections)
+    assert [[comment["line_no"] for comment, _, _ in batch] for batch in batches] == [[5], [5], [3, 8]]
+
+
+def test_every_section_gets_its_own_remark():
+    api = ScriptedAPI()
+    analyzer = CodeSectionAnalyzer(api, batch_tokens=10000)
+    sections = [section(3, "void a() {}"), section(5, "void b() {}"), section(5, "void c() {}"),
+                section(8, "void d() {}")]
+    for batch in analyzer.batch_sections(sections):
+        analyzer.comment_batch(batch)
+    assert [comment["remark"] for comment, _, _ in sections] == ["remark 3", "}{ )(b diov", "}{ )(c diov", "remark 8"]
+    assert len(api.prompts) == 3
+
+
+def test_sections_missing_from_a_reply_are_requested_alone():
+    analyzer = CodeSectionAnalyzer(ScriptedAPI(), batch_tokens=10000)
+    batch = [section(3, "void a() {}"), section(8, "void d() {}")]
+    missing = analyzer.apply_batch_reply(batch, '{"3": "remark 3", "8": ""}')
+    assert missing == [batch[1]]
+    assert batch[0][0]["remark"] == "remark 3"
+    assert (analyzer.batched_sections, analyzer.retried_sections) == (1, 1)
@@ -0,0 +1,129 @@
+"""
+The streamed summary of FileSummaryAnalyzer, on a scripted provider whose streams are cut at the stop text as the
+ZhipuAI ones are.
+"""
+import json
+
+from llm_project_helper.analyzer.file_summary_analyzer import EOS_token, FileSummaryAnalyzer, SummaryStream
+from llm_project_helper.analyzer.file_summary_analyzer import _names, uncovered_structure
+from llm_project_helper.provider.zhipuai_api import cut_at_stop
+
+STRUCTURE = {
+    "relative_path": "bench.py",
+    "imports": [{"import_identifier": "import os", "line_number": 1, "from_module": None}],
+    "classes": {},
+    "functions": {"run": {"name": "run", "line_number": 3, "end_line_number": 5}},
+    "interfaces": {},
+}
+
+
+class ScriptedAPI:
+    """
+    A provider that streams the given replies in order, a few characters at a time, cut at the stop text
+    """
+
+    def __init__(self, replies, chunk_size=5):
+        self.replies = list(replies)
+        self.chunk_size = chunk_size
+        self.prompts = []
+
+    def predict_stream(self, message, history=None, stop=None):
+        self.prompts.append(message)
+        reply = self.replies.pop(0)
+        partial_message = ""
+        for start in range(0, len(reply), self.chunk_size):
+            content, finish_reason = cut_at_stop(partial_message, reply[start:start + self.chunk_size], stop)
+            partial_message += content
+            yield content, None
+            if finish_reason is not None:
+                yield "", finish_reason
+                return
+        yield "", "length"
+
+
+def summarize(replies):
+    api = ScriptedAPI(replies)
+    analyzer = FileSummaryAnalyzer(api, detail="json")
+    return analyzer, api, analyzer.analyze_structure(json.dumps(STRUCTURE))
+
+
+def test_summary_stops_at_the_eos_token():
+    analyzer, api, summary = summarize(["## 综述\n概述\n## 总结\n结束。" + EOS_token + "\n多余的内容\n"])
+    assert summary == "## 综述\n概述\n## 总结\n结束。"
+    assert analyzer.complete and len(api.prompts) == 1
+
+
+def test_eos_token_ending_a_heading_does_not_cut_the_conclusion():
+    # the reply of a model following an example with the EOS token after the heading of the conclusion
+    first = "## 综述\n概述\n- `run`: 运行\n## 总结" + EOS_token + "\n综上所述，这是结论。" + EOS_token
+    analyzer, api, summary = summarize([first, "## 总结\n综上所述，这是结论。" + EOS_token])
+    assert summary == "## 综述\n概述\n- `run`: 运行\n## 总结\n综上所述，这是结论。"
+    assert analyzer.complete and len(api.prompts) == 2
+    assert EOS_token not in summary
+
+
+def test_names_match_whole_identifiers():
+    text = "- `get_all(self)`: 取全部\n- `_private`: 私有\n- `Outer.inner`"
+    assert _names(text, "get_all") and _names(text, "_private") and _names(text, "inner") and _names(text, "Outer")
+    # a prefix, a suffix or a part of an identifier of the text
+    assert not _names(text, "get") and not _names(text, "all") and not _names(text, "private")
+    assert not _names(text, "et_al") and not _names(text, "Out")
+    # the name is not a regular expression
+    assert not _names(text, "get.all") and _names("a `set$value`", "set$value") and not _names("set$value", "set")
+    # right next to chinese text
+    assert _names("使用json模块", "json") and not _names("使用jsonl模块", "json")
+
+
+def test_uncovered_structure_keeps_the_names_the_summary_only_has_as_a_part():
+    structure = {
+        "relative_path": "bench.py",
+        "imports": [{"import_identifier": "import os", "line_number": 1, "from_module": None},
+                    {"import_identifier": "import json", "line_number": 2, "from_module": None}],
+        "global_variables": {"LIMIT": 1},
+        "classes": {
+            "Store": {"name": "Store", "line_number": 4, "constructors": {},
+                      "methods": {name: {"name": name, "line_number": 5} for name in ("get", "get_all", "put")}},
+            "StoreCache": {"name": "StoreCache", "line_number": 20, "constructors": {}, "methods": {}},
+        },
+        "functions": {name: {"name": name, "line_number": 30} for name in ("run", "run_all")},
+        "interfaces": {},
+    }
+    summary = "使用json。\n### 类Store：\n- `get_all`: 取全部\n- `put`: 存\n- `run_all`: 全部运行\n"
+    uncovered = uncovered_structure(structure, summary)
+    assert [node["import_identifier"] for node in uncovered["imports"]] == ["import os"]
+    assert list(uncovered["classes"]) == ["Store", "StoreCache"]
+    assert list(uncovered["classes"]["Store"]["methods"]) == ["get"]
+    assert list(uncovered["functions"]) == ["run"]
+    assert "global_variables" not in uncovered
+
+
+def stream(replies, chunk_size=3):
+    """
+    The text of a SummaryStream fed with the (reply, complete) in chunks of chunk_size characters
+    """
+    summary = SummaryStream()
+    for reply, complete in replies:
+        for start in range(0, len(reply), chunk_size):
+            summary.add(reply[start:start + chunk_size])
+        summary.end_reply(complete)
+    return summary.text
+
+
+def test_overlap_of_a_reply_truncated_in_the_middle_of_a_name():
+    first = "## 综述\n概述\n### 类Store：\n- `get_all`: 取全部\n- `put`: 存\n- `get_fir"
+    second = "### 类Store：\n\n- `get_all`: 取全部\n- `put`: 存\n- `get_first`: 取第一个\n## 总结\n结束" + EOS_token
+    assert stream([(first, False), (second, True)]) == (
+        "## 综述\n概述\n### 类Store：\n- `get_all`: 取全部\n- `put`: 存\n- `get_first`: 取第一个\n## 总结\n结束")
+
+
+def test_overlap_stops_at_the_first_new_line():
+    first = "## 综述\n概述\n- `get_all`: 取全部\n- `run`: 运行\n- `ge"
+    # a line of the end of the summary after a new one is not skipped, nor a line that is only a part of one of them
+    second = "- `run`: 运行\n- `get`: 取\n- `run`: 运行\n- `get_all`\n## 总结\n结束" + EOS_token
+    assert stream([(first, False), (second, True)], chunk_size=2) == (
+        "## 综述\n概述\n- `get_all`: 取全部\n- `run`: 运行\n- `get`: 取\n- `run`: 运行\n- `get_all`\n## 总结\n结束")
+
+
+def test_eos_token_split_between_chunks_is_removed():
+    for chunk_size in (1, 4, 7):
+        assert stream([("## 综述\n概述\n## 总结\n结束" + EOS_token, True)], chunk_size) == "## 综述\n概述\n## 总结\n结束"
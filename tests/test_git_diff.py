@@ -0,0 +1,96 @@
+"""
+get_changed_files on a temporary git repository, and the files GitChangeSet gives to process and traverse.
+"""
+import os
+import subprocess
+
+import pytest
+
+from llm_project_helper.git_diff import GitChangeSet, get_changed_files
+
+
+def source(path):
+    # different enough from the one of another path for git not to take the one for a rename of the other
+    name = "".join(c if c.isalnum() else "_" for c in path)
+    return "".join(f"def {name}_{i}(a, b):\n    return a + b * {i}\n\n\n" for i in range(20))
+
+
+def git(repo, *args):
+    subprocess.run(["git", "-C", str(repo), "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+                   check=True, capture_output=True)
+
+
+def write(repo, path, content):
+    file_path = os.path.join(repo, path)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, 'w') as f:
+        f.write(content)
+
+
+@pytest.fixture
+def repo(tmp_path):
+    git(tmp_path, "init", "-q")
+    for path in ("kept.py", "modified.py", "deleted.py", "old name.py", "old_edited.py", "pkg/inner.py",
+                 "pkg/moved.py"):
+        write(tmp_path, path, source(path))
+    git(tmp_path, "add", "-A")
+    git(tmp_path, "commit", "-q", "-m", "base")
+    return tmp_path
+
+
+def test_name_status_of_every_kind_of_change(repo):
+    write(repo, "modified.py", source("modified.py") + "# changed\n")
+    os.remove(os.path.join(repo, "deleted.py"))
+    git(repo, "mv", "old name.py", "new näme.py")
+    git(repo, "mv", "old_edited.py", "new_edited.py")
+    write(repo, "new_edited.py", source("old_edited.py") + "# changed\n")
+    git(repo, "add", "new_edited.py")
+    write(repo, "added staged.py", "x = 1\n")
+    git(repo, "add", "added staged.py")
+    write(repo, "untracked dir/untracked file.py", "y = 2\n")
+
+    changes = get_changed_files(str(repo), "HEAD")
+
+    assert sorted(changes.added) == ["added staged.py", os.path.join("untracked dir", "untracked file.py")]
+    assert changes.modified == ["modified.py"]
+    assert changes.deleted == ["deleted.py"]
+    renamed = {old_path: (new_path, similarity) for old_path, new_path, similarity in changes.renamed}
+    assert renamed["old name.py"] == ("new näme.py", 100)
+    assert renamed["old_edited.py"][0] == "new_edited.py"
+    assert renamed["old_edited.py"][1] < 100
+
+
+def test_paths_are_relative_to_a_sub_folder(repo):
+    write(repo, "pkg/inner.py", source("pkg/inner.py") + "# changed\n")
+    write(repo, "modified.py", source("modified.py") + "# changed outside of pkg\n")
+    os.makedirs(os.path.join(repo, "pkg", "sub"))
+    git(repo, "mv", "pkg/moved.py", "pkg/sub/moved.py")
+    write(repo, "pkg/untracked.py", "z = 3\n")
+
+    changes = get_changed_files(os.path.join(repo, "pkg"), "HEAD")
+
+    assert changes.modified == ["inner.py"]
+    assert changes.renamed == [("moved.py", os.path.join("sub", "moved.py"), 100)]
+    assert changes.added == ["untracked.py"]
+    assert changes.deleted == []
+
+
+def test_no_changes(repo):
+    changes = get_changed_files(str(repo), "HEAD")
+    assert (changes.added, changes.modified, changes.renamed, changes.deleted) == ([], [], [], [])
+
+
+def test_invalid_revision(repo):
+    with pytest.raises(subprocess.CalledProcessError):
+        get_changed_files(str(repo), "no-such-revision")
+
+
+def test_files_to_process_and_traverse():
+    changes = GitChangeSet()
+    changes.added = ["added.py"]
+    changes.modified = ["modified.py"]
+    changes.renamed = [("a.py", "b.py", 100), ("c.py", "d.py", 100), ("e.py", "f.py", 80)]
+    changes.carried_over = {"b.py"}
+    # d.py had no outputs to carry over, f.py changed
+    assert changes.files_to_process() == ["added.py", "modified.py", "d.py", "f.py"]
+    assert changes.files_to_traverse() == ["added.py", "modified.py", "d.py", "f.py", "b.py"]
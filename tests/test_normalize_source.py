@@ -0,0 +1,55 @@
+"""
+normalize_source, and the fingerprints of the sections built on it.
+"""
+from llm_project_helper.const import Language
+from llm_project_helper.utils import normalize_source, section_fingerprint
+
+JAVA_METHOD = """
+    /**
+     * The price of the order.
+     */
+    public double price(double base,
+                        double rate) {
+        // the product of the base and the rate
+        return base
+            * rate;
+    }
+"""
+
+
+def test_java_comments_are_removed():
+    assert normalize_source(JAVA_METHOD, Language.JAVA) == (
+        "public double price(double base,\n"
+        "                    double rate) {\n"
+        "    return base\n"
+        "        * rate;\n"
+        "}")
+
+
+def test_java_code_after_a_comment_on_its_line_is_kept():
+    code = "void run() {\n    /* c */ foo();\n}"
+    assert normalize_source(code, Language.JAVA) == "void run() {\n    foo();\n}"
+    assert section_fingerprint(code, Language.JAVA) != section_fingerprint(code.replace("foo", "bar"), Language.JAVA)
+
+
+def test_java_block_comment_opening_partway_through_a_line_is_tracked():
+    code = "void run() {\n    foo(); /* the first line\n    bar();\n    of the comment */ baz();\n}"
+    assert normalize_source(code, Language.JAVA) == "void run() {\n    foo();\n    baz();\n}"
+    assert section_fingerprint(code, Language.JAVA) == section_fingerprint(
+        code.replace("bar();", "qux();"), Language.JAVA)
+
+
+def test_java_comment_markers_in_literals_are_code():
+    code = 'String s = "/* not a comment */ // nor this"; char c = \'/\'; // a comment'
+    assert normalize_source(code, Language.JAVA) == 'String s = "/* not a comment */ // nor this"; char c = \'/\';'
+
+
+def test_java_formatting_and_comments_do_not_change_the_fingerprint():
+    commented = "void run() {\n    /* before */ foo(); // after\n\n}  "
+    assert section_fingerprint(commented, Language.JAVA) == section_fingerprint(
+        "void run() {\n    foo();\n}", Language.JAVA)
+
+
+def test_python_comment_lines_are_removed():
+    code = "    def run(self):\n        # a comment\n\n        return 1  # kept\n"
+    assert normalize_source(code, Language.PYTHON) == "def run(self):\n    return 1  # kept"
@@ -0,0 +1,38 @@
+"""
+The single pass cursor engine of TreesitterPython has to write the same structure json as the query engine.
+"""
+import argparse
+import asyncio.tasks
+import dataclasses
+import json
+import json.decoder
+
+import pytest
+
+from benchmarks.synthetic import synthetic_python_source
+from llm_project_helper.treesitter import TreesitterPython
+
+SYNTHETIC_SOURCES = {
+    "synthetic 10k lines, classes": synthetic_python_source(classes=45, methods_per_class=22, functions=10),
+    "synthetic 10k lines, functions": synthetic_python_source(classes=2, methods_per_class=10, functions=1200),
+}
+STDLIB_MODULES = [argparse, asyncio.tasks, dataclasses, json.decoder]
+
+
+def structure_json(code):
+    file_bytes = code.encode()
+    return tuple(json.dumps(TreesitterPython(engine=engine).parse(file_bytes).model_dump(), indent=4, default=str)
+                 for engine in ("query", "cursor"))
+
+
+@pytest.mark.parametrize("name", list(SYNTHETIC_SOURCES))
+def test_synthetic_source(name):
+    query_json, cursor_json = structure_json(SYNTHETIC_SOURCES[name])
+    assert cursor_json == query_json
+
+
+@pytest.mark.parametrize("module", STDLIB_MODULES, ids=lambda module: module.__name__)
+def test_stdlib_module(module):
+    with open(module.__file__, 'r') as f:
+        query_json, cursor_json = structure_json(f.read())
+    assert cursor_json == query_json